@@ -23,7 +23,7 @@ import jsonpickle
 import jsonpickle.ext.numpy as jsonpickle_numpy
 import jsonpickle.ext.pandas as jsonpickle_pandas
 from jsonmerge import merge as jmerge
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 from typing_extensions import Self
 
 from datamodel.data.changes import ChangeTracker
@@ -82,6 +82,8 @@ def custom_json_decoder(obj: Dict[str, Any]) -> Any:
 
 def custom_loads_json(__obj: Union[bytes, bytearray, memoryview, str]) -> Any:
     """Custom JSON decoder for data objects."""
+    if isinstance(__obj, memoryview):
+        __obj = __obj.tobytes()
     return json.loads(__obj, object_hook=custom_json_decoder)
 
 
@@ -125,9 +127,8 @@ class Data(BaseModel):
     model_json_dumps = custom_dumps_json
     model_json_loads = custom_loads_json
 
-    def __init__(self, *args, **data: Any) -> None:
-        super().__init__(*args, **data)
-        self._changes: ChangeTracker = ChangeTracker()
+    # Private so it survives validated assignment instead of moving into the extra fields
+    _changes: ChangeTracker = PrivateAttr(default_factory=ChangeTracker)
 
     @classmethod
     def merge(cls, old: "Data", new: "Data", schema: Optional["Data"] = None) -> Tuple["Data", "Data"]:
@@ -320,7 +321,9 @@ class Data(BaseModel):
 
     @classmethod
     def from_raw(cls, __obj: Union[bytes, bytearray, memoryview, str]) -> Self:
-        """Construct a data object from a raw JSON string or binary data."""
+        """Construct a data object from a raw JSON string or binary data, including buffers like 'mmap' views."""
+        if isinstance(__obj, memoryview):
+            __obj = __obj.tobytes()
         return cls.model_validate_json(__obj)
 
     def build(self) -> "Data":
@@ -2,6 +2,10 @@
 Custom datetime class for use with data object serialization.
 """
 from datetime import datetime, timedelta
+from typing import Any
+
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import CoreSchema, core_schema
 
 
 class DateTime(datetime):
@@ -12,6 +16,22 @@ class DateTime(datetime):
     def from_data(cls, value):
         return datetime.fromisoformat(value)
 
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler) -> CoreSchema:
+        # Validated from instances and from the ISO strings they are serialized to in JSON
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(datetime.isoformat, when_used="json"),
+        )
+
+    @classmethod
+    def _validate(cls, value: Any) -> datetime:
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, str):
+            return cls.fromisoformat(value)
+        raise ValueError(f"Cannot read a date and time from {type(value).__name__}")
+
 
 class TimeDelta(timedelta):
     def to_data(self):
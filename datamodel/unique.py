@@ -1,9 +1,12 @@
 """
 Custom UUID data type
 """
-from typing import Optional
+from typing import Any, Optional
 from uuid import UUID, uuid4
 
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import CoreSchema, core_schema
+
 
 class UniqueID(UUID):
     def __init__(self, value: Optional[str] = None):
@@ -25,3 +28,19 @@ class UniqueID(UUID):
     @classmethod
     def random(cls):
         return cls(uuid4().hex)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler) -> CoreSchema:
+        # Validated from instances and from the strings they are serialized to in JSON
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(cls.to_data, when_used="json"),
+        )
+
+    @classmethod
+    def _validate(cls, value: Any) -> "UniqueID":
+        if isinstance(value, UniqueID):
+            return value
+        if isinstance(value, (UUID, str)):
+            return cls(str(value))
+        raise ValueError(f"Cannot read a unique ID from {type(value).__name__}")
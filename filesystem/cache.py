@@ -0,0 +1,93 @@
+"""Caches for the mounted filesystem, bounded by evicting the least recently used entries."""
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Generic, Hashable, Optional, Set, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Entries expire a fixed number of seconds after they were put.
+    """
+
+    def __init__(self, ttl: float, size: int):
+        self.ttl: float = ttl
+        self.size: int = size
+        self.entries: OrderedDict[str, Tuple[float, V]] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: str) -> Optional[V]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: V) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class PageCache:
+    """
+    Fixed size blocks of files by path and block index, tagged with the version of the file they were read from.
+    Blocks of another version are never returned, and are dropped once a block of another version is put.
+    """
+
+    def __init__(self, block_size: int, blocks: int):
+        self.block_size: int = block_size
+        self.capacity: int = blocks
+        self.blocks: OrderedDict[Tuple[str, int], bytes] = OrderedDict()
+        # Version and cached block indices of every path with cached blocks
+        self.paths: Dict[str, Tuple[Hashable, Set[int]]] = {}
+        self.lock = Lock()
+
+    def get(self, path: str, version: Hashable, index: int) -> Optional[bytes]:
+        with self.lock:
+            cached = self.paths.get(path)
+            if cached is None or cached[0] != version:
+                return None
+            block = self.blocks.get((path, index))
+            if block is not None:
+                self.blocks.move_to_end((path, index))
+            return block
+
+    def put(self, path: str, version: Hashable, index: int, block: bytes) -> None:
+        with self.lock:
+            cached = self.paths.get(path)
+            if cached is not None and cached[0] != version:
+                self._drop(path)
+                cached = None
+            if cached is None:
+                cached = self.paths[path] = (version, set())
+            cached[1].add(index)
+            self.blocks[(path, index)] = block
+            self.blocks.move_to_end((path, index))
+            while len(self.blocks) > self.capacity:
+                (evicted, evicted_index), _ = self.blocks.popitem(last=False)
+                indices = self.paths[evicted][1]
+                indices.discard(evicted_index)
+                if not indices:
+                    del self.paths[evicted]
+
+    def drop(self, path: str) -> None:
+        with self.lock:
+            self._drop(path)
+
+    def _drop(self, path: str) -> None:
+        _, indices = self.paths.pop(path, (None, ()))
+        for index in indices:
+            del self.blocks[(path, index)]
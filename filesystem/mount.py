@@ -1,18 +1,394 @@
 """Mount a StorageClient as a filesystem."""
-from fuse import FUSE, LoggingMixIn, Operations
+import errno
+import os
+import stat
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import count
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
 
+from fuse import FuseOSError, LoggingMixIn, Operations
+
+from filesystem.cache import PageCache, TTLCache
 from storage.client.local import LocalClient
-from storage.interface.client import StorageClientInterface
+from storage.interface.client import MISSING, StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE
+from storage.models.object.models import Object
 from storage.models.object.path import StorageKey, StoragePath
 
+# Bytes per cached block, reads fetch whole blocks
+BLOCK_SIZE: int = 128 * 1024
+
+# Blocks held by the page cache
+CACHE_BLOCKS: int = 2048
+
+# Most blocks read ahead of a sequential reader, the window doubles with every sequential read up to it
+READAHEAD_BLOCKS: int = 32
+
+# Seconds attributes and directory listings are trusted without asking the storage
+ATTR_TTL: float = 1.0
+ENTRY_TTL: float = 1.0
+
+# Paths held by the attribute and directory caches
+ENTRY_CACHE_SIZE: int = 65536
+
+# Write buffers larger than this spill to a temporary file
+SPOOL_BYTES: int = 16 * 1024 * 1024
+
+
+class OpenFile:
+    """
+    An open file handle, with the writes buffered since it was last stored and the position of sequential reads.
+    """
+
+    def __init__(self, path: str, key: StorageKey, size: int, version: Hashable):
+        self.path: str = path
+        self.key: StorageKey = key
+        self.size: int = size
+        self.version: Hashable = version
+        # Whole contents of the file once written to, stored on flush
+        self.buffer: Optional[SpooledTemporaryFile] = None
+        self.dirty: bool = False
+        self.position: int = 0
+        self.window: int = 0
+        self.lock = Lock()
+
 
 class StorageOperations(LoggingMixIn, Operations):
-    def __init__(self, storage: StorageClientInterface):
+    """
+    Reads are served from a page cache of fixed size blocks, fetched with ranged gets and read ahead of sequential
+    readers. Writes are buffered per open file and stored as one object on flush or release. Attributes and
+    directory listings are cached for a short time, files are revalidated when opened.
+    """
+
+    def __init__(
+        self,
+        storage: StorageClientInterface,
+        block_size: int = BLOCK_SIZE,
+        cache_blocks: int = CACHE_BLOCKS,
+        readahead: int = READAHEAD_BLOCKS,
+        attr_ttl: float = ATTR_TTL,
+        entry_ttl: float = ENTRY_TTL,
+    ):
         self.storage: StorageClientInterface = storage
         self.root = StorageKey(storage=self.storage.name, path=StoragePath(path="filesystem/"))
+        self.reserved: Set[str] = {str(path) for path in storage.RESERVED}
+        self.pages = PageCache(block_size, cache_blocks)
+        self.readahead: int = readahead
+        self.attributes: TTLCache[Dict[str, Any]] = TTLCache(attr_ttl, ENTRY_CACHE_SIZE)
+        self.entries: TTLCache[List[str]] = TTLCache(entry_ttl, ENTRY_CACHE_SIZE)
+        # Directories made through the mount, object storage has no empty directories
+        self.folders: Set[str] = {"/"}
+        self.handles: Dict[int, OpenFile] = {}
+        self.handle_ids = count(1)
+        # Ranged gets in progress by path and block, so a block is fetched once however many readers want it
+        self.fetching: Dict[Tuple[str, int], Future] = {}
+        self.lock = Lock()
+        self.prefetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"{self.__class__.__name__}-readahead")
+
+    @property
+    def block_size(self) -> int:
+        return self.pages.block_size
+
+    def _key(self, path: str) -> StorageKey:
+        return self.root.join(path.lstrip("/"))
+
+    @staticmethod
+    def _timestamp(value: datetime) -> float:
+        # Stored times are naive UTC
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+    @staticmethod
+    def _folder() -> Dict[str, Any]:
+        return {"st_mode": stat.S_IFDIR | 0o755, "st_nlink": 2, "st_uid": os.getuid(), "st_gid": os.getgid()}
+
+    def _file(self, obj: Object) -> Dict[str, Any]:
+        access = obj.metadata.access
+        return {
+            "st_mode": stat.S_IFREG | 0o644,
+            "st_nlink": 1,
+            "st_size": int(obj.item.content.size.raw_bytes),
+            "st_mtime": self._timestamp(access.modified),
+            "st_ctime": self._timestamp(access.created),
+            "st_atime": self._timestamp(access.accessed),
+            "st_uid": os.getuid(),
+            "st_gid": os.getgid(),
+        }
+
+    def _lookup(self, path: str) -> Dict[str, Any]:
+        if path in self.folders:
+            return self._folder()
+        parent, name = os.path.split(path)
+        # A cached listing of the parent answers for missing names without asking the storage
+        names = self.entries.get(parent)
+        if names is not None and name not in names:
+            raise FuseOSError(errno.ENOENT)
+        key = self._key(path)
+        try:
+            obj = self.storage.stat(key)
+        except MISSING:
+            # Folders have no object of their own, they exist by listing something
+            obj = None
+        if obj is not None and obj.is_file():
+            return self._file(obj)
+        if self.storage.list(key):
+            return self._folder()
+        raise FuseOSError(errno.ENOENT)
+
+    def _writer(self, path: str) -> Optional[OpenFile]:
+        with self.lock:
+            handles = list(self.handles.values())
+        return next((handle for handle in reversed(handles) if handle.path == path and handle.dirty), None)
+
+    def getattr(self, path: str, fh: Optional[int] = None) -> Dict[str, Any]:
+        # Files being written have the size of their buffer, before it is stored
+        writer = self._writer(path)
+        if writer is not None:
+            now = datetime.now(timezone.utc).timestamp()
+            return {
+                "st_mode": stat.S_IFREG | 0o644,
+                "st_nlink": 1,
+                "st_size": writer.size,
+                "st_mtime": now,
+                "st_ctime": now,
+                "st_atime": now,
+                "st_uid": os.getuid(),
+                "st_gid": os.getgid(),
+            }
+        attributes = self.attributes.get(path)
+        if attributes is None:
+            attributes = self._lookup(path)
+            self.attributes.put(path, attributes)
+        return attributes
+
+    def _names(self, path: str) -> List[str]:
+        names = self.entries.get(path)
+        if names is None:
+            keys = self.storage.list(self._key(path))
+            names = [key.path.name for key in keys if key.path.name not in self.reserved]
+            self.entries.put(path, names)
+        return names
+
+    def readdir(self, path: str, fh: int) -> List[str]:
+        names = set(self._names(path))
+        # Directories and files made through the mount before the storage lists them
+        with self.lock:
+            pending = [handle.path for handle in self.handles.values() if handle.dirty]
+        names.update(os.path.basename(item) for item in [*self.folders, *pending] if os.path.dirname(item) == path)
+        names.discard("")
+        return [".", "..", *sorted(names)]
+
+    def _open(self, path: str, truncate: bool = False) -> int:
+        if truncate:
+            handle = OpenFile(path, self._key(path), 0, None)
+            handle.buffer = SpooledTemporaryFile(max_size=SPOOL_BYTES)
+            handle.dirty = True
+        else:
+            # Close to open consistency, changes stored elsewhere are seen by the next open
+            self.attributes.pop(path)
+            attributes = self.getattr(path)
+            if stat.S_ISDIR(attributes["st_mode"]):
+                raise FuseOSError(errno.EISDIR)
+            version = (attributes["st_size"], attributes.get("st_mtime"))
+            handle = OpenFile(path, self._key(path), attributes["st_size"], version)
+        with self.lock:
+            fh = next(self.handle_ids)
+            self.handles[fh] = handle
+        return fh
+
+    def open(self, path: str, flags: int) -> int:
+        return self._open(path, truncate=bool(flags & os.O_TRUNC))
+
+    def create(self, path: str, mode: int, fi: Any = None) -> int:
+        return self._open(path, truncate=True)
+
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        handle = self.handles[fh]
+        with handle.lock:
+            if handle.buffer is not None:
+                handle.buffer.seek(offset)
+                return handle.buffer.read(size)
+            sequential = offset == handle.position
+            handle.window = min(max(handle.window * 2, 1), self.readahead) if sequential else 0
+            handle.position = offset + size
+            window = handle.window
+        end = min(offset + size, handle.size)
+        if offset >= end:
+            return b""
+        first, last = offset // self.block_size, (end - 1) // self.block_size
+        pending = self._load(handle, first, last)
+        if window:
+            self._load(handle, last + 1, last + window, background=True)
+        try:
+            data = b"".join(pending[index].result()[index] for index in range(first, last + 1))
+        except KeyError as e:
+            raise FuseOSError(errno.ENOENT) from e
+        start = offset - first * self.block_size
+        stop = start + end - offset
+        return data[start:stop]
+
+    def _load(self, handle: OpenFile, first: int, last: int, background: bool = False) -> Dict[int, Future]:
+        """
+        Blocks of a file by index as futures, fetching those neither cached nor being fetched with one ranged get
+        per run of consecutive blocks.
+        """
+        last = min(last, (handle.size - 1) // self.block_size)
+        blocks: Dict[int, Future] = {}
+        runs: List[Tuple[int, int, Future]] = []
+        with self.lock:
+            for index in range(first, last + 1):
+                block = self.pages.get(handle.path, handle.version, index)
+                if block is not None:
+                    blocks[index] = Future()
+                    blocks[index].set_result({index: block})
+                    continue
+                future = self.fetching.get((handle.path, index))
+                if future is None:
+                    if runs and runs[-1][1] == index - 1:
+                        runs[-1] = (runs[-1][0], index, runs[-1][2])
+                    else:
+                        runs.append((index, index, Future()))
+                    future = runs[-1][2]
+                    self.fetching[(handle.path, index)] = future
+                blocks[index] = future
+        for start, stop, future in runs:
+            if background:
+                self.prefetcher.submit(self._fetch, handle, start, stop, future)
+            else:
+                self._fetch(handle, start, stop, future)
+        return blocks
+
+    def _fetch(self, handle: OpenFile, first: int, last: int, future: Future) -> None:
+        try:
+            offset = first * self.block_size
+            data = self.storage.get(handle.key, offset, (last - first + 1) * self.block_size)
+            blocks = {}
+            for index in range(first, last + 1):
+                start = (index - first) * self.block_size
+                stop = start + self.block_size
+                blocks[index] = bytes(data[start:stop])
+                self.pages.put(handle.path, handle.version, index, blocks[index])
+            future.set_result(blocks)
+        except Exception as e:  # pylint: disable=broad-except
+            # Raised to every reader waiting for these blocks
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                for index in range(first, last + 1):
+                    self.fetching.pop((handle.path, index), None)
+
+    def _buffer(self, handle: OpenFile) -> SpooledTemporaryFile:
+        # Caller holds the handle lock, the first write loads the current contents
+        if handle.buffer is None:
+            buffer = SpooledTemporaryFile(max_size=SPOOL_BYTES)
+            if handle.size:
+                for chunk in self.storage.get_stream(handle.key):
+                    buffer.write(chunk)
+            handle.buffer = buffer
+        return handle.buffer
+
+    def write(self, path: str, data: bytes, offset: int, fh: int) -> int:
+        handle = self.handles[fh]
+        with handle.lock:
+            buffer = self._buffer(handle)
+            buffer.seek(offset)
+            buffer.write(data)
+            handle.size = max(handle.size, offset + len(data))
+            handle.dirty = True
+        return len(data)
+
+    def truncate(self, path: str, length: int, fh: Optional[int] = None) -> None:
+        opened = fh is None
+        if opened:
+            fh = self._open(path, truncate=length == 0)
+        handle = self.handles[fh]
+        with handle.lock:
+            buffer = self._buffer(handle)
+            if length > handle.size:
+                buffer.seek(handle.size)
+                buffer.write(bytes(length - handle.size))
+            else:
+                buffer.truncate(length)
+            handle.size = length
+            handle.dirty = True
+        if opened:
+            self.release(path, fh)
+
+    def _store(self, handle: OpenFile) -> None:
+        with handle.lock:
+            if not handle.dirty:
+                return
+            buffer = handle.buffer
+            buffer.seek(0)
+            obj, stream = Object.create_stream(handle.key, iter(lambda: buffer.read(CHUNK_SIZE), b""))
+            try:
+                self.storage.put_stream(obj, stream)
+            except Exception as e:
+                # Kept dirty, the next flush stores it again
+                raise FuseOSError(errno.EIO) from e
+            handle.dirty = False
+        self.pages.drop(handle.path)
+        self._invalidate(handle.path)
+
+    def _invalidate(self, path: str) -> None:
+        # Listings of every ancestor change, directories exist by containing something
+        self.attributes.pop(path)
+        while path != "/":
+            path = os.path.dirname(path)
+            self.entries.pop(path)
+            self.attributes.pop(path)
+
+    def flush(self, path: str, fh: int) -> None:
+        self._store(self.handles[fh])
+
+    def fsync(self, path: str, datasync: int, fh: int) -> None:
+        self._store(self.handles[fh])
+
+    def release(self, path: str, fh: int) -> None:
+        handle = self.handles[fh]
+        try:
+            self._store(handle)
+        finally:
+            with self.lock:
+                del self.handles[fh]
+            if handle.buffer is not None:
+                handle.buffer.close()
+
+    def unlink(self, path: str) -> None:
+        try:
+            self.storage.remove(self._key(path))
+        except MISSING as e:
+            raise FuseOSError(errno.ENOENT) from e
+        self.pages.drop(path)
+        self._invalidate(path)
+
+    def mkdir(self, path: str, mode: int) -> None:
+        with self.lock:
+            self.folders.add(path)
+        self._invalidate(path)
+
+    def rmdir(self, path: str) -> None:
+        if self.readdir(path, 0)[2:]:
+            raise FuseOSError(errno.ENOTEMPTY)
+        self._invalidate(path)
+        parent, name = os.path.split(path)
+        # Storage that keeps directories, such as local disk, still lists it once emptied
+        if name in self._names(parent):
+            try:
+                self.storage.remove(self._key(path))
+            except MISSING:
+                pass
+        with self.lock:
+            self.folders.discard(path)
+        self._invalidate(path)
 
 
 if __name__ == "__main__":
+    # Only mounting needs libfuse itself
+    from fuse import FUSE
+
     local_client = LocalClient(StoragePath(path="./local_data"))
     operations = StorageOperations(local_client)
     fuse = FUSE(operations, "/tmp/vint")
@@ -1,7 +1,7 @@
 """
 Data repository implementation.
 """
-from typing import List
+from typing import Generator, List, Tuple
 
 from datamodel.data.model import Data
 from repository.superclass import BaseRepository
@@ -15,7 +15,8 @@ class DataRepository(BaseRepository[str, Data]):
 
     def __setitem__(self, name: str, entity: Data) -> None:
         key = self.root.join(name)
-        obj, data = Object.create_file(key, entity.to_json().encode())
+        # Records are internal, skip hashing and MIME sniffing on every write
+        obj, data = Object.create_file(key, entity.to_json().encode(), fingerprint=False)
         if name in self:
             self.storage.remove(key)
         self.storage.put(obj, data)
@@ -23,6 +24,17 @@ class DataRepository(BaseRepository[str, Data]):
     def __delitem__(self, name: str) -> None:
         self.storage.remove(self.root.join(name))
 
+    # Records are fetched as one batch rather than a round trip per key
+    def values(self) -> Generator[Data, None, None]:
+        for _, value in self.items():
+            yield value
+
+    def items(self) -> Generator[Tuple[str, Data], None, None]:
+        names = self.keys()
+        raws = self.storage.get_many([self.root.join(name) for name in names])
+        for name, raw in zip(names, raws.values()):
+            yield name, Data.from_raw(raw)
+
     def keys(self) -> List[str]:
         items = self.storage.list(self.root)
         names = [item.path.name for item in items if item.path not in self.storage.RESERVED]
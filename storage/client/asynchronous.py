@@ -0,0 +1,42 @@
+"""Asynchronous storage clients."""
+from typing import Any, Callable, Optional, TypeVar
+
+from storage.client.local import LocalClient
+from storage.client.memory import MemoryClient
+from storage.client.s3 import S3Client
+from storage.models.object.path import StoragePath
+from storage.superclass.asynchronous import AsyncBaseStorageClient
+
+T = TypeVar("T")
+
+
+# No asynchronous filesystem driver, blocking calls are offloaded to the executor
+class AsyncLocalClient(AsyncBaseStorageClient):
+    def __init__(self, root: StoragePath, *args, workers: int = 32, **kwargs) -> None:
+        super().__init__(LocalClient(root, *args, **kwargs), workers=workers)
+
+
+# Nothing blocks on I/O, operations run directly on the event loop
+class AsyncMemoryClient(AsyncBaseStorageClient):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(MemoryClient(**kwargs), workers=1)
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        return func(*args)
+
+
+# No asynchronous driver for MinIO, blocking calls are offloaded to the executor
+class AsyncS3Client(AsyncBaseStorageClient):
+    def __init__(
+        self,
+        bucket: str,
+        endpoint: str,
+        access_key: str,
+        secret_key: str,
+        secure: bool,
+        region: Optional[str] = None,
+        workers: int = 32,
+        **kwargs,
+    ) -> None:
+        client = S3Client(bucket, endpoint, access_key, secret_key, secure, region, **kwargs)
+        super().__init__(client, workers=workers)
@@ -1,24 +1,125 @@
 """Local storage client."""
+import mmap
+import os
 import shutil
+import time
+from collections import defaultdict
 from pathlib import Path
+from stat import S_ISDIR
+from threading import Event, Lock, Thread
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ByteSize
 
 from storage.models.client.medium import Medium
-from storage.models.object.file.data import FileData
-from storage.models.object.models import Object
+from storage.models.header.models import Header, HeaderEntry, HeaderOperation
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
+from storage.models.object.file.info import ObjectInfo, SizeInfo, TypeSignature
+from storage.models.object.metadata import Metadata
+from storage.models.object.models import File, Object
 from storage.models.object.path import StorageKey, StoragePath
-from storage.superclass.client import BaseStorageClient
+from storage.superclass.client import HEADER, BaseStorageClient
+from storage.superclass.inotify import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_DELETE,
+    IN_IGNORED,
+    IN_ISDIR,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    IN_ONLYDIR,
+    IN_Q_OVERFLOW,
+    Inotify,
+    InotifyEvent,
+)
+from storage.superclass.journal import Journal
+
+JOURNAL = "._head.log"
+ROTATED = ".1"
+TEMPORARY = HEADER + ".tmp"
+
+# Journal size at which it is folded into the header snapshot in the background
+COMPACT_BYTES: int = 256 * 1024
+
+# Seconds without events after which changed files are reconciled, and the longest a change waits during a burst
+DEBOUNCE: float = 0.5
+MAX_DELAY: float = 5.0
+
+# Seconds between scans of the root where inotify is unavailable
+POLL_INTERVAL: float = 30.0
+
+WATCH_MASK: int = IN_CREATE | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+Signature = Tuple[int, int]
 
 
 # Passthrough permission changes to local filesystem using 'facls'
 class LocalClient(BaseStorageClient):
-    def __init__(self, root: StoragePath, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
+    """
+    Directory headers are a snapshot in '._head.json' plus an append-only journal of changes in '._head.log',
+    so a put or remove costs one append. Journals are compacted into the snapshot once they grow large.
+    """
+
+    RESERVED = BaseStorageClient.RESERVED + [
+        StoragePath(path=HEADER),
+        StoragePath(path=JOURNAL),
+        StoragePath(path=JOURNAL + ROTATED),
+    ]
+
+    def __init__(
+        self,
+        root: StoragePath,
+        *args,
+        watch: bool = False,
+        debounce: float = DEBOUNCE,
+        interval: float = POLL_INTERVAL,
+        polling: bool = False,
+        fingerprint: bool = False,
+        **kwargs,
+    ) -> None:
         self.root = root
+        # Guards header files against concurrent appends, reads and compaction
+        self._header_lock = Lock()
+        self._compacting: Set[str] = set()
+        self.watcher: Optional[LocalWatcher] = None
+        super().__init__(*args, **kwargs)
+        # Files changed under the root other than through this client are recorded as they change
+        if watch:
+            self.watcher = LocalWatcher(self, debounce, interval, polling, fingerprint)
 
-    def get(self, key: StorageKey) -> FileData:
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
         path = self.root.join(str(key.path))
-        handle = Path(str(path))
-        return handle.read_bytes()
+        with open(str(path), "rb") as handle:
+            handle.seek(offset)
+            return handle.read(-1 if length is None else length)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        path = self.root.join(str(key.path))
+        with open(str(path), "rb") as handle:
+            handle.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                chunk = handle.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    # Zero-copy read, pages come from the OS page cache and are shared across processes
+    def view(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> memoryview:
+        path = self.root.join(str(key.path))
+        with open(str(path), "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size == 0:
+                return memoryview(b"")
+            # Mapping outlives the file handle and is unmapped once the view is released
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        stop = size if length is None else min(size, offset + length)
+        return memoryview(mapped)[offset:stop]
 
     def put(self, obj: Object, data: FileData) -> None:
         # Resolve path
@@ -26,22 +127,399 @@ class LocalClient(BaseStorageClient):
         handle = Path(str(path))
         # Write object to disk
         handle.parent.mkdir(parents=True, exist_ok=True)
+        previous = self._stored_bytes(obj.key)
         handle.touch(exist_ok=True)
         handle.write_bytes(data)
-        # Set header
-        header = self.header(obj.key)
-        header.objects[obj.key] = obj
-        hobj, hdata = header.create_file()
-        # Write header to disk
-        hpath = self.root.join(str(hobj.key.path))
-        hhandle = Path(str(hpath))
-        hhandle.touch(exist_ok=True)
-        hhandle.write_bytes(hdata)
+        self._account(obj.key, previous, len(data))
+        self._set_header(obj)
+        self._wrote(obj.key)
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        # Resolve path
+        path = self.root.join(str(obj.key.path))
+        handle = Path(str(path))
+        # Write object to disk chunk by chunk
+        handle.parent.mkdir(parents=True, exist_ok=True)
+        previous = self._stored_bytes(obj.key)
+        with handle.open("wb") as file:
+            for chunk in stream:
+                file.write(chunk)
+        self._account(obj.key, previous, handle.stat().st_size)
+        self._set_header(obj)
+        self._wrote(obj.key)
+
+    def _set_header(self, obj: Object) -> None:
+        entry = HeaderEntry(operation=HeaderOperation.PUT, key=obj.key, obj=obj)
+        self._record(entry)
 
     def remove(self, key: StorageKey) -> None:
         path = self.root.join(str(key.path))
-        shutil.rmtree(str(path))
+        handle = Path(str(path))
+        if handle.is_dir():
+            objects, size = self._usage(handle)
+            shutil.rmtree(str(path))
+            self._count(-objects, -size)
+        else:
+            previous = self._stored_bytes(key)
+            handle.unlink()
+            self._account(key, previous, None)
+            self._wrote(key)
+        entry = HeaderEntry(operation=HeaderOperation.REMOVE, key=key)
+        self._record(entry)
+
+    def unlock(self) -> None:
+        # Watching ends with the client, so no thread records changes into headers it no longer holds
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        super().unlock()
+
+    def _wrote(self, key: StorageKey) -> None:
+        # Events for the client's own writes are not reconciled again
+        if self.watcher is not None and not key.path.name.startswith("."):
+            self.watcher.wrote(str(key.path))
+
+    # Sizes on disk rather than from headers, so usage matches the files
+    def _stored_bytes(self, key: StorageKey) -> Optional[int]:
+        try:
+            status = os.stat(str(self.root.join(str(key.path))))
+        except FileNotFoundError:
+            return None
+        return None if S_ISDIR(status.st_mode) else status.st_size
+
+    def _usage(self, directory: Path) -> Tuple[int, int]:
+        objects = size = 0
+        for parent, _, files in os.walk(directory):
+            for name in files:
+                if not name.startswith("."):
+                    objects += 1
+                    size += os.path.getsize(os.path.join(parent, name))
+        return objects, size
+
+    @property
+    def available(self) -> Optional[int]:
+        status = os.statvfs(str(self.root))
+        return status.f_bavail * status.f_frsize
+
+    def _load_header(self, head_key: StorageKey) -> Header:
+        rotated, journal = self._journals(head_key.path.parent)
+        with self._header_lock:
+            header = self._snapshot(head_key)
+            for entry in rotated:
+                header.apply(entry)
+            for entry in journal:
+                header.apply(entry)
+        return header
+
+    def _snapshot(self, head_key: StorageKey) -> Header:
+        handle = Path(str(self.root.join(str(head_key.path))))
+        if not handle.exists():
+            return Header(key=head_key, objects={})
+        return Header.from_raw(handle.read_bytes())
+
+    # Appends always grow the journal and compaction replaces files, so size and mtime catch every change
+    def _header_version(self, head_key: StorageKey) -> Optional[Hashable]:
+        rotated, journal = self._journals(head_key.path.parent)
+        snapshot = Path(str(self.root.join(str(head_key.path))))
+        version = []
+        for handle in (snapshot, rotated.path, journal.path):
+            try:
+                stat = handle.stat()
+            except FileNotFoundError:
+                version.append(None)
+                continue
+            version.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(version)
+
+    def _journals(self, directory: StoragePath) -> Tuple[Journal[HeaderEntry], Journal[HeaderEntry]]:
+        handle = Path(str(self.root.join(str(directory)))) / JOURNAL
+        rotated = Journal(handle.with_name(JOURNAL + ROTATED), HeaderEntry)
+        return rotated, Journal(handle, HeaderEntry)
+
+    def _record(self, entry: HeaderEntry) -> None:
+        self._record_many(entry.key.path.parent, [entry])
+
+    def _record_many(self, directory: StoragePath, entries: List[HeaderEntry]) -> None:
+        """
+        Append changes to one directory header with a single write.
+        """
+        _, journal = self._journals(directory)
+        with self._header_lock:
+            journal.append(*entries)
+            compact = journal.size() > COMPACT_BYTES and directory.path not in self._compacting
+            if compact:
+                self._compacting.add(directory.path)
+        self._invalidate_header(entries[0].key)
+        if compact:
+            self._executor.submit(self._compact, directory)
+
+    def _compact(self, directory: StoragePath) -> None:
+        head_key = StorageKey(storage=self.name, path=directory).join(HEADER)
+        handle = Path(str(self.root.join(str(head_key.path))))
+        rotated, journal = self._journals(directory)
+        try:
+            # Appends continue into a fresh journal while the rotated one is folded in
+            with self._header_lock:
+                # Leftover rotated journal from an interrupted compaction is folded in first
+                if not rotated.path.exists():
+                    journal.rotate(ROTATED)
+            header = self._snapshot(head_key)
+            for entry in rotated:
+                header.apply(entry)
+            temporary = handle.with_name(TEMPORARY)
+            temporary.write_text(header.to_json(), encoding="utf-8")
+            with self._header_lock:
+                temporary.replace(handle)
+                rotated.clear()
+        finally:
+            with self._header_lock:
+                self._compacting.discard(directory.path)
 
     @property
     def medium(self) -> Medium:
         return Medium.LOCAL
+
+    # Entries of one directory are sorted in memory, only a single level is held at a time
+    def _children(self, prefix: StorageKey) -> Iterator[Tuple[StorageKey, bool]]:
+        path = Path(str(self.root.join(str(prefix.path))))
+        if not path.is_dir():
+            return
+        with os.scandir(path) as entries:
+            children = [
+                (f"{entry.name}/" if entry.is_dir() else entry.name, entry.name, entry.is_dir())
+                for entry in entries
+                if entry.name not in (HEADER, JOURNAL, JOURNAL + ROTATED, TEMPORARY)
+            ]
+        children.sort()
+        for _, name, is_folder in children:
+            yield prefix.join(name), is_folder
+
+
+class LocalWatcher:
+    """
+    Files changed under the root of a local client other than through it are recorded in the directory headers,
+    from inotify events or from periodic scans where inotify is unavailable. Events are debounced, every file
+    changed during a burst is reconciled once it settles, with one journal append per directory.
+    Reconciled changes are passed on to the client's observers, such as an attached index.
+    """
+
+    def __init__(
+        self,
+        client: LocalClient,
+        debounce: float = DEBOUNCE,
+        interval: float = POLL_INTERVAL,
+        polling: bool = False,
+        fingerprint: bool = False,
+    ) -> None:
+        self.client = client
+        self.root = Path(str(client.root))
+        self.debounce: float = debounce
+        self.interval: float = interval
+        # Hashing every changed file is costly on large shares, by default only sizes are recorded
+        self.fingerprint: bool = fingerprint
+        # Signatures of the client's own latest writes by path, None for removals
+        self.written: Dict[str, Optional[Signature]] = {}
+        self.written_lock = Lock()
+        self.watches: Dict[int, str] = {}
+        self.files: Dict[str, Signature] = {}
+        # Sizes recorded in the headers by path, kept as a directory's header leaves along with it
+        self.recorded: Dict[str, int] = {}
+        self.stopped = Event()
+        self.inotify: Optional[Inotify] = None
+        if not polling:
+            try:
+                self.inotify = Inotify()
+            except OSError:
+                self.inotify = None
+        if self.inotify is not None:
+            self._watch("")
+            target = self._listen
+        else:
+            self.files = self._scan()
+            for parent, _, _ in os.walk(self.root):
+                self._remember(Path(parent).relative_to(self.root).as_posix())
+            target = self._poll
+        self.thread = Thread(target=target, name=f"{self.__class__.__name__}@{client.root}", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        if self.inotify is not None:
+            self.inotify.close()
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[Signature]:
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return status.st_mtime_ns, status.st_size
+
+    def wrote(self, path: str) -> None:
+        signature = self._signature(self.root / path)
+        with self.written_lock:
+            self.written[path] = signature
+
+    def _remember(self, directory: str) -> None:
+        directory = "" if directory == "." else directory
+        key = StorageKey(
+            storage=self.client.name, path=StoragePath(path=f"{directory}/{HEADER}" if directory else HEADER)
+        )
+        for item, obj in self.client.header(key).objects.items():
+            size = self._size(obj)
+            if size is not None and not item.path.name.startswith("."):
+                self.recorded[str(item.path)] = size
+
+    def _watch(self, directory: str) -> List[str]:
+        """
+        Watch a directory and every one below it, returning the files found in them.
+        """
+        files = []
+        for parent, _, names in os.walk(self.root / directory):
+            relative = Path(parent).relative_to(self.root).as_posix()
+            relative = "" if relative == "." else relative
+            try:
+                self.watches[self.inotify.add(parent, WATCH_MASK)] = relative
+            except FileNotFoundError:
+                # Removed again before it was watched
+                continue
+            self._remember(relative)
+            files.extend(f"{relative}/{name}" if relative else name for name in names if not name.startswith("."))
+        return files
+
+    def _recorded_under(self, directory: str) -> List[str]:
+        return [path for path in self.recorded if not directory or path.startswith(f"{directory}/")]
+
+    def _unwatch(self, directory: str) -> None:
+        for watch, path in list(self.watches.items()):
+            if path == directory or path.startswith(f"{directory}/"):
+                self.inotify.remove(watch)
+                del self.watches[watch]
+
+    def _scan(self) -> Dict[str, Signature]:
+        files = {}
+        for parent, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = Path(parent) / name
+                signature = self._signature(path)
+                if signature is not None:
+                    files[path.relative_to(self.root).as_posix()] = signature
+        return files
+
+    def _changed(self, event: InotifyEvent) -> List[str]:
+        if event.mask & IN_Q_OVERFLOW:
+            # Events were lost, everything is watched again and reconciled, removals included
+            for watch in list(self.watches):
+                self.inotify.remove(watch)
+            self.watches.clear()
+            files = self._watch("")
+            return sorted(set(files).union(self._recorded_under("")))
+        directory = self.watches.get(event.watch)
+        if directory is None:
+            return []
+        if event.mask & IN_IGNORED:
+            del self.watches[event.watch]
+            return []
+        path = f"{directory}/{event.name}" if directory else event.name
+        if event.mask & IN_ISDIR:
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may have been added before the watch was, or moved in along with the directory
+                return self._watch(path)
+            if event.mask & IN_MOVED_FROM:
+                # Its files went with it, as did its header
+                self._unwatch(path)
+                return self._recorded_under(path)
+            return []
+        return [] if event.name.startswith(".") else [path]
+
+    def _listen(self) -> None:
+        pending: Set[str] = set()
+        first = last = 0.0
+        while not self.stopped.is_set():
+            events = self.inotify.read(self.debounce)
+            now = time.monotonic()
+            for event in events:
+                changed = self._changed(event)
+                if changed:
+                    if not pending:
+                        first = now
+                    pending.update(changed)
+                    last = now
+            if pending and (now - last >= self.debounce or now - first >= MAX_DELAY):
+                self._settle(sorted(pending))
+                pending.clear()
+
+    def _poll(self) -> None:
+        while not self.stopped.wait(self.interval):
+            files = self._scan()
+            changed = [path for path in files.keys() | self.files.keys() if files.get(path) != self.files.get(path)]
+            self.files = files
+            if changed:
+                self._settle(sorted(changed))
+
+    def _settle(self, paths: List[str]) -> None:
+        try:
+            self._reconcile(paths)
+        except Exception:  # pylint: disable=broad-except
+            # A failed batch must not stop watching, its files are reconciled again when they next change
+            return
+
+    def _object(self, key: StorageKey, size: int) -> Object:
+        if self.fingerprint:
+            obj, stream = Object.create_stream(key, self.client.get_stream(key))
+            for _ in stream:
+                pass
+            return obj
+        content = ObjectInfo(size=SizeInfo(raw_bytes=ByteSize(size)), mime_type=TypeSignature())
+        return Object(key=key, metadata=Metadata(), item=File(content=content))
+
+    @staticmethod
+    def _size(obj: Object) -> Optional[int]:
+        if not obj.is_file():
+            return None
+        size = obj.item.content.size
+        return int(size.raw_bytes if size.compressed_bytes is None else size.compressed_bytes)
+
+    def _reconcile(self, paths: List[str]) -> None:
+        """
+        Record the files as they are on disk where they differ from the client's own latest writes.
+        """
+        # pylint: disable=protected-access
+        batches: Dict[str, List[HeaderEntry]] = defaultdict(list)
+        for path in paths:
+            handle = self.root / path
+            if handle.is_dir():
+                continue
+            signature = self._signature(handle)
+            recorded = self.recorded.pop(path, None)
+            if signature is not None:
+                self.recorded[path] = signature[1]
+            with self.written_lock:
+                if path in self.written and self.written.pop(path) == signature:
+                    continue
+            key = StorageKey(storage=self.client.name, path=StoragePath(path=path))
+            try:
+                previous = self.client.header(key).objects.get(key)
+                # Headers of directories moved or removed went with them, what they recorded is known still
+                previous_size = recorded if previous is None else self._size(previous)
+                if signature is None:
+                    if previous_size is None:
+                        continue
+                    entry = HeaderEntry(operation=HeaderOperation.REMOVE, key=key)
+                    self.client._account(key, previous_size, None)
+                else:
+                    entry = HeaderEntry(operation=HeaderOperation.PUT, key=key, obj=self._object(key, signature[1]))
+                    self.client._account(key, previous_size, signature[1])
+            except FileNotFoundError:
+                # Removed while being reconciled, its removal follows
+                continue
+            batches[str(key.path.parent)].append(entry)
+        for directory, entries in batches.items():
+            # Headers of removed directories went with them
+            if (self.root / directory).is_dir():
+                self.client._record_many(StoragePath(path=directory), entries)
+        if batches:
+            self.client._observed([entry for entries in batches.values() for entry in entries])
@@ -1,27 +1,79 @@
 """Memory client for storage."""
-from typing import Dict, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from storage.models.client.medium import Medium
-from storage.models.object.file.data import FileData
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
 from storage.models.object.path import StorageKey
 from storage.superclass.client import BaseStorageClient
 
 
 class MemoryClient(BaseStorageClient):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
         self.storage: Dict[StorageKey, Tuple[Object, FileData]] = {}
+        super().__init__(**kwargs)
 
     @property
     def medium(self) -> Medium:
         return Medium.LOCAL
 
-    def get(self, key: StorageKey) -> FileData:
-        return self.storage[key][1]
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        data = self.storage[key][1]
+        stop = len(data) if length is None else offset + length
+        return data[offset:stop]
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        data = self.storage[key][1]
+        stop = len(data) if length is None else min(len(data), offset + length)
+        for start in range(offset, stop, chunk_size):
+            end = min(start + chunk_size, stop)
+            yield data[start:end]
 
     def put(self, obj: Object, data: FileData) -> None:
+        self._account(obj.key, self._stored_bytes(obj.key), len(data))
+        self.storage[obj.key] = (obj, data)
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        data = b"".join(stream)
+        self._account(obj.key, self._stored_bytes(obj.key), len(data))
         self.storage[obj.key] = (obj, data)
 
     def remove(self, key: StorageKey) -> None:
-        self.storage.pop(key)
+        _, data = self.storage.pop(key)
+        self._account(key, len(data), None)
+
+    # No I/O to overlap, batches are served directly
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        return {key: self.storage[key][1] for key in keys}
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        for obj, data in items:
+            self.put(obj, data)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        for key in keys:
+            self.remove(key)
+
+    # Objects are stored along with their data, rather than in directory headers
+    def stat(self, key: StorageKey) -> Object:
+        return self.storage[key][0]
+
+    def _stored_bytes(self, key: StorageKey) -> Optional[int]:
+        stored = self.storage.get(key)
+        return None if stored is None else len(stored[1])
+
+    # Folders are implied by the paths of stored keys
+    def _children(self, prefix: StorageKey) -> Iterator[Tuple[StorageKey, bool]]:
+        base = f"{prefix.path}/" if str(prefix.path) else ""
+        start = len(base)
+        children: Dict[str, bool] = {}
+        for key in self.storage:
+            path = str(key.path)
+            if not path.startswith(base):
+                continue
+            name, separator, _ = path[start:].partition("/")
+            children[name + separator] = bool(separator)
+        for order in sorted(children):
+            yield prefix.join(order.rstrip("/")), children[order]
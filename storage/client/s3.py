@@ -1,16 +1,73 @@
 """MinIO Storage Client"""
-from io import BytesIO
-from typing import Optional
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timezone
+from io import BufferedReader, BytesIO, RawIOBase
+from itertools import chain
+from threading import Lock
+from typing import Deque, Hashable, Iterable, Iterator, List, Optional, Tuple
 
+import certifi
+import urllib3
 from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+from pydantic import ByteSize
 from urllib3.response import BaseHTTPResponse as S3Response
+from urllib3.util import Retry, Timeout
 
+from datamodel.timedate import DateTime
 from storage.models.client.medium import Medium
-from storage.models.object.file.data import FileData
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
+from storage.models.object.file.info import ObjectInfo, SizeInfo, TypeSignature
+from storage.models.object.metadata import Metadata
 from storage.models.object.models import File, Object
-from storage.models.object.path import StorageKey
+from storage.models.object.path import StorageKey, StoragePath
 from storage.superclass.client import BaseStorageClient
 
+# Size of parts for multipart uploads and ranged downloads, S3 minimum for uploads is 5 MiB
+PART_SIZE: int = 8 * 1024 * 1024
+MIN_PART_SIZE: int = 5 * 1024 * 1024
+MAX_PARTS: int = 10_000
+
+# Parts transferred at once per upload or download
+CONCURRENCY: int = 8
+
+# Seconds before connecting or reading a response times out
+TIMEOUT: int = 300
+
+# Object sizes remembered from writes and listings, so usage is counted without asking for them
+SIZE_CACHE: int = 100_000
+
+
+class StreamReader(RawIOBase):
+    """
+    File-like adapter over a stream of chunks, only holds the current chunk in memory.
+    """
+
+    def __init__(self, stream: FileStream) -> None:
+        super().__init__()
+        self.stream: FileStream = iter(stream)
+        self.buffer: FileData = b""
+        self.total: int = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.buffer:
+            chunk = next(self.stream, None)
+            if chunk is None:
+                return 0
+            self.buffer = chunk
+            self.total += len(chunk)
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
 
 class S3Client(BaseStorageClient):
     def __init__(
@@ -21,8 +78,22 @@ class S3Client(BaseStorageClient):
         secret_key: str,
         secure: bool,
         region: Optional[str] = None,
+        quota: Optional[int] = None,
+        part_size: int = PART_SIZE,
+        concurrency: int = CONCURRENCY,
+        pool_size: Optional[int] = None,
+        **kwargs,
     ) -> None:
-        super().__init__()
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"Part size {part_size} is below the S3 minimum of {MIN_PART_SIZE}")
+        # Same settings as the MinIO default, with connections for every concurrent part and batch operation
+        http_client = urllib3.PoolManager(
+            timeout=Timeout(connect=TIMEOUT, read=TIMEOUT),
+            maxsize=pool_size if pool_size is not None else max(10, 2 * concurrency),
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
         self.client = Minio(
             endpoint=endpoint,
             access_key=access_key,
@@ -30,16 +101,134 @@ class S3Client(BaseStorageClient):
             secure=secure,
             session_token=None,
             region=region,
+            http_client=http_client,
         )
         self.bucket = bucket
+        self.part_size: int = part_size
+        self.concurrency: int = concurrency
+        # Apart from the batch executor, a batch of gets would otherwise wait on parts queued behind it
+        self._transfers = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix=f"{self.__class__.__name__}-part"
+        )
+        # Buckets have no size limit of their own, free space is what the quota leaves
+        self.quota: Optional[int] = quota
+        # Stored size by path, None for paths known to hold no object
+        self._sizes: OrderedDict[str, Optional[int]] = OrderedDict()
+        self._sizes_lock = Lock()
+        super().__init__(**kwargs)
 
     @property
     def medium(self) -> Medium:
         return Medium.REMOTE
 
-    def get(self, key: StorageKey) -> FileData:
-        resp: S3Response = self.client.get_object(self.bucket, str(key.path))
-        return resp.read()
+    @property
+    def available(self) -> Optional[int]:
+        if self.quota is None:
+            return None
+        return max(0, self.quota - self.used_bytes)
+
+    def _learn(self, path: str, size: Optional[int]) -> None:
+        with self._sizes_lock:
+            self._sizes[path] = size
+            self._sizes.move_to_end(path)
+            while len(self._sizes) > SIZE_CACHE:
+                self._sizes.popitem(last=False)
+
+    # Known from earlier writes and listings of this client, asked for only otherwise
+    def _stored_bytes(self, key: StorageKey) -> Optional[int]:
+        path = str(key.path)
+        with self._sizes_lock:
+            if path in self._sizes:
+                self._sizes.move_to_end(path)
+                return self._sizes[path]
+        try:
+            size = self.client.stat_object(self.bucket, path).size
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            size = None
+        self._learn(path, size)
+        return size
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        if length == 0:
+            return b""
+        return b"".join(self._ranges(key, offset, length))
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        if length == 0:
+            return
+        for part in self._ranges(key, offset, length):
+            view = memoryview(part)
+            for start in range(0, len(view), chunk_size):
+                stop = start + chunk_size
+                yield bytes(view[start:stop])
+
+    def _range(self, key: StorageKey, offset: int, length: int) -> Tuple[FileData, Optional[int]]:
+        """
+        Bytes of one ranged get and the size of the whole object, when the response tells.
+        """
+        try:
+            resp: S3Response = self.client.get_object(self.bucket, str(key.path), offset=offset, length=length)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                raise KeyError(f"Key '{key}' does not exist") from e
+            # Nothing at or after the offset, such as any range of an empty object
+            if e.code == "InvalidRange":
+                return b"", offset
+            raise
+        try:
+            data = resp.read()
+            # 'bytes 0-99/100', a response without a range holds the whole object
+            content_range = resp.headers.get("Content-Range")
+        finally:
+            resp.close()
+            resp.release_conn()
+        if content_range is None or content_range.endswith("*"):
+            return data, offset + len(data)
+        return data, int(content_range.rsplit("/", 1)[1])
+
+    def _ranges(self, key: StorageKey, offset: int, length: Optional[int]) -> Iterator[FileData]:
+        """
+        Parts of a range in order, fetched with concurrent ranged gets. The first part tells the object size,
+        so no request is spent on it, and a range within one part is a single get.
+        """
+        head, size = self._range(key, offset, self.part_size if length is None else min(length, self.part_size))
+        yield head
+        end = size if length is None else min(size, offset + length)
+        positions = range(offset + len(head), end, self.part_size)
+        futures: Deque[Future] = deque()
+        try:
+            for position in positions:
+                futures.append(self._transfers.submit(self._range, key, position, min(self.part_size, end - position)))
+                # Parts are yielded in order with at most the concurrency in flight, bounding memory
+                if len(futures) >= self.concurrency:
+                    yield futures.popleft().result()[0]
+            while futures:
+                yield futures.popleft().result()[0]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    # Metadata request only, the object's own size, type and modification time
+    def stat(self, key: StorageKey) -> Object:
+        try:
+            info = self.client.stat_object(self.bucket, str(key.path))
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                raise KeyError(f"Key '{key}' does not exist") from e
+            raise
+        self._learn(str(key.path), info.size)
+        metadata = Metadata()
+        if info.last_modified is not None:
+            # Stored times are naive UTC
+            modified = DateTime.fromtimestamp(info.last_modified.timestamp(), timezone.utc).replace(tzinfo=None)
+            metadata.access.modified = metadata.access.created = modified
+        mime = TypeSignature(mime=info.content_type) if info.content_type else TypeSignature()
+        content = ObjectInfo(size=SizeInfo(raw_bytes=ByteSize(info.size)), mime_type=mime)
+        return Object(key=key, metadata=metadata, item=File(content=content))
 
     # Creating empty folders possible in '._head' only
     def put(self, obj: Object, data: FileData) -> None:
@@ -47,14 +236,134 @@ class S3Client(BaseStorageClient):
             raise ValueError("Object is not a file")
 
         content_type = obj.item.content.mime_type.mime
-        self.client.put_object(
-            bucket_name=self.bucket,
-            object_name=str(obj.key.path),
-            data=BytesIO(data),
-            length=len(data),
-            content_type=content_type,
-        )
+        if len(data) <= self.part_size:
+            previous = self._stored_bytes(obj.key)
+            self.client.put_object(
+                bucket_name=self.bucket,
+                object_name=str(obj.key.path),
+                data=BytesIO(data),
+                length=len(data),
+                content_type=content_type,
+            )
+        else:
+            # Larger parts where the part size would need too many, each copied only once it is uploaded
+            part_size = max(self.part_size, -(-len(data) // MAX_PARTS))
+            view = memoryview(data)
+            parts = (bytes(view[slice(start, start + part_size)]) for start in range(0, len(data), part_size))
+            previous = self._multipart(obj.key, content_type, parts)
+        self._written(obj.key, previous, len(data))
         super().put(obj, data)
 
+    # Streams of a single part are one request, longer ones a multipart upload with the concurrency parts in memory
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        if not isinstance(obj.item, File):
+            raise ValueError("Object is not a file")
+
+        content_type = obj.item.content.mime_type.mime
+        reader = StreamReader(stream)
+        # Buffered reads return whole parts rather than a chunk at a time
+        buffered = BufferedReader(reader, CHUNK_SIZE)
+        parts = iter(lambda: buffered.read(self.part_size), b"")
+        first = next(parts, b"")
+        if len(first) < self.part_size:
+            previous = self._stored_bytes(obj.key)
+            self.client.put_object(
+                bucket_name=self.bucket,
+                object_name=str(obj.key.path),
+                data=BytesIO(first),
+                length=len(first),
+                content_type=content_type,
+            )
+        else:
+            previous = self._multipart(obj.key, content_type, chain([first], parts))
+        self._written(obj.key, previous, reader.total)
+
+    def _written(self, key: StorageKey, previous: Optional[int], size: Optional[int]) -> None:
+        # Size of the write is known, so the next write or removal of the key needs no request to count it
+        self._account(key, previous, size)
+        self._learn(str(key.path), size)
+        self._invalidate_header(key)
+
+    def _multipart(self, key: StorageKey, content_type: str, parts: Iterable[FileData]) -> Optional[int]:
+        """
+        Upload parts concurrently as one multipart upload, aborted when any part fails.
+        Returns the size of the object it replaced, looked up while the parts upload.
+        """
+        # pylint: disable=protected-access
+        # Private multipart calls of minio, its version is pinned in requirements.txt for their signatures
+        name = str(key.path)
+        # Done before completing, the object it looks up is only replaced then
+        previous = self._transfers.submit(self._stored_bytes, key)
+        upload = self.client._create_multipart_upload(self.bucket, name, {"Content-Type": content_type})
+        futures: List[Future] = []
+        try:
+            for number, part in enumerate(parts, start=1):
+                # Reading ahead waits for the oldest part in flight, so memory holds at most the concurrency parts
+                if number > self.concurrency:
+                    futures[number - 1 - self.concurrency].result()
+                futures.append(
+                    self._transfers.submit(self.client._upload_part, self.bucket, name, part, None, upload, number)
+                )
+            etags = [future.result() for future in futures]
+            completed = [Part(number, etag) for number, etag in enumerate(etags, start=1)]
+            size = previous.result()
+            self.client._complete_multipart_upload(self.bucket, name, upload, completed)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            self.client._abort_multipart_upload(self.bucket, name, upload)
+            raise
+        return size
+
     def remove(self, key: StorageKey) -> None:
+        previous = self._stored_bytes(key)
         self.client.remove_object(self.bucket, str(key.path))
+        self._written(key, previous, None)
+
+    # Multi-object delete, up to a thousand keys per request
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        objects = [DeleteObject(str(key.path)) for key in keys]
+        sizes = list(self._executor.map(self._stored_bytes, keys))
+        errors = list(self.client.remove_objects(self.bucket, objects))
+        failed = {error.name for error in errors}
+        for key, previous in zip(keys, sizes):
+            if str(key.path) not in failed:
+                self._written(key, previous, None)
+            self._invalidate_header(key)
+        if errors:
+            failed = [error.name for error in errors]
+            raise RuntimeError(f"Could not remove objects {failed} from {self}")
+
+    # Metadata request only, the header body is fetched again when the ETag changes
+    def _header_version(self, head_key: StorageKey) -> Optional[Hashable]:
+        try:
+            return self.client.stat_object(self.bucket, str(head_key.path)).etag
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                raise KeyError(head_key) from e
+            raise
+
+    # Unlimited depth is a single listing, paginated by the server, of files only as S3 has no folders
+    def _walk(
+        self, prefix: StorageKey, depth: Optional[int], start_after: Optional[str]
+    ) -> Iterator[Tuple[StorageKey, str]]:
+        if depth is not None:
+            yield from super()._walk(prefix, depth, start_after)
+            return
+        objects = self.client.list_objects(
+            self.bucket, prefix=self._folder(prefix), recursive=True, start_after=start_after
+        )
+        for item in objects:
+            self._learn(item.object_name, item.size)
+            yield StorageKey(storage=prefix.storage, path=StoragePath(path=item.object_name)), item.object_name
+
+    def _children(self, prefix: StorageKey) -> Iterator[Tuple[StorageKey, bool]]:
+        for item in self.client.list_objects(self.bucket, prefix=self._folder(prefix)):
+            if not item.is_dir:
+                self._learn(item.object_name, item.size)
+            path = StoragePath(path=item.object_name.rstrip("/"))
+            yield StorageKey(storage=prefix.storage, path=path), item.is_dir
+
+    def _folder(self, prefix: StorageKey) -> Optional[str]:
+        path = str(prefix.path).rstrip("/")
+        return f"{path}/" if path else None
@@ -0,0 +1,51 @@
+"""Asynchronous storage client interface."""
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from storage.models.client.key import StorageClientKey
+from storage.models.client.medium import Medium
+from storage.models.object.file.data import FileData
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+
+
+class AsyncStorageClientInterface(ABC):
+    RESERVED: List[StoragePath]
+
+    @abstractmethod
+    async def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        ...
+
+    @abstractmethod
+    async def stat(self, key: StorageKey) -> Object:
+        ...
+
+    @abstractmethod
+    async def put(self, obj: Object, data: FileData) -> None:
+        ...
+
+    @abstractmethod
+    async def remove(self, key: StorageKey) -> None:
+        ...
+
+    @abstractmethod
+    async def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: StorageKey) -> bool:
+        ...
+
+    @property
+    @abstractmethod
+    def name(self) -> StorageClientKey:
+        ...
+
+    @property
+    @abstractmethod
+    def medium(self) -> Medium:
+        ...
+
+    @abstractmethod
+    def __repr__(self) -> str:
+        ...
@@ -1,16 +1,23 @@
 """Storage client interface."""
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
-from typing import Any, Dict, Generator, List, Union
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple, Union
 
 from distribution.interface.distributed import DistributedInterface
 from storage.models.client.info import StorageInfo
 from storage.models.client.key import StorageClientKey
 from storage.models.client.medium import Medium
-from storage.models.object.file.data import FileData
+from storage.models.header.models import HeaderEntry
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
 from storage.models.object.path import StorageKey, StoragePath
 
+# Default number of keys returned per listing page
+PAGE_SIZE: int = 1000
+
+# Raised for keys that are not stored, clients backed by files raise the error for the missing file
+MISSING = (KeyError, FileNotFoundError)
+
 
 class StorageClientInterface(DistributedInterface, ABC):
     RESERVED: List[StoragePath]
@@ -20,7 +27,13 @@ class StorageClientInterface(DistributedInterface, ABC):
         super().__init__()
 
     @abstractmethod
-    def get(self, key: StorageKey) -> FileData:
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        ...
+
+    @abstractmethod
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
         ...
 
     @abstractmethod
@@ -31,14 +44,42 @@ class StorageClientInterface(DistributedInterface, ABC):
     def put(self, obj: Object, data: FileData) -> None:
         ...
 
+    @abstractmethod
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        ...
+
     @abstractmethod
     def remove(self, key: StorageKey) -> None:
         ...
 
+    @abstractmethod
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        ...
+
+    @abstractmethod
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        ...
+
+    @abstractmethod
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        ...
+
     @abstractmethod
     def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
         ...
 
+    @abstractmethod
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        ...
+
+    @abstractmethod
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        ...
+
     @abstractmethod
     def header(self, key: StorageKey) -> Dict[StorageKey, Object]:
         ...
@@ -62,6 +103,15 @@ class StorageClientInterface(DistributedInterface, ABC):
     def medium(self) -> Medium:
         ...
 
+    @property
+    @abstractmethod
+    def available(self) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def observe(self, callback: Callable[[List[HeaderEntry]], None]) -> None:
+        ...
+
     @abstractmethod
     def __contains__(self, key: StorageKey) -> bool:
         ...
@@ -7,3 +7,6 @@ from datamodel.unique import UniqueID
 
 class StorageInfo(Data):
     uuid: UniqueID = Field(default_factory=UniqueID.random)
+    # Counted incrementally by the client on every write and removal
+    objects: int = 0
+    used_bytes: int = 0
@@ -1,8 +1,10 @@
 """
 Header model
 """
-from typing import Dict, Tuple
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
 
+from pydantic import field_validator
 from typing_extensions import Self
 
 from datamodel.data.model import Data
@@ -11,15 +13,47 @@ from storage.models.object.models import Object
 from storage.models.object.path import StorageKey
 
 
+class HeaderOperation(str, Enum):
+    PUT = "put"
+    REMOVE = "remove"
+
+
+class HeaderEntry(Data):
+    """
+    Single change to a directory header, as recorded in its journal.
+    """
+
+    operation: HeaderOperation
+    key: StorageKey
+    obj: Optional[Object] = None
+
+
 class Header(Data):
     key: StorageKey
     objects: Dict[StorageKey, Object]
 
+    @field_validator("objects", mode="before")
+    @classmethod
+    def keyed(cls, value: Any) -> Any:
+        # Keys are written as strings in JSON, stored headers are keyed again by the key every object holds
+        if isinstance(value, dict) and any(isinstance(key, str) for key in value):
+            return {
+                obj.key if isinstance(obj, Object) else StorageKey.model_validate(obj["key"]): obj
+                for obj in value.values()
+            }
+        return value
+
     def create_file(self: Self) -> Tuple[Object, FileData]:
         encoded = self.to_json().encode()
-        obj, data = Object.create_file(self.key, encoded)
+        obj, data = Object.create_file(self.key, encoded, fingerprint=False)
         return obj, data
 
+    def apply(self: Self, entry: HeaderEntry) -> None:
+        if entry.operation == HeaderOperation.PUT and entry.obj is not None:
+            self.objects[entry.key] = entry.obj
+        elif entry.operation == HeaderOperation.REMOVE:
+            self.objects.pop(entry.key, None)
+
     @classmethod
     def validate(cls, value: "Header") -> "Header":
         if any(item.key.storage for item in value.objects.values()):
@@ -1,6 +1,6 @@
 """Storage item models."""
-from storage.models.object.file.data import FileData
+from storage.models.object.file.data import FileBuffer, FileData, FileStream
 from storage.models.object.models import File, Folder, Object
 from storage.models.object.path import StorageKey
 
-__all__ = ["StorageKey", "File", "Folder", "Object", "FileData"]
+__all__ = ["StorageKey", "File", "Folder", "Object", "FileData", "FileStream", "FileBuffer"]
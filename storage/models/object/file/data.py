@@ -1,3 +1,10 @@
 """Data model for object data."""
+from typing import Iterator, Union
 
 FileData = bytes
+FileStream = Iterator[FileData]
+# Any buffer-protocol object readable without a copy, e.g. a memory-mapped file
+FileBuffer = Union[bytes, bytearray, memoryview]
+
+# Default size of chunks yielded by streamed reads
+CHUNK_SIZE: int = 1024 * 1024
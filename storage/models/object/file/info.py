@@ -9,9 +9,12 @@ from magic import MagicException
 from pydantic import ByteSize, StrictStr
 
 from datamodel.data.model import Data
-from storage.models.object.file.data import FileData
+from storage.models.object.file.data import FileBuffer
 from storage.models.object.file.encryption import EncryptionAlgorithm
 
+# Bytes examined by 'libmagic' by default, so only this much of a buffer is handed over
+MAGIC_BYTES: int = 1024 * 1024
+
 
 class CompressionAlgorithm(str, Enum):
     LZ4 = "LZ4"
@@ -26,20 +29,24 @@ class TypeDetection(str, Enum):
 class SizeInfo(Data):
     raw_bytes: ByteSize = ByteSize(0)
     compressed_bytes: Optional[ByteSize] = None
+    # Compressed data is a sequence of independent frames, so ranges decompress only the frames they cover
+    frame_bytes: Optional[ByteSize] = None  # Raw bytes per frame
+    compressed_frames: Optional[List[ByteSize]] = None  # Compressed bytes of each frame
 
     @classmethod
-    def from_buffer(cls, buffer: FileData) -> "SizeInfo":
-        return cls(raw_bytes=ByteSize(len(buffer)))
+    def from_buffer(cls, buffer: FileBuffer) -> "SizeInfo":
+        return cls(raw_bytes=ByteSize(memoryview(buffer).nbytes))
 
 
 class TypeSignature(Data):
     mime: StrictStr = "application/octet-stream"
 
     @classmethod
-    def from_buffer(cls, buffer: FileData) -> "TypeSignature":
+    def from_buffer(cls, buffer: FileBuffer) -> "TypeSignature":
         mime = None
         try:
-            mime = magic.from_buffer(buffer, mime=True)
+            head = bytes(memoryview(buffer)[:MAGIC_BYTES])
+            mime = magic.from_buffer(head, mime=True)
             mime = str(mime)
         except MagicException:
             pass
@@ -58,7 +65,7 @@ class HashSignature(Data):
     signature: str
 
     @classmethod
-    def from_buffer(cls, buffer: FileData) -> "HashSignature":
+    def from_buffer(cls, buffer: FileBuffer) -> "HashSignature":
         signature = sha256(buffer).hexdigest()
         return cls(signature=signature)
 
@@ -74,13 +81,44 @@ class HashSignature(Data):
 class ObjectInfo(Data):
     size: SizeInfo  # Size of data in bytes or all items in directory
     mime_type: TypeSignature  # MIME type for content
-    signature: HashSignature  # Hash for integrity
+    signature: Optional[HashSignature] = None  # Hash for integrity, absent when fingerprinting is skipped
     compression: Optional[CompressionAlgorithm] = None
     encryption: Optional[EncryptionAlgorithm] = None
 
     @classmethod
-    def from_buffer(cls, buffer: FileData) -> "ObjectInfo":
+    def from_buffer(cls, buffer: FileBuffer, fingerprint: bool = True) -> "ObjectInfo":
         size = SizeInfo.from_buffer(buffer)
+        if not fingerprint:
+            return cls(size=size, mime_type=TypeSignature())
         mime_type = TypeSignature.from_buffer(buffer)
         signature = HashSignature.from_buffer(buffer)
         return cls(size=size, mime_type=mime_type, signature=signature)
+
+
+class Fingerprint:
+    """
+    Content information built incrementally from chunks, only the bounded prefix used for MIME sniffing is kept.
+    """
+
+    def __init__(self) -> None:
+        self.size: int = 0
+        self.head: bytearray = bytearray()
+        self.hash = sha256()
+
+    def update(self, chunk: FileBuffer) -> None:
+        view = memoryview(chunk)
+        missing = MAGIC_BYTES - len(self.head)
+        if missing > 0:
+            self.head += view[:missing]
+        self.size += view.nbytes
+        self.hash.update(view)
+
+    @property
+    def sniffed(self) -> bool:
+        return len(self.head) >= MAGIC_BYTES
+
+    def info(self) -> ObjectInfo:
+        size = SizeInfo(raw_bytes=ByteSize(self.size))
+        mime_type = TypeSignature.from_buffer(self.head)
+        signature = HashSignature(signature=self.hash.hexdigest())
+        return ObjectInfo(size=size, mime_type=mime_type, signature=signature)
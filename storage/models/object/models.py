@@ -1,11 +1,11 @@
 """
 This module contains the models for the items in the storage service.
 """
-from typing import Tuple, Type, Union
+from typing import Iterator, Tuple, Type, Union
 
 from datamodel.data.model import Data
-from storage.models.object.file.data import FileData
-from storage.models.object.file.info import ObjectInfo
+from storage.models.object.file.data import FileBuffer, FileData, FileStream
+from storage.models.object.file.info import Fingerprint, ObjectInfo
 from storage.models.object.metadata import Metadata
 from storage.models.object.path import StorageKey
 
@@ -14,10 +14,35 @@ class File(Data):
     content: ObjectInfo
 
     @classmethod
-    def create(cls: Type["File"], raw: bytes) -> Tuple["File", "FileData"]:
-        content = ObjectInfo.from_buffer(raw)
+    def create(cls: Type["File"], raw: FileBuffer, fingerprint: bool = True) -> Tuple["File", "FileData"]:
+        content = ObjectInfo.from_buffer(raw, fingerprint)
         return File(content=content), raw
 
+    @classmethod
+    def create_stream(cls: Type["File"], stream: FileStream) -> Tuple["File", "FileStream"]:
+        """
+        The MIME type is sniffed from the buffered head of the stream, size and hash are filled in once consumed.
+        """
+        fingerprint = Fingerprint()
+        stream = iter(stream)
+        head = []
+        for chunk in stream:
+            fingerprint.update(chunk)
+            head.append(chunk)
+            if fingerprint.sniffed:
+                break
+        file = File(content=fingerprint.info())
+
+        def tapped() -> Iterator[FileData]:
+            yield from head
+            head.clear()
+            for chunk in stream:
+                fingerprint.update(chunk)
+                yield chunk
+            file.content = fingerprint.info()
+
+        return file, tapped()
+
 
 class Folder(Data):
     num_items: int = 0
@@ -33,8 +58,22 @@ class Object(Data):
     item: Union[File, Folder]  # , Device]
 
     @classmethod
-    def create_file(cls: Type["Object"], key: StorageKey, raw: bytes) -> Tuple["Object", "FileData"]:
-        file, data = File.create(raw)
+    def create_file(
+        cls: Type["Object"], key: StorageKey, raw: FileBuffer, fingerprint: bool = True
+    ) -> Tuple["Object", "FileData"]:
+        file, data = File.create(raw, fingerprint)
+        return (
+            Object(
+                key=key,
+                metadata=Metadata(),
+                item=file,
+            ),
+            data,
+        )
+
+    @classmethod
+    def create_stream(cls: Type["Object"], key: StorageKey, stream: FileStream) -> Tuple["Object", "FileStream"]:
+        file, data = File.create_stream(stream)
         return (
             Object(
                 key=key,
@@ -1,5 +1,5 @@
 """Item permissions model."""
-from typing import Dict, Optional, Union
+from typing import Dict, Optional, Tuple, Union
 
 from pydantic import Field
 
@@ -32,7 +32,8 @@ class AccessControl(Data):
 
 
 class PermissionInfo(Data):
-    owner: Dict[Optional[User], PermissionFlags] = Field(default_factory=lambda: (None, PermissionFlags.user()))
-    group: Dict[Optional[Group], PermissionFlags] = Field(default_factory=lambda: (None, PermissionFlags.group()))
+    # Owning user or group, None for unowned, and their permissions
+    owner: Tuple[Optional[User], PermissionFlags] = Field(default_factory=lambda: (None, PermissionFlags.user()))
+    group: Tuple[Optional[Group], PermissionFlags] = Field(default_factory=lambda: (None, PermissionFlags.group()))
     others: PermissionFlags = Field(default_factory=PermissionFlags.others)
     acl: Optional[AccessControl] = None
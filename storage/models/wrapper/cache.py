@@ -0,0 +1,11 @@
+"""Models for cached storage."""
+from datamodel.data.model import Data
+
+
+class CacheStatistics(Data):
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0  # Entries dropped from memory to stay within budget
+    invalidations: int = 0  # Entries dropped by local writes or failed revalidation
+    revalidations: int = 0  # Entries checked against the wrapped object once their validity ran out
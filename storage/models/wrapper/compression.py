@@ -0,0 +1,62 @@
+"""Models for compressed storage."""
+from typing import Dict, List, Optional
+
+from pydantic import Field
+
+from datamodel.data.model import Data
+from storage.models.object.file.info import CompressionAlgorithm
+from storage.models.object.models import Object
+
+# Formats that are compressed already, as exact MIME types or whole major types
+COMPRESSED_TYPES: List[str] = [
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-lz4",
+    "application/zstd",
+    "application/zip",
+    "application/x-7z-compressed",
+    "application/x-rar",
+    "application/vnd.rar",
+    "application/pdf",
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "audio/*",
+    "video/*",
+]
+
+
+class CompressionPolicy(Data):
+    """
+    Longest matching path prefix decides first, then the exact or major MIME type, then the default.
+    None as an algorithm stores objects uncompressed.
+    """
+
+    default: Optional[CompressionAlgorithm] = CompressionAlgorithm.LZ4
+    prefixes: Dict[str, Optional[CompressionAlgorithm]] = Field(default_factory=dict)
+    mime_types: Dict[str, Optional[CompressionAlgorithm]] = Field(default_factory=dict)
+    skipped: List[str] = Field(default_factory=lambda: list(COMPRESSED_TYPES))
+    minimum_bytes: int = 256
+
+    def algorithm(self, obj: Object) -> Optional[CompressionAlgorithm]:
+        if not obj.is_file():
+            return None
+        path = str(obj.key.path)
+        matches = [prefix for prefix in self.prefixes if path.startswith(prefix)]
+        if matches:
+            return self.prefixes[max(matches, key=len)]
+
+        content = obj.item.content
+        if content.size.raw_bytes < self.minimum_bytes:
+            return None
+        mime = content.mime_type.mime
+        candidates = [mime, f"{mime.split('/')[0]}/*"]
+        if any(candidate in self.skipped for candidate in candidates):
+            return None
+        for candidate in candidates:
+            if candidate in self.mime_types:
+                return self.mime_types[candidate]
+        return self.default
@@ -0,0 +1,23 @@
+"""Models for deduplicated storage."""
+from typing import List
+
+from datamodel.data.model import Data
+from storage.models.object.file.info import ObjectInfo
+
+
+class Chunk(Data):
+    digest: str  # SHA-256 of the chunk, also its name in the chunk store
+    size: int
+
+
+class Manifest(Data):
+    """
+    Stored in place of the object, the content information of its data and the chunks it is rebuilt from.
+    """
+
+    content: ObjectInfo
+    chunks: List[Chunk]
+
+
+class ChunkReferences(Data):
+    count: int = 0
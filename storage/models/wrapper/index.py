@@ -0,0 +1,26 @@
+"""Models for the storage index."""
+from typing import Dict, List
+
+from pydantic import Field
+
+from datamodel.data.model import Data
+from storage.models.header.models import HeaderEntry
+from storage.models.object.models import Object
+
+
+class IndexSnapshot(Data):
+    """
+    Every indexed object by path, including all changes up to the sequence.
+    """
+
+    sequence: int = 0
+    objects: Dict[str, Object] = Field(default_factory=dict)
+
+
+class IndexChanges(Data):
+    """
+    Changes of one write, replayed in sequence order over the snapshot.
+    """
+
+    sequence: int
+    entries: List[HeaderEntry]
@@ -0,0 +1,31 @@
+"""Models for replicated storage."""
+from enum import Enum
+
+from datamodel.data.model import Data
+from storage.models.header.models import HeaderOperation
+from storage.models.object.path import StoragePath
+
+
+class ReplicationMode(str, Enum):
+    SYNCHRONOUS = "synchronous"  # Writes wait for a quorum of targets
+    ASYNCHRONOUS = "asynchronous"  # Writes are logged and shipped to replicas in the background
+
+
+class ChangeRecord(Data):
+    """
+    Entry of the ordered change log, data is read from the wrapped client when shipped.
+    """
+
+    sequence: int
+    timestamp: float
+    operation: HeaderOperation
+    path: StoragePath
+
+
+class ReplicationCursor(Data):
+    sequence: int = 0  # Last change shipped to the replica
+
+
+class ReplicationLag(Data):
+    operations: int = 0
+    seconds: float = 0.0  # Age of the oldest change not yet shipped
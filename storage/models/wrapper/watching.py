@@ -0,0 +1,11 @@
+"""Models for watched storage."""
+from datamodel.data.model import Data
+from storage.models.header.models import HeaderOperation
+from storage.models.object.path import StorageKey
+
+
+class ChangeEvent(Data):
+    sequence: int  # Position in the change feed, the cursor to resume after it
+    key: StorageKey
+    operation: HeaderOperation
+    timestamp: float
@@ -0,0 +1,17 @@
+"""Models for write-back storage."""
+from typing import Optional
+
+from datamodel.data.model import Data
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey
+
+
+class StagedWrite(Data):
+    """
+    Write held in the staging client until flushed, the record is written after its data so it marks completion.
+    """
+
+    key: StorageKey
+    name: str  # Unique name of the staged data and record
+    sequence: int  # Counted up per wrapper from the recovered writes, orders writes to a key and bounds flush barriers
+    obj: Optional[Object] = None  # Absent for removals
@@ -0,0 +1,62 @@
+"""
+Base class for asynchronous storage clients.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional, TypeVar
+
+from storage.interface.asynchronous import AsyncStorageClientInterface
+from storage.interface.client import StorageClientInterface
+from storage.models.client.key import StorageClientKey
+from storage.models.client.medium import Medium
+from storage.models.object.file.data import FileData
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey
+
+T = TypeVar("T")
+
+
+class AsyncBaseStorageClient(AsyncStorageClientInterface):
+    """
+    Runs a blocking storage client, or wrapper stack, on a bounded thread pool.
+    Any number of coroutines can await operations, at most 'workers' of them are doing blocking I/O at once.
+    """
+
+    def __init__(self, client: StorageClientInterface, workers: int = 32) -> None:
+        self.client: StorageClientInterface = client
+        self.RESERVED = client.RESERVED  # pylint: disable=invalid-name
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__)
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    async def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        return await self._run(self.client.get, key, offset, length)
+
+    async def stat(self, key: StorageKey) -> Object:
+        return await self._run(self.client.stat, key)
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        return await self._run(self.client.put, obj, data)
+
+    async def remove(self, key: StorageKey) -> None:
+        return await self._run(self.client.remove, key)
+
+    async def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        return await self._run(self.client.list, prefix, recursive)
+
+    async def exists(self, key: StorageKey) -> bool:
+        return await self._run(self.client.exists, key)
+
+    @property
+    def name(self) -> StorageClientKey:
+        return self.client.name
+
+    @property
+    def medium(self) -> Medium:
+        return self.client.medium
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}:{repr(self.client)}"
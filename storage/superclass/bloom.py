@@ -0,0 +1,47 @@
+"""
+Bloom filter of strings, a compact set answering 'definitely not present' or 'possibly present'.
+"""
+import math
+from hashlib import blake2b
+from typing import Iterable, List
+
+
+class BloomFilter:
+    """
+    Sized for a capacity and false positive rate, which grows once more items than the capacity are added.
+    Items cannot be removed, a filter with many removed items is rebuilt instead.
+    """
+
+    def __init__(self, capacity: int, error: float = 0.01):
+        self.capacity: int = max(capacity, 1)
+        self.error: float = error
+        self.size: int = math.ceil(-self.capacity * math.log(error) / math.log(2) ** 2)
+        self.hashes: int = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray(-(-self.size // 8))
+        self.count: int = 0
+
+    @classmethod
+    def of(cls, items: Iterable[str], capacity: int, error: float = 0.01) -> "BloomFilter":
+        bloom = cls(capacity, error)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item: str) -> List[int]:
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        # Double hashing, every position derives from two independent halves of one digest
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def full(self) -> bool:
+        return self.count > self.capacity
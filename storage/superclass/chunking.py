@@ -0,0 +1,134 @@
+"""
+Content-defined chunking with a gear rolling hash, in the style of FastCDC, and fixed-size framing of streams.
+"""
+from hashlib import sha256
+from typing import Generator, Iterable, Iterator, List
+
+import numpy as np
+
+from storage.models.object.file.data import FileBuffer, FileData
+
+# Bytes covered by the rolling hash, each byte is shifted out after this many steps
+WINDOW: int = 64
+
+# Data hashed at once when splitting a stream, bounds the memory of the hash arrays
+BLOCK_SIZE: int = 4 * 1024 * 1024
+
+# Fixed gear table, derived from SHA-256 so boundaries never change between versions or platforms
+GEAR = np.array(
+    [int.from_bytes(sha256(bytes([value])).digest()[:8], "little") for value in range(256)], dtype=np.uint64
+)
+
+
+def gear_hash(data: np.ndarray) -> np.ndarray:
+    """
+    Gear hash at every position, the sum of gear values of the preceding window shifted by their distance.
+    """
+    hashes = GEAR[data]
+    span = 1
+    # Doubling the covered span each pass takes log2(WINDOW) passes rather than WINDOW
+    while span < WINDOW:
+        shifted = np.zeros_like(hashes)
+        shifted[span:] = hashes[:-span] << np.uint64(span)
+        hashes += shifted
+        span *= 2
+    return hashes
+
+
+class Chunker:
+    """
+    Chunk boundaries depend only on content, so an insertion only changes the chunks around it.
+    Below the average size a stricter mask is used and above it a looser one, normalising chunk sizes.
+    """
+
+    def __init__(self, average: int = 64 * 1024, minimum: int = 16 * 1024, maximum: int = 256 * 1024) -> None:
+        if not WINDOW <= minimum <= average <= maximum <= BLOCK_SIZE:
+            raise ValueError("Chunk sizes must satisfy window <= minimum <= average <= maximum <= block size")
+        self.average: int = average
+        self.minimum: int = minimum
+        self.maximum: int = maximum
+        bits = int(np.log2(average))
+        # Top bits of the hash depend on the whole window
+        self.strict = np.uint64(((1 << (bits + 1)) - 1) << (64 - bits - 1))
+        self.loose = np.uint64(((1 << (bits - 1)) - 1) << (64 - bits + 1))
+
+    def boundaries(self, buffer: FileBuffer, final: bool = True) -> List[int]:
+        """
+        Ends of the chunks in the buffer, which must start at a chunk boundary.
+        Without final the trailing data that may still grow into a longer chunk is left out.
+        """
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        hashes = gear_hash(data)
+        strict = np.flatnonzero((hashes & self.strict) == 0)
+        loose = np.flatnonzero((hashes & self.loose) == 0)
+        size = len(data)
+        start = 0
+        ends: List[int] = []
+        while start < size:
+            # Boundary after the position that matches, so position + 1 is the end
+            low = start + self.minimum - 1
+            normal = start + self.average - 1
+            high = min(start + self.maximum, size)
+            end = None
+            index = np.searchsorted(strict, low)
+            if index < len(strict) and strict[index] < min(normal, high):
+                end = int(strict[index]) + 1
+            else:
+                index = np.searchsorted(loose, max(low, normal))
+                if index < len(loose) and loose[index] < high:
+                    end = int(loose[index]) + 1
+            if end is None:
+                if start + self.maximum <= size or final:
+                    end = high
+                else:
+                    break
+            ends.append(end)
+            start = end
+        return ends
+
+    def split(self, buffer: FileBuffer) -> Iterator[memoryview]:
+        """
+        Chunks are views into the buffer, only a block at a time is hashed.
+        """
+        view = memoryview(buffer)
+        start = 0
+        while start < len(view):
+            stop = min(start + BLOCK_SIZE, len(view))
+            block = view[start:stop]
+            previous = 0
+            for end in self.boundaries(block, final=stop == len(view)):
+                yield block[previous:end]
+                previous = end
+            start += previous
+
+    def split_stream(self, stream: Iterable[FileBuffer]) -> Iterator[memoryview]:
+        pending = bytearray()
+        for chunk in stream:
+            pending += chunk
+            if len(pending) < BLOCK_SIZE:
+                continue
+            consumed = yield from self._emit(pending, final=False)
+            del pending[:consumed]
+        yield from self._emit(pending, final=True)
+
+    def _emit(self, pending: bytearray, final: bool) -> Generator[memoryview, None, int]:
+        start = 0
+        for end in self.boundaries(pending, final):
+            # Copied out, the pending buffer is resized once the chunks are emitted
+            yield memoryview(bytes(pending[start:end]))
+            start = end
+        return start
+
+
+def frames(stream: Iterable[FileBuffer], size: int) -> Iterator[FileData]:
+    """
+    Stream cut into pieces of the size, apart from the last, whatever the size of its chunks.
+    """
+    pending = bytearray()
+    for chunk in stream:
+        pending += chunk
+        while len(pending) >= size:
+            yield bytes(pending[:size])
+            del pending[:size]
+    if pending:
+        yield bytes(pending)
@@ -2,24 +2,41 @@
 Base class for storage clients.
 """
 from abc import abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Any, Generator, List, Union
+from itertools import islice
+from threading import Lock
+from typing import Any, Callable, Dict, Generator, Hashable, Iterator, List, Optional, Tuple, Union
 
 from pysyncobj.batteries import ReplLockManager
 
 from datamodel.data.model import Data
+from datamodel.unique import UniqueID
 from distribution.superclass.distributed import Distributed
 from network.superclass.scheduling import scheduler
-from storage.interface.client import StorageClientInterface
+from storage.interface.client import PAGE_SIZE, StorageClientInterface
 from storage.models.client.info import StorageInfo
 from storage.models.client.key import StorageClientKey
 from storage.models.client.medium import Medium
-from storage.models.header.models import Header
-from storage.models.object.file.data import FileData
-from storage.models.object.models import Folder, Object
+from storage.models.header.models import Header, HeaderEntry
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
+from storage.models.object.models import Object
 from storage.models.object.path import StorageKey, StoragePath
 from storage.models.wrapper.locking import StorageLock
 
+HEADER = "._head.json"
+
+INFO = "._info.json"
+
+LOCK = ".lock"
+
+# Number of parsed directory headers kept per client
+HEADER_CACHE_SIZE: int = 256
+
+# Seconds between writes of usage counted since the last one into the storage info
+USAGE_INTERVAL: int = 60
+
 
 class LockConfig(Data):
     interval: int = 300
@@ -33,10 +50,37 @@ class BaseStorageClient(StorageClientInterface, Distributed):
         StoragePath(path="._root.json"),
         StoragePath(path="._header.json"),
         StoragePath(path="._lock.json"),
+        StoragePath(path=INFO),
+        StoragePath(path=LOCK),
     ]
 
     @abstractmethod
-    def __init__(self, *args, interval: int = 300, grace: int = 30, timeout: int = 30, **kwargs) -> None:
+    def __init__(
+        self,
+        *args,
+        interval: int = 300,
+        grace: int = 30,
+        timeout: int = 30,
+        workers: int = 8,
+        header_cache: int = HEADER_CACHE_SIZE,
+        **kwargs,
+    ) -> None:
+        # Set before registering, which names the client and so reads its storage info
+        self._uuid: Optional[UniqueID] = None
+        # Usage changes not yet written to the storage info, objects and bytes
+        self._usage_lock = Lock()
+        self._usage_objects = 0
+        self._usage_bytes = 0
+        # Bytes used as of the storage info this client last read or wrote
+        self._stored_used: Optional[int] = None
+        self._observers: List[Callable[[List[HeaderEntry]], None]] = []
+        # Bounds the number of concurrent operations for batch calls
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__)
+        # Least recently used headers by key, stored with the version they were read at
+        self._headers: OrderedDict[StorageKey, Tuple[Optional[Hashable], Header]] = OrderedDict()
+        self._headers_size = header_cache
+        self._headers_lock = Lock()
+        self._headers_generation = 0
         super().__init__()
         self._lock: StorageLock
         if self._lock_key in self:
@@ -47,22 +91,25 @@ class BaseStorageClient(StorageClientInterface, Distributed):
 
         self.lock()
         self.monitor = scheduler.every((interval - grace)).seconds.do(self.refresh)
+        self.usage_monitor = scheduler.every(USAGE_INTERVAL).seconds.do(self.flush_usage)
         self._lock_manager = ReplLockManager(timeout)
 
     @property
     def _lock_key(self) -> StorageKey:
-        return StorageKey(storage=self.name, path=StoragePath(path=".lock"))
+        return StorageKey(storage=self.name, path=StoragePath(path=LOCK))
 
     def lock(self) -> None:
         if not self.is_master():
             return
         self._lock = StorageLock()
         encoded = self._lock.to_json().encode()
-        obj, data = Object.create_file(key=self._lock_key, raw=encoded)
+        obj, data = Object.create_file(key=self._lock_key, raw=encoded, fingerprint=False)
         self.put(obj, data)
 
     def unlock(self) -> None:
-        if self._lock.valid() and self.is_master():
+        # Written while the lock is still held, usage counted since the last periodic flush would be lost otherwise
+        self.flush_usage()
+        if self.is_master() and self._lock.valid():
             self.remove(self._lock_key)
 
     def refresh(self) -> None:
@@ -96,41 +143,140 @@ class BaseStorageClient(StorageClientInterface, Distributed):
             raise e
 
     @abstractmethod
-    def get(self, key: StorageKey) -> FileData:
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        ...
+
+    @abstractmethod
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
         ...
 
     @abstractmethod
     def put(self, obj: Object, data: FileData) -> None:
         ...
 
+    @abstractmethod
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        ...
+
     @abstractmethod
     def remove(self, key: StorageKey) -> None:
         ...
 
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        results = self._executor.map(self.get, keys)
+        return dict(zip(keys, results))
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        futures = [self._executor.submit(self.put, obj, data) for obj, data in items]
+        for future in futures:
+            future.result()
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        for _ in self._executor.map(self.remove, keys):
+            pass
+
     def stat(self, key: StorageKey) -> Object:
         header = self.header(key)
         return header.objects[key]
 
-    # Might add depth limit parameter, decrease by 1 each recursive call
     def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
-        header = self.header(prefix)
-        items = list(header.objects.keys())
-        if recursive:
-            folders = [k for k, v in header.objects.items() if isinstance(v, Folder)]
-            new = [self.list(folder, recursive) for folder in folders]
-            items.extend(*new)
-        return items
+        return list(self.walk(prefix, depth=None if recursive else 0))
+
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        """
+        Keys below the prefix in lexicographic order, with folders ordered as their path plus a trailing slash.
+        Depth is the number of folder levels to descend, None for all. Resumes after a token from list_page.
+        """
+        for key, _ in self._walk(prefix, depth, start_after):
+            yield key
+
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        # One extra key tells whether another page follows
+        page = list(islice(self._walk(prefix, None if recursive else 0, token), limit + 1))
+        keys = [key for key, _ in page[:limit]]
+        token = page[limit - 1][1] if len(page) > limit else None
+        return keys, token
+
+    def _walk(
+        self, prefix: StorageKey, depth: Optional[int], start_after: Optional[str]
+    ) -> Iterator[Tuple[StorageKey, str]]:
+        for key, is_folder in self._children(prefix):
+            order = f"{key.path}/" if is_folder else str(key.path)
+            resume = start_after is not None and order <= start_after
+            # Skip whole folders ordered before the token, descend into the one containing it
+            if resume and not (is_folder and start_after.startswith(order)):
+                continue
+            if not resume:
+                yield key, order
+            if is_folder and (depth is None or depth > 0):
+                yield from self._walk(key, None if depth is None else depth - 1, start_after)
+
+    def _children(self, prefix: StorageKey) -> Iterator[Tuple[StorageKey, bool]]:
+        """
+        Direct children of the prefix and whether each is a folder, in walk order.
+        """
+        # Header of the folder itself, rather than the one it is listed in
+        header = self.header(prefix.join(HEADER))
+        children = [(key, obj.is_folder()) for key, obj in header.objects.items()]
+        children.sort(key=lambda child: f"{child[0].path}/" if child[1] else str(child[0].path))
+        return iter(children)
 
     def header(self, key: StorageKey) -> Header:
         """
         Headers are per directory, not including subdirectories apart from their existence.
+        Returns the header of the directory containing the key, it is shared and must not be modified.
         """
-        dir_path = key.path.parent if self.stat(key).is_file() else key.path
-        head_key = StorageKey(storage=key.storage, path=dir_path).join("._head.json")
-        data = self.get(head_key)
-        header = Header.model_validate_json(data)
+        head_key = StorageKey(storage=key.storage, path=key.path.parent).join(HEADER)
+        version = self._header_version(head_key)
+        with self._headers_lock:
+            cached = self._headers.get(head_key)
+            if cached is not None and cached[0] == version:
+                self._headers.move_to_end(head_key)
+                return cached[1]
+            generation = self._headers_generation
+
+        header = self._load_header(head_key)
+        with self._headers_lock:
+            # Skip caching when invalidated while loading, the header may predate the change
+            if generation == self._headers_generation:
+                self._headers[head_key] = (version, header)
+                self._headers.move_to_end(head_key)
+                while len(self._headers) > self._headers_size:
+                    self._headers.popitem(last=False)
         return header
 
+    def _load_header(self, head_key: StorageKey) -> Header:
+        data = self.get(head_key)
+        return Header.model_validate_json(data)
+
+    def _header_version(self, head_key: StorageKey) -> Optional[Hashable]:
+        """
+        Cheap token that changes whenever the stored header does, None relies on invalidation alone.
+        """
+        return None
+
+    def _invalidate_header(self, key: StorageKey) -> None:
+        head_key = StorageKey(storage=key.storage, path=key.path.parent).join(HEADER)
+        with self._headers_lock:
+            self._headers.pop(head_key, None)
+            self._headers_generation += 1
+
+    def observe(self, callback: Callable[[List[HeaderEntry]], None]) -> None:
+        """
+        Call back with changes found in the storage that were not made through this client.
+        """
+        self._observers.append(callback)
+
+    def _observed(self, entries: List[HeaderEntry]) -> None:
+        for callback in self._observers:
+            callback(entries)
+
     def exists(self, key: StorageKey) -> bool:
         return key in self
 
@@ -145,15 +291,126 @@ class BaseStorageClient(StorageClientInterface, Distributed):
     def name(self) -> StorageClientKey:
         return StorageClientKey(value=repr(self))
 
+    @property
+    def uuid(self) -> UniqueID:
+        """
+        Identity of the storage from its stored info, read once as the name in every key depends on it.
+        """
+        if self._uuid is None:
+            # Stored objects are found by path, so the info is read under a provisional name,
+            # which becomes the identity of storage without one
+            self._uuid = UniqueID.random()
+            key = StorageKey(storage=self.name, path=StoragePath(path=INFO))
+            if self._stored_bytes(key) is None:
+                self._store_info(StorageInfo(uuid=self._uuid))
+            else:
+                self._uuid = StorageInfo.from_raw(self.get(key)).uuid
+        return self._uuid
+
     @property
     def info(self) -> StorageInfo:
-        key = StorageKey(storage=self.name, path=StoragePath(path="._info.json"))
-        if key not in self:
-            encoded = StorageInfo().to_json().encode()
-            obj, data = Object.create_file(key, encoded)
-            self.put(obj, data)
+        info = self._stored_info()
+        with self._usage_lock:
+            info.objects += self._usage_objects
+            info.used_bytes += self._usage_bytes
+        return info
+
+    def _stored_info(self) -> StorageInfo:
+        key = StorageKey(storage=self.name, path=StoragePath(path=INFO))
+        if self._stored_bytes(key) is None:
+            self._store_info(StorageInfo(uuid=self.uuid))
         raw = self.get(key)
-        return StorageInfo.from_raw(raw)
+        info = StorageInfo.from_raw(raw)
+        self._stored_used = info.used_bytes
+        return info
+
+    def _store_info(self, info: StorageInfo) -> None:
+        key = StorageKey(storage=self.name, path=StoragePath(path=INFO))
+        encoded = info.to_json().encode()
+        obj, data = Object.create_file(key, encoded, fingerprint=False)
+        self.put(obj, data)
+        self._stored_used = info.used_bytes
+
+    @property
+    def used_bytes(self) -> int:
+        """
+        Bytes in use from the storage info as last read or written by this client, plus usage counted since.
+        Only the first call reads the storage info, so it is cheap enough for placement decisions.
+        """
+        if self._stored_used is None:
+            self._stored_info()
+        with self._usage_lock:
+            return self._stored_used + self._usage_bytes
+
+    @property
+    def available(self) -> Optional[int]:
+        """
+        Free bytes reported by the backend, None when it has no limit or cannot tell.
+        """
+        return None
+
+    def _stored_bytes(self, key: StorageKey) -> Optional[int]:
+        """
+        Bytes the stored object takes up, None when it does not exist.
+        """
+        try:
+            obj = self.stat(key)
+        except KeyError:
+            return None
+        if not obj.is_file():
+            return None
+        size = obj.item.content.size
+        return int(size.raw_bytes if size.compressed_bytes is None else size.compressed_bytes)
+
+    def _account(self, key: StorageKey, previous: Optional[int], current: Optional[int]) -> None:
+        """
+        Count a write or removal, from the stored bytes before and after it, None for no object.
+        """
+        # Headers, locks and the storage info itself are bookkeeping rather than usage
+        if key.path.name.startswith("."):
+            return
+        self._count(int(current is not None) - int(previous is not None), (current or 0) - (previous or 0))
+
+    def _count(self, objects: int, size: int) -> None:
+        with self._usage_lock:
+            self._usage_objects += objects
+            self._usage_bytes += size
+
+    def flush_usage(self) -> None:
+        """
+        Write usage counted since the last flush into the storage info.
+        """
+        with self._usage_lock:
+            objects, size = self._usage_objects, self._usage_bytes
+        if not objects and not size:
+            return
+        info = self._stored_info()
+        info.objects += objects
+        info.used_bytes += size
+        self._store_info(info)
+        # Subtracted only once written, a failed write is retried with the next flush
+        self._count(-objects, -size)
+
+    def recount(self) -> StorageInfo:
+        """
+        Rebuild the usage in the storage info from a full listing, for storage written before it was counted.
+        """
+        objects = size = 0
+        root = StorageKey(storage=self.name, path=StoragePath(path=""))
+        for key in self.walk(root):
+            if key.path.name.startswith("."):
+                continue
+            stored = self._stored_bytes(key)
+            if stored is not None:
+                objects += 1
+                size += stored
+        info = self._stored_info()
+        info.objects = objects
+        info.used_bytes = size
+        self._store_info(info)
+        with self._usage_lock:
+            self._usage_objects = self._usage_bytes = 0
+        return info
 
     @property
     def medium(self) -> Medium:
@@ -165,4 +422,4 @@ class BaseStorageClient(StorageClientInterface, Distributed):
 
     # String representation for pathing
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}@{self.info.uuid}"
+        return f"{self.__class__.__name__}@{self.uuid}"
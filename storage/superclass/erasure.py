@@ -0,0 +1,113 @@
+"""
+Systematic Reed-Solomon erasure coding over GF(2^8), vectorised with NumPy.
+"""
+from typing import Dict, List
+
+import numpy as np
+
+from storage.models.object.file.data import FileBuffer
+
+# Primitive polynomial x^8 + x^4 + x^3 + x^2 + 1 generating the field
+POLYNOMIAL: int = 0x11D
+
+
+def _tables() -> np.ndarray:
+    exp = np.zeros(512, dtype=np.int64)
+    log = np.zeros(256, dtype=np.int64)
+    value = 1
+    for power in range(255):
+        exp[power] = value
+        log[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= POLYNOMIAL
+    exp[255:510] = exp[:255]
+    # Product of every pair of field elements, a row is multiplication by a constant as a lookup table
+    products = exp[log[:, None] + log[None, :]]
+    products[0, :] = 0
+    products[:, 0] = 0
+    return products.astype(np.uint8)
+
+
+MUL: np.ndarray = _tables()
+INVERSE: np.ndarray = np.array([0] + [int(np.nonzero(MUL[value] == 1)[0][0]) for value in range(1, 256)], np.uint8)
+
+
+class ReedSolomon:
+    """
+    Data fragments are stored as they are and parity rows of a Cauchy matrix are added.
+    Every square submatrix of a Cauchy matrix is invertible, so any data fragments decode from the parity.
+    """
+
+    def __init__(self, data: int, parity: int):
+        if data < 1 or parity < 0 or data + parity > 256:
+            raise ValueError(f"Unsupported erasure code with {data} data and {parity} parity fragments")
+        self.data: int = data
+        self.parity: int = parity
+        # Elements of the two Cauchy sets are distinct, so no sum in a denominator is zero
+        self.matrix: np.ndarray = np.zeros((data + parity, data), dtype=np.uint8)
+        self.matrix[:data] = np.eye(data, dtype=np.uint8)
+        for row in range(parity):
+            for column in range(data):
+                self.matrix[data + row, column] = INVERSE[(data + row) ^ column]
+        self.parity_rows: np.ndarray = self.matrix[data:]
+
+    @property
+    def fragments(self) -> int:
+        return self.data + self.parity
+
+    def _combine(self, rows: np.ndarray, shards: np.ndarray) -> np.ndarray:
+        """
+        Matrix product over the field, rows of coefficients times the shards.
+        """
+        result = np.zeros((rows.shape[0], shards.shape[1]), dtype=np.uint8)
+        for row, coefficients in enumerate(rows):
+            for column, coefficient in enumerate(coefficients):
+                if coefficient:
+                    result[row] ^= MUL[coefficient][shards[column]]
+        return result
+
+    def split(self, buffer: FileBuffer) -> np.ndarray:
+        """
+        Data fragments of a buffer, the last one zero padded.
+        """
+        size = -(-len(buffer) // self.data) if len(buffer) else 0
+        shards = np.zeros(self.data * size, dtype=np.uint8)
+        end = len(buffer)
+        shards[:end] = np.frombuffer(buffer, dtype=np.uint8)
+        return shards.reshape(self.data, size)
+
+    def encode(self, shards: np.ndarray) -> np.ndarray:
+        """
+        All fragments, the data fragments followed by the parity computed from them.
+        """
+        return np.concatenate([shards, self._combine(self.parity_rows, shards)])
+
+    def decode(self, shards: Dict[int, np.ndarray]) -> np.ndarray:
+        """
+        Data fragments from any data fragments of the fragments by index.
+        """
+        if len(shards) < self.data:
+            raise ValueError(f"Decoding needs {self.data} fragments, got {len(shards)}")
+        indices = sorted(shards)[: self.data]
+        if indices == list(range(self.data)):
+            return np.stack([shards[index] for index in indices])
+        inverse = self._invert(self.matrix[indices])
+        return self._combine(inverse, np.stack([shards[index] for index in indices]))
+
+    def _invert(self, matrix: np.ndarray) -> np.ndarray:
+        size = len(matrix)
+        rows: List[List[int]] = [
+            [int(value) for value in row] + [int(row_index == column) for column in range(size)]
+            for row_index, row in enumerate(matrix)
+        ]
+        for column in range(size):
+            pivot = next(row for row in range(column, size) if rows[row][column])
+            rows[column], rows[pivot] = rows[pivot], rows[column]
+            scale = INVERSE[rows[column][column]]
+            rows[column] = [int(MUL[scale][value]) for value in rows[column]]
+            for row in range(size):
+                factor = rows[row][column]
+                if row != column and factor:
+                    rows[row] = [value ^ int(MUL[factor][pivoted]) for value, pivoted in zip(rows[row], rows[column])]
+        return np.array([row[size:] for row in rows], dtype=np.uint8)
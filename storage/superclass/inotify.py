@@ -0,0 +1,85 @@
+"""
+Linux inotify through ctypes, to watch directories for changes without scanning them.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from typing import List, NamedTuple, Optional
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# Watch descriptor, mask, cookie and length of the name following each event
+EVENT = struct.Struct("iIII")
+
+# Bytes read per call, enough for many events with names up to the maximum length
+READ_SIZE: int = 64 * 1024
+
+
+class InotifyEvent(NamedTuple):
+    watch: int
+    mask: int
+    name: str
+
+
+class Inotify:
+    """
+    Raises OSError where inotify is unavailable, callers fall back to polling.
+    """
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self._init = libc.inotify_init1
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+        except AttributeError as e:
+            raise OSError("inotify is not available") from e
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd: int = self._init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add(self, path: str, mask: int) -> int:
+        watch = self._add_watch(self.fd, os.fsencode(path), mask)
+        if watch < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return watch
+
+    def remove(self, watch: int) -> None:
+        # Fails for watches the kernel already dropped, which is what was asked for
+        self._rm_watch(self.fd, watch)
+
+    def read(self, timeout: Optional[float] = None) -> List[InotifyEvent]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            watch, mask, _, length = EVENT.unpack_from(buffer, offset)
+            offset += EVENT.size
+            end = offset + length
+            name = os.fsdecode(buffer[offset:end].rstrip(b"\0"))
+            offset = end
+            events.append(InotifyEvent(watch, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
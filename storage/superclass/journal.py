@@ -0,0 +1,89 @@
+"""
+Append-only journal of data entries stored as one JSON document per line.
+"""
+import os
+from pathlib import Path
+from typing import BinaryIO, Generic, Iterator, Type, TypeVar
+
+from datamodel.data.model import Data
+
+T = TypeVar("T", bound=Data)
+
+# Block size for scanning backwards to the last complete entry
+SCAN_SIZE: int = 64 * 1024
+
+
+class Journal(Generic[T]):
+    """
+    Entries are appended with a single write so a crash can only leave the last line incomplete.
+    An incomplete last line is skipped when reading and cut off before the next append.
+    """
+
+    def __init__(self, path: Path, model: Type[T]) -> None:
+        self.path: Path = path
+        self.model: Type[T] = model
+
+    def append(self, *entries: T) -> None:
+        if not entries:
+            return
+        encoded = "".join(f"{entry.to_json()}\n" for entry in entries).encode()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as handle:
+            self._recover(handle)
+            handle.write(encoded)
+
+    def _recover(self, handle: BinaryIO) -> None:
+        end = handle.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        with open(self.path, "rb") as reader:
+            # Scan backwards for the newline terminating the last complete entry
+            position = end
+            while position > 0:
+                start = max(0, position - SCAN_SIZE)
+                reader.seek(start)
+                block = reader.read(position - start)
+                if position == end and block.endswith(b"\n"):
+                    return
+                index = block.rfind(b"\n")
+                if index != -1:
+                    handle.truncate(start + index + 1)
+                    return
+                position = start
+        handle.truncate(0)
+
+    def __iter__(self) -> Iterator[T]:
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as handle:
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                yield self.model.from_raw(line)
+
+    def size(self) -> int:
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def rotate(self, suffix: str = ".1") -> "Journal[T]":
+        """
+        Move current entries aside to a sibling journal, new appends start an empty journal.
+        """
+        rotated = Journal(self.path.with_name(self.path.name + suffix), self.model)
+        if self.path.exists():
+            self.path.replace(rotated.path)
+        return rotated
+
+    def replace(self, *entries: T) -> None:
+        """
+        Swap the journal for one holding only the given entries, in a single rename.
+        """
+        if not entries:
+            self.clear()
+            return
+        temporary = Journal(self.path.with_name(self.path.name + ".tmp"), self.model)
+        temporary.clear()
+        temporary.append(*entries)
+        temporary.path.replace(self.path)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,74 @@
+"""
+Walks of several clients merged into the walk order of a single one, so merged listings resume after a key.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage.interface.client import StorageClientInterface
+from storage.models.object.path import StorageKey
+
+# Characters valid in paths that order before the separator, the only ones where path and walk order differ
+BEFORE_SEPARATOR = "-."
+
+Listed = Tuple[StorageClientInterface, StorageKey]
+
+
+def is_folder(client: StorageClientInterface, key: StorageKey) -> bool:
+    # Folders list what is below them, files list nothing
+    return next(iter(client.walk(key, depth=0)), None) is not None
+
+
+def order(client: StorageClientInterface, key: StorageKey) -> str:
+    """
+    Token a walk resumes after to continue past the key, the path of a file or that of a folder plus a slash.
+    """
+    path = str(key.path)
+    return f"{path}/" if is_folder(client, key) else path
+
+
+def _continues(path: str, prefix: str) -> bool:
+    return len(path) > len(prefix) and path.startswith(prefix) and path[len(prefix)] in BEFORE_SEPARATOR
+
+
+def merge(walks: Iterable[Tuple[StorageClientInterface, Iterable[StorageKey]]]) -> Iterator[Listed]:
+    """
+    Keys of the walks in walk order along with the client listing them, a path in several is listed once by
+    the first. Paths are compared as they are, apart from where one continues another with a character that
+    orders before the separator, only then is the shorter one checked for being a folder.
+    """
+    clients: List[StorageClientInterface] = []
+    iterators: List[Iterator[StorageKey]] = []
+    for client, walk in walks:
+        clients.append(client)
+        iterators.append(iter(walk))
+    heads: List[Optional[StorageKey]] = [next(iterator, None) for iterator in iterators]
+    folders: Dict[Tuple[int, str], bool] = {}
+
+    def folder(index: int) -> bool:
+        path = str(heads[index].path)
+        if (index, path) not in folders:
+            folders[(index, path)] = is_folder(clients[index], heads[index])
+        return folders[(index, path)]
+
+    def before(index: int, other: int) -> bool:
+        path, other_path = str(heads[index].path), str(heads[other].path)
+        if _continues(other_path, path):
+            return not folder(index)
+        if _continues(path, other_path):
+            return folder(other)
+        return path < other_path
+
+    while True:
+        live = [index for index, head in enumerate(heads) if head is not None]
+        if not live:
+            return
+        first = live[0]
+        for index in live[1:]:
+            if before(index, first):
+                first = index
+        key = heads[first]
+        yield clients[first], key
+        # Walks listing the same path move past it together
+        for index in live:
+            if str(heads[index].path) == str(key.path):
+                folders.pop((index, str(key.path)), None)
+                heads[index] = next(iterators[index], None)
@@ -0,0 +1,50 @@
+"""
+Consistent hashing ring with virtual nodes, placing paths on named nodes.
+"""
+from bisect import bisect_right
+from hashlib import blake2b
+from typing import Dict, List, Tuple
+
+# Points on the ring per node of weight one
+VNODES: int = 128
+
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Every node owns the arcs ending in its points, a number of points proportional to its weight.
+    Adding or removing a node only moves the paths on the arcs it gains or loses.
+    """
+
+    def __init__(self, weights: Dict[str, float], vnodes: int = VNODES):
+        if not weights:
+            raise ValueError("Hash ring needs at least one node")
+        self.weights: Dict[str, float] = dict(weights)
+        self.vnodes: int = vnodes
+        points: List[Tuple[int, str]] = []
+        for node, weight in self.weights.items():
+            # Every node keeps at least one point, however small its weight
+            for replica in range(max(1, round(vnodes * weight))):
+                points.append((ring_hash(f"{node}#{replica}"), node))
+        points.sort()
+        self.points: List[int] = [point for point, _ in points]
+        self.owners: List[str] = [node for _, node in points]
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self.weights)
+
+    def owner(self, path: str) -> str:
+        index = bisect_right(self.points, ring_hash(path))
+        return self.owners[index % len(self.owners)]
+
+    def with_node(self, node: str, weight: float = 1.0) -> "HashRing":
+        return HashRing({**self.weights, node: weight}, self.vnodes)
+
+    def without_node(self, node: str) -> "HashRing":
+        if node not in self.weights:
+            raise KeyError(f"Node '{node}' is not on the ring")
+        return HashRing({name: weight for name, weight in self.weights.items() if name != node}, self.vnodes)
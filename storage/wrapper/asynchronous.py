@@ -0,0 +1,228 @@
+"""
+Asynchronous versions of the storage wrappers, independent requests to wrapped clients run concurrently.
+"""
+import asyncio
+import inspect
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from storage.interface.asynchronous import AsyncStorageClientInterface
+from storage.models.client.key import StorageClientKey
+from storage.models.client.medium import Medium
+from storage.models.object.file.data import FileData
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey
+from storage.superclass.ring import VNODES, HashRing
+
+AsyncCallback = Callable[[StorageKey], Union[None, Awaitable[None]]]
+
+
+class AsyncStorageWrapper(AsyncStorageClientInterface):
+    def __init__(self, wrapped: AsyncStorageClientInterface):
+        self.wrapped: AsyncStorageClientInterface = wrapped
+        self.RESERVED = wrapped.RESERVED  # pylint: disable=invalid-name
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}:{repr(self.wrapped)}"
+
+    async def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        return await self.wrapped.get(key, offset, length)
+
+    async def stat(self, key: StorageKey) -> Object:
+        return await self.wrapped.stat(key)
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        return await self.wrapped.put(obj, data)
+
+    async def remove(self, key: StorageKey) -> None:
+        return await self.wrapped.remove(key)
+
+    async def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        return await self.wrapped.list(prefix, recursive)
+
+    async def exists(self, key: StorageKey) -> bool:
+        return await self.wrapped.exists(key)
+
+    @property
+    def name(self) -> StorageClientKey:
+        return self.wrapped.name
+
+    @property
+    def medium(self) -> Medium:
+        return self.wrapped.medium
+
+
+class AsyncSafetyWrapper(AsyncStorageWrapper):
+    def _check(self, key: StorageKey) -> None:
+        if key.path in self.RESERVED:
+            raise KeyError(f"Key '{key}' is reserved")
+
+    async def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        self._check(key)
+        return await self.wrapped.get(key, offset, length)
+
+    async def stat(self, key: StorageKey) -> Object:
+        self._check(key)
+        return await self.wrapped.stat(key)
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        self._check(obj.key)
+        return await self.wrapped.put(obj, data)
+
+    async def remove(self, key: StorageKey) -> None:
+        self._check(key)
+        return await self.wrapped.remove(key)
+
+    async def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        wrapped = await self.wrapped.list(prefix, recursive)
+        return [key for key in wrapped if key.path not in self.RESERVED]
+
+    async def exists(self, key: StorageKey) -> bool:
+        if key.path in self.RESERVED:
+            return False
+        return await self.wrapped.exists(key)
+
+
+class AsyncOverlayWrapper(AsyncStorageWrapper):
+    def __init__(
+        self,
+        wrapped: AsyncStorageClientInterface,
+        overlay: AsyncStorageClientInterface,
+        symmetric: bool = False,
+    ):
+        super().__init__(wrapped)
+        self.overlay: AsyncStorageClientInterface = overlay
+        self.symmetric: bool = symmetric
+
+    # Both memberships are checked at once, the overlay takes precedence
+    async def _locate(self, key: StorageKey) -> AsyncStorageClientInterface:
+        in_overlay, in_wrapped = await asyncio.gather(self.overlay.exists(key), self.wrapped.exists(key))
+        if in_overlay:
+            return self.overlay
+        if in_wrapped:
+            return self.wrapped
+        raise KeyError(f"Key '{key}' does not exist")
+
+    async def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        client = await self._locate(key)
+        return await client.get(key, offset, length)
+
+    async def stat(self, key: StorageKey) -> Object:
+        client = await self._locate(key)
+        return await client.stat(key)
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        if self.symmetric:
+            await asyncio.gather(self.wrapped.put(obj, data), self.overlay.put(obj, data))
+            return
+        await self.overlay.put(obj, data)
+
+    async def remove(self, key: StorageKey) -> None:
+        client = await self._locate(key)
+        await client.remove(key)
+
+    async def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        overlay, wrapped = await asyncio.gather(
+            self.overlay.list(prefix, recursive), self.wrapped.list(prefix, recursive)
+        )
+        return list(set(overlay + wrapped))
+
+    async def exists(self, key: StorageKey) -> bool:
+        results = await asyncio.gather(self.overlay.exists(key), self.wrapped.exists(key))
+        return any(results)
+
+
+class AsyncReplicationWrapper(AsyncStorageWrapper):
+    def __init__(self, wrapped: AsyncStorageClientInterface, replica: AsyncStorageClientInterface):
+        super().__init__(wrapped)
+        self.replica: AsyncStorageClientInterface = replica
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        copy_name = StorageKey(storage=self.replica.name, path=obj.key.path)
+        copy_obj = Object(key=copy_name, metadata=obj.metadata, item=obj.item)
+        await asyncio.gather(self.wrapped.put(obj, data), self.replica.put(copy_obj, data))
+
+    async def remove(self, key: StorageKey) -> None:
+        copy_name = StorageKey(storage=self.replica.name, path=key.path)
+        await asyncio.gather(self.wrapped.remove(key), self.replica.remove(copy_name))
+
+
+class AsyncShardedWrapper(AsyncStorageWrapper):
+    """
+    Objects are placed on the wrapped client and the shards by their path on a consistent hashing ring, as the
+    blocking sharding wrapper places them. Keys of any of them are accepted, listings are merged and use the name
+    of the wrapped client. Shards are fixed for the lifetime of the wrapper, keys are never moved between them.
+    """
+
+    def __init__(
+        self,
+        wrapped: AsyncStorageClientInterface,
+        shards: Union[AsyncStorageClientInterface, List[AsyncStorageClientInterface]],
+        vnodes: int = VNODES,
+    ):
+        super().__init__(wrapped)
+        if not isinstance(shards, list):
+            shards = [shards]
+        self.shards: Dict[str, AsyncStorageClientInterface] = {
+            str(client.name): client for client in [wrapped, *shards]
+        }
+        self.ring: HashRing = HashRing({name: 1.0 for name in self.shards}, vnodes)
+
+    def _key(self, key: StorageKey, client: AsyncStorageClientInterface) -> StorageKey:
+        if str(key.storage) not in self.shards:
+            raise ValueError(f"Key {key} does not belong to this shard")
+        return StorageKey(storage=client.name, path=key.path)
+
+    def _route(self, key: StorageKey) -> Tuple[AsyncStorageClientInterface, StorageKey]:
+        client = self.shards[self.ring.owner(str(key.path))]
+        return client, self._key(key, client)
+
+    async def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        client, key = self._route(key)
+        return await client.get(key, offset, length)
+
+    async def stat(self, key: StorageKey) -> Object:
+        client, key = self._route(key)
+        return await client.stat(key)
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        client, key = self._route(obj.key)
+        return await client.put(Object(key=key, metadata=obj.metadata, item=obj.item), data)
+
+    async def remove(self, key: StorageKey) -> None:
+        client, key = self._route(key)
+        return await client.remove(key)
+
+    # Folders exist on several shards, each is listed once
+    async def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        clients = list(self.shards.values())
+        listed = await asyncio.gather(*(client.list(self._key(prefix, client), recursive) for client in clients))
+        paths = {str(key.path): key.path for keys in listed for key in keys}
+        return [StorageKey(storage=self.wrapped.name, path=paths[path]) for path in sorted(paths)]
+
+    async def exists(self, key: StorageKey) -> bool:
+        client, key = self._route(key)
+        return await client.exists(key)
+
+
+class AsyncWatchingWrapper(AsyncStorageWrapper):
+    def __init__(self, wrapped: AsyncStorageClientInterface):
+        super().__init__(wrapped)
+        self.callbacks: Dict[StorageKey, AsyncCallback] = {}
+
+    def watch(self, key: StorageKey, callback: AsyncCallback) -> None:
+        self.callbacks[key] = callback
+
+    async def _notify(self, key: StorageKey) -> None:
+        if key not in self.callbacks:
+            return
+        result = self.callbacks[key](key)
+        if inspect.isawaitable(result):
+            await result
+
+    async def put(self, obj: Object, data: FileData) -> None:
+        await self.wrapped.put(obj, data)
+        await self._notify(obj.key)
+
+    async def remove(self, key: StorageKey) -> None:
+        await self.wrapped.remove(key)
+        await self._notify(key)
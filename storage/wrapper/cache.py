@@ -0,0 +1,251 @@
+"""
+This wrapper caches object data in memory and optionally on a local disk, in front of slower storage.
+"""
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from storage.interface.client import MISSING, StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey
+from storage.models.wrapper.cache import CacheStatistics
+from storage.wrapper.interface import StorageWrapper
+
+# Default memory budget for cached data
+MEMORY_BYTES: int = 256 * 1024 * 1024
+
+# Seconds an entry is served without asking the wrapped client whether it changed
+VALIDITY: float = 5.0
+
+
+class Entry(NamedTuple):
+    signature: str
+    validated: float  # Monotonic time the entry was last known to match the wrapped object
+    data: FileData
+    on_disk: bool
+
+
+class CacheWrapper(StorageWrapper):
+    """
+    Entries are served as they are for 'ttl' seconds after being validated, then checked against the content hash
+    in the header of the wrapped object, so changes made elsewhere are noticed within that time.
+    Writes through the wrapper drop the entries they replace at once.
+    Objects stored without a content hash, as by S3, are validated by their size and modification time instead,
+    which misses a change keeping the size within the resolution of the stored time.
+    """
+
+    def __init__(
+        self,
+        wrapped: StorageClientInterface,
+        disk: Optional[StorageClientInterface] = None,
+        memory_bytes: int = MEMORY_BYTES,
+        disk_bytes: Optional[int] = None,
+        ttl: float = VALIDITY,
+    ):
+        super().__init__(wrapped)
+        self.disk: Optional[StorageClientInterface] = disk
+        self.memory_bytes: int = memory_bytes
+        self.disk_bytes: Optional[int] = disk_bytes
+        self.ttl: float = ttl
+        # Objects larger than this bypass the memory tier instead of flushing it
+        self.entry_bytes: int = memory_bytes // 4
+        self.memory: OrderedDict[StorageKey, Tuple[str, float, FileData]] = OrderedDict()
+        self.memory_used: int = 0
+        # Size, content hash and validation time of the disk copies written by this wrapper
+        self.disk_entries: OrderedDict[StorageKey, Tuple[int, str, float]] = OrderedDict()
+        self.disk_used: int = 0
+        self.statistics: CacheStatistics = CacheStatistics()
+        self.cache_lock = Lock()
+
+    def _signature(self, key: StorageKey) -> Tuple[Optional[str], int]:
+        obj = self.__wrapped__.stat(key)
+        if not obj.is_file():
+            return None, 0
+        size = obj.item.content.size.raw_bytes
+        if obj.item.content.signature is None:
+            return f"{size}@{obj.metadata.access.modified.isoformat()}", size
+        return obj.item.content.signature.signature, size
+
+    def _disk_key(self, key: StorageKey) -> StorageKey:
+        return StorageKey(storage=self.disk.name, path=key.path)
+
+    def _lookup(self, key: StorageKey) -> Optional[Entry]:
+        with self.cache_lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                return Entry(*entry, on_disk=False)
+        if self.disk is None:
+            return None
+        disk_key = self._disk_key(key)
+        with self.cache_lock:
+            known = self.disk_entries.get(disk_key)
+        if known is not None:
+            _, signature, validated = known
+        else:
+            # Copies left by an earlier run are hashed when written, but must be validated before use
+            try:
+                cached = self.disk.stat(disk_key)
+            except MISSING:
+                return None
+            if cached.item.content.signature is None:
+                return None
+            signature, validated = cached.item.content.signature.signature, float("-inf")
+        try:
+            data = self.disk.get(disk_key)
+        except MISSING:
+            return None
+        with self.cache_lock:
+            if disk_key in self.disk_entries:
+                self.disk_entries.move_to_end(disk_key)
+        return Entry(signature, validated, data, on_disk=True)
+
+    def _hit(self, key: StorageKey, entry: Entry, validated: float) -> FileData:
+        with self.cache_lock:
+            if entry.on_disk:
+                self.statistics.disk_hits += 1
+            else:
+                self.statistics.memory_hits += 1
+            disk_key = None if self.disk is None else self._disk_key(key)
+            if disk_key in self.disk_entries:
+                size, signature, _ = self.disk_entries[disk_key]
+                self.disk_entries[disk_key] = (size, signature, validated)
+        self._remember(key, entry.signature, validated, entry.data)
+        return entry.data
+
+    def _remember(self, key: StorageKey, signature: str, validated: float, data: FileData) -> None:
+        if len(data) > self.entry_bytes:
+            return
+        with self.cache_lock:
+            previous = self.memory.pop(key, None)
+            if previous is not None:
+                self.memory_used -= len(previous[2])
+            self.memory[key] = (signature, validated, data)
+            self.memory_used += len(data)
+            while self.memory_used > self.memory_bytes:
+                _, (_, _, evicted) = self.memory.popitem(last=False)
+                self.memory_used -= len(evicted)
+                self.statistics.evictions += 1
+
+    def _store(self, entries: List[Tuple[StorageKey, str, FileData]], validated: float) -> None:
+        for key, signature, data in entries:
+            self._remember(key, signature, validated, data)
+        if self.disk is None or not entries:
+            return
+        copies = [Object.create_file(self._disk_key(key), data) for key, _, data in entries]
+        self.disk.put_many(copies)
+        evicted = []
+        with self.cache_lock:
+            for (obj, data), (_, signature, _) in zip(copies, entries):
+                self.disk_used += len(data) - self.disk_entries.pop(obj.key, (0,))[0]
+                self.disk_entries[obj.key] = (len(data), signature, validated)
+            while self.disk_bytes is not None and self.disk_used > self.disk_bytes and len(self.disk_entries) > 1:
+                oldest, (size, _, _) = self.disk_entries.popitem(last=False)
+                self.disk_used -= size
+                evicted.append(oldest)
+        if evicted:
+            self.disk.remove_many(evicted)
+
+    def _invalidate(self, keys: List[StorageKey]) -> None:
+        dropped = []
+        with self.cache_lock:
+            for key in keys:
+                entry = self.memory.pop(key, None)
+                if entry is not None:
+                    self.memory_used -= len(entry[2])
+                    self.statistics.invalidations += 1
+                if self.disk is None:
+                    continue
+                disk_key = self._disk_key(key)
+                if disk_key in self.disk_entries:
+                    self.disk_used -= self.disk_entries.pop(disk_key)[0]
+                    dropped.append(disk_key)
+        # Untracked copies are left, they are validated before they are used
+        if dropped:
+            self.disk.remove_many(dropped)
+
+    def _fetch(self, key: StorageKey) -> Optional[FileData]:
+        """
+        Whole object from the cache, or read through into it, None when it should not be cached.
+        """
+        entry = self._lookup(key)
+        now = time.monotonic()
+        if entry is not None and now - entry.validated < self.ttl:
+            return self._hit(key, entry, entry.validated)
+        signature, size = self._signature(key)
+        if entry is not None:
+            with self.cache_lock:
+                self.statistics.revalidations += 1
+            if entry.signature == signature:
+                return self._hit(key, entry, now)
+            self._invalidate([key])
+        with self.cache_lock:
+            self.statistics.misses += 1
+        if signature is None or size > self.entry_bytes:
+            return None
+        data = self.__wrapped__.get(key)
+        self._store([(key, signature, data)], now)
+        return data
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        data = self._fetch(key)
+        if data is None:
+            return self.__wrapped__.get(key, offset, length)
+        stop = len(data) if length is None else offset + length
+        return data[offset:stop]
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        data = self._fetch(key)
+        if data is None:
+            yield from self.__wrapped__.get_stream(key, chunk_size, offset, length)
+            return
+        stop = len(data) if length is None else min(len(data), offset + length)
+        for start in range(offset, stop, chunk_size):
+            end = min(start + chunk_size, stop)
+            yield data[start:end]
+
+    # Entries past their validity are read again with the misses rather than revalidated one by one
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        now = time.monotonic()
+        results: Dict[StorageKey, FileData] = {}
+        missing = []
+        for key in keys:
+            entry = self._lookup(key)
+            if entry is not None and now - entry.validated < self.ttl:
+                results[key] = self._hit(key, entry, entry.validated)
+            else:
+                missing.append(key)
+        if missing:
+            fetched = self.__wrapped__.get_many(missing)
+            with self.cache_lock:
+                self.statistics.misses += len(missing)
+            # Hashed here as the batch has no headers, the same hash the header of a fingerprinted object holds
+            entries = [(key, sha256(data).hexdigest(), data) for key, data in fetched.items()]
+            self._store([entry for entry in entries if len(entry[2]) <= self.entry_bytes], now)
+            results.update(fetched)
+        return {key: results[key] for key in keys}
+
+    def put(self, obj: Object, data: FileData) -> None:
+        self._invalidate([obj.key])
+        self.__wrapped__.put(obj, data)
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        self._invalidate([obj.key])
+        self.__wrapped__.put_stream(obj, stream)
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        self._invalidate([obj.key for obj, _ in items])
+        self.__wrapped__.put_many(items)
+
+    def remove(self, key: StorageKey) -> None:
+        self._invalidate([key])
+        self.__wrapped__.remove(key)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        self._invalidate(keys)
+        self.__wrapped__.remove_many(keys)
@@ -0,0 +1,249 @@
+"""
+This wrapper compresses objects on the way in and decompresses them on the way out.
+"""
+import gzip
+import struct
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import lz4.frame
+from pydantic import ByteSize
+
+from storage.interface.client import StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileBuffer, FileData, FileStream
+from storage.models.object.file.info import CompressionAlgorithm, ObjectInfo
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey
+from storage.models.wrapper.compression import CompressionPolicy
+from storage.superclass.chunking import frames
+from storage.wrapper.interface import StorageWrapper
+
+# Raw bytes compressed independently, the most a ranged read decompresses beyond what it asked for
+FRAME_SIZE: int = 1024 * 1024
+
+# Stored data starts with a header and the compressed size of every frame, so it decodes without its metadata
+MAGIC: bytes = b"VCF1"
+HEADER = struct.Struct("<4sBIIQ")  # Magic, algorithm, raw bytes per frame, frame count, raw bytes
+FRAME_ENTRY = struct.Struct("<I")
+ALGORITHMS: List[Optional[CompressionAlgorithm]] = [None, CompressionAlgorithm.LZ4, CompressionAlgorithm.GZIP]
+
+# Stored bytes read first, covering the header and frame sizes of objects up to tens of gigabytes
+PREFIX_BYTES: int = 64 * 1024
+
+# Compressed frames of a stream are kept in memory up to this size, then in a temporary file
+SPOOL_BYTES: int = 16 * 1024 * 1024
+
+
+def compress(algorithm: CompressionAlgorithm, data: FileBuffer) -> FileData:
+    if algorithm == CompressionAlgorithm.LZ4:
+        return lz4.frame.compress(data)
+    if algorithm == CompressionAlgorithm.GZIP:
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unsupported compression algorithm '{algorithm}'")
+
+
+def decompress(algorithm: CompressionAlgorithm, data: FileBuffer) -> FileData:
+    if algorithm == CompressionAlgorithm.LZ4:
+        return lz4.frame.decompress(data)
+    if algorithm == CompressionAlgorithm.GZIP:
+        return gzip.decompress(data)
+    raise ValueError(f"Unsupported compression algorithm '{algorithm}'")
+
+
+class Layout(NamedTuple):
+    algorithm: Optional[CompressionAlgorithm]
+    frame_bytes: int
+    raw_bytes: int
+    compressed_frames: List[int]
+    body: int  # Stored offset of the first frame
+
+
+def encode_header(algorithm: Optional[CompressionAlgorithm], frame_bytes: int, raw: int, sizes: List[int]) -> bytes:
+    table = b"".join(FRAME_ENTRY.pack(size) for size in sizes)
+    return HEADER.pack(MAGIC, ALGORITHMS.index(algorithm), frame_bytes, len(sizes), raw) + table
+
+
+def decode_header(prefix: FileBuffer) -> Tuple[Layout, int]:
+    """
+    Layout of stored data from its first bytes, along with the stored bytes the header takes up in total.
+    The frame sizes are only filled in when the prefix covers all of them.
+    """
+    if len(prefix) < HEADER.size:
+        raise ValueError("Stored data is too short for a compression header")
+    magic, algorithm, frame_bytes, count, raw = HEADER.unpack_from(prefix)
+    if magic != MAGIC or algorithm >= len(ALGORITHMS):
+        raise ValueError("Stored data has no valid compression header")
+    table = HEADER.size
+    body = table + count * FRAME_ENTRY.size
+    sizes = []
+    if len(prefix) >= body:
+        sizes = [size for (size,) in FRAME_ENTRY.iter_unpack(prefix[table:body])]
+    return Layout(ALGORITHMS[algorithm], frame_bytes, raw, sizes, body), body
+
+
+class CompressionWrapper(StorageWrapper):
+    """
+    Stored data is a header naming the algorithm and the compressed size of every frame, followed by the frames.
+    Objects left uncompressed get the header too, so every object written through the wrapper decodes on its own.
+    Stored objects also record the algorithm and their stored size, which usage is counted from.
+    """
+
+    def __init__(
+        self,
+        wrapped: StorageClientInterface,
+        policy: Optional[CompressionPolicy] = None,
+        frame_size: int = FRAME_SIZE,
+    ):
+        super().__init__(wrapped)
+        self.policy: CompressionPolicy = policy or CompressionPolicy()
+        self.frame_size: int = frame_size
+
+    def _stored(self, obj: Object, algorithm: Optional[CompressionAlgorithm], stored_bytes: int) -> Object:
+        stored = obj.model_copy(deep=True)
+        content: ObjectInfo = stored.item.content
+        content.compression = algorithm
+        content.size.compressed_bytes = ByteSize(stored_bytes)
+        return stored
+
+    def _compress(self, algorithm: CompressionAlgorithm, stream: Iterable[FileBuffer]) -> Iterator[FileData]:
+        for frame in frames(stream, self.frame_size):
+            yield compress(algorithm, frame)
+
+    def _layout(self, key: StorageKey) -> Tuple[Layout, FileData]:
+        """
+        Layout of the stored object along with the stored bytes read to find it, from its start.
+        """
+        prefix = self.__wrapped__.get(key, 0, PREFIX_BYTES)
+        layout, body = decode_header(prefix)
+        if len(prefix) < body:
+            prefix += self.__wrapped__.get(key, len(prefix), body - len(prefix))
+            layout, _ = decode_header(prefix)
+        return layout, prefix
+
+    @staticmethod
+    def _decode(stored: FileBuffer) -> FileData:
+        layout, _ = decode_header(stored)
+        position = layout.body
+        if layout.algorithm is None:
+            return bytes(stored[position:])
+        parts = []
+        for size in layout.compressed_frames:
+            end = position + size
+            parts.append(decompress(layout.algorithm, stored[position:end]))
+            position = end
+        return b"".join(parts)
+
+    @staticmethod
+    def _spans(layout: Layout, offset: int, length: Optional[int]) -> List[Tuple[int, int, int, int]]:
+        """
+        Frames covering the range, as the stored offset and size with the raw start and end within the frame.
+        """
+        stop = layout.raw_bytes if length is None else min(layout.raw_bytes, offset + length)
+        spans = []
+        position = layout.body
+        start = 0
+        for compressed in layout.compressed_frames:
+            end = start + layout.frame_bytes
+            if end > offset and start < stop:
+                spans.append((position, compressed, max(offset - start, 0), min(stop, end) - start))
+            position += compressed
+            start = end
+        return spans
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        layout, prefix = self._layout(key)
+        if layout.algorithm is None:
+            stop = layout.raw_bytes if length is None else min(layout.raw_bytes, offset + length)
+            if stop <= offset:
+                return b""
+            return self.__wrapped__.get(key, layout.body + offset, stop - offset)
+        spans = self._spans(layout, offset, length)
+        if not spans:
+            return b""
+        # Covered frames are contiguous, so they are fetched in one request unless read with the header already
+        first = spans[0][0]
+        last = spans[-1][0] + spans[-1][1]
+        data = prefix[first:last] if last <= len(prefix) else self.__wrapped__.get(key, first, last - first)
+        parts = []
+        for position, size, start, end in spans:
+            begin = position - first
+            finish = begin + size
+            frame = decompress(layout.algorithm, data[begin:finish])
+            parts.append(frame[start:end])
+        return b"".join(parts)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        layout, _ = self._layout(key)
+        if layout.algorithm is None:
+            stop = layout.raw_bytes if length is None else min(layout.raw_bytes, offset + length)
+            if stop > offset:
+                yield from self.__wrapped__.get_stream(key, chunk_size, layout.body + offset, stop - offset)
+            return
+        spans = self._spans(layout, offset, length)
+        if not spans:
+            return
+        # Covered frames are streamed in one request and cut back into frames by their sizes
+        first = spans[0][0]
+        stream = self.__wrapped__.get_stream(key, chunk_size, first, sum(size for _, size, _, _ in spans))
+        pending = bytearray()
+        for _, size, start, end in spans:
+            while len(pending) < size:
+                pending += next(stream)
+            frame = decompress(layout.algorithm, bytes(pending[:size]))
+            del pending[:size]
+            for piece in range(start, end, chunk_size):
+                stop = min(piece + chunk_size, end)
+                yield frame[piece:stop]
+
+    def _prepare(self, obj: Object, data: FileData) -> Tuple[Object, FileData]:
+        algorithm = self.policy.algorithm(obj)
+        compressed = [] if algorithm is None else list(self._compress(algorithm, [data]))
+        # Incompressible data is kept as is
+        if algorithm is None or sum(len(frame) for frame in compressed) >= len(data):
+            stored = encode_header(None, self.frame_size, len(data), []) + data
+            return self._stored(obj, None, len(stored)), stored
+        header = encode_header(algorithm, self.frame_size, len(data), [len(frame) for frame in compressed])
+        stored = b"".join([header, *compressed])
+        return self._stored(obj, algorithm, len(stored)), stored
+
+    def put(self, obj: Object, data: FileData) -> None:
+        self.__wrapped__.put(*self._prepare(obj, data))
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        algorithm = self.policy.algorithm(obj)
+        stored = self._stored(obj, algorithm, 0)
+        self.__wrapped__.put_stream(stored, self._spooled(obj, stored, algorithm, stream))
+
+    def _spooled(
+        self, obj: Object, stored: Object, algorithm: Optional[CompressionAlgorithm], stream: FileStream
+    ) -> FileStream:
+        """
+        Frames are compressed into a spool first, as the header in front of them lists all their sizes.
+        """
+        sizes = []
+        raw = 0
+        with SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+            for frame in frames(stream, self.frame_size):
+                raw += len(frame)
+                data = frame if algorithm is None else compress(algorithm, frame)
+                if algorithm is not None:
+                    sizes.append(len(data))
+                spool.write(data)
+            header = encode_header(algorithm, self.frame_size, raw, sizes)
+            # Streamed objects only have their content information once consumed
+            content: ObjectInfo = stored.item.content
+            content.size.raw_bytes = ByteSize(raw)
+            content.size.compressed_bytes = ByteSize(len(header) + spool.tell())
+            content.mime_type = obj.item.content.mime_type
+            content.signature = obj.item.content.signature
+            yield header
+            spool.seek(0)
+            yield from iter(lambda: spool.read(CHUNK_SIZE), b"")
+
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        return {key: self._decode(stored) for key, stored in self.__wrapped__.get_many(keys).items()}
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        self.__wrapped__.put_many([self._prepare(obj, data) for obj, data in items])
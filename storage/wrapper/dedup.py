@@ -0,0 +1,246 @@
+"""
+This wrapper stores objects as content-defined chunks, keeping each unique chunk once.
+"""
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from hashlib import sha256
+from threading import Lock
+from typing import ContextManager, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+
+from storage.interface.client import MISSING, PAGE_SIZE, StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileBuffer, FileData, FileStream
+from storage.models.object.file.info import ObjectInfo
+from storage.models.object.metadata import Metadata
+from storage.models.object.models import File, Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.dedup import Chunk, ChunkReferences, Manifest
+from storage.superclass.chunking import Chunker
+from storage.wrapper.interface import StorageWrapper
+
+CHUNKS = "._chunks"
+
+# Reference counts and manifests are guarded per stripe of digests and paths rather than by one lock
+STRIPES: int = 64
+
+
+class DedupWrapper(StorageWrapper):
+    """
+    Objects are replaced by a manifest of chunk digests, chunks live under '._chunks' with a reference count.
+    Counts are records of their own, read directly so they do not depend on directory headers.
+    """
+
+    def __init__(self, wrapped: StorageClientInterface, chunker: Optional[Chunker] = None):
+        super().__init__(wrapped)
+        self.chunker: Chunker = chunker or Chunker()
+        self.reference_locks: List[Lock] = [Lock() for _ in range(STRIPES)]
+        # Held from reading the previous manifest until its references are released, always before reference locks
+        self.manifest_locks: List[Lock] = [Lock() for _ in range(STRIPES)]
+
+    def _chunk_key(self, digest: str) -> StorageKey:
+        path = StoragePath(path=f"{CHUNKS}/{digest[:2]}/{digest}")
+        return StorageKey(storage=self.__wrapped__.name, path=path)
+
+    def _references_key(self, digest: str) -> StorageKey:
+        path = StoragePath(path=f"{CHUNKS}/{digest[:2]}/{digest}.refs")
+        return StorageKey(storage=self.__wrapped__.name, path=path)
+
+    def _internal(self, key: StorageKey) -> bool:
+        return key.path.parts[0] == CHUNKS
+
+    def _manifest(self, key: StorageKey) -> Manifest:
+        return Manifest.from_raw(self.__wrapped__.get(key))
+
+    def _previous(self, key: StorageKey) -> Optional[Manifest]:
+        try:
+            return self._manifest(key)
+        except MISSING:
+            return None
+        except ValueError:
+            # Written before the wrapper was, it holds no chunk references
+            return None
+
+    @staticmethod
+    @contextmanager
+    def _striped(locks: List[Lock], stripes: Iterable[int]) -> Generator[None, None, None]:
+        with ExitStack() as stack:
+            for stripe in sorted(set(stripes)):
+                stack.enter_context(locks[stripe])
+            yield
+
+    def _locked(self, digests: Iterable[str]) -> ContextManager[None]:
+        return self._striped(self.reference_locks, (int(digest[:2], 16) % STRIPES for digest in digests))
+
+    def _replacing(self, keys: Iterable[StorageKey]) -> ContextManager[None]:
+        return self._striped(self.manifest_locks, (hash(str(key.path)) % STRIPES for key in keys))
+
+    def _count(self, digest: str) -> int:
+        try:
+            return ChunkReferences.from_raw(self.__wrapped__.get(self._references_key(digest))).count
+        except MISSING:
+            return 0
+
+    def _references(self, digest: str, count: int) -> Tuple[Object, FileData]:
+        encoded = ChunkReferences(count=count).to_json().encode()
+        return Object.create_file(self._references_key(digest), encoded, fingerprint=False)
+
+    def _acquire(self, chunks: Dict[str, FileBuffer], added: Counter) -> None:
+        """
+        Count references to the chunks, storing those not stored yet.
+        """
+        with self._locked(added):
+            counts = {digest: self._count(digest) for digest in added}
+            # Chunks are written under the lock so they exist before any manifest can point to them
+            new = [
+                Object.create_file(self._chunk_key(digest), bytes(chunks[digest]), fingerprint=False)
+                for digest, count in counts.items()
+                if count == 0
+            ]
+            if new:
+                self.__wrapped__.put_many(new)
+            self.__wrapped__.put_many([self._references(digest, counts[digest] + added[digest]) for digest in added])
+
+    def _release(self, removed: Counter) -> None:
+        """
+        Drop references to the chunks, removing those no longer referenced.
+        """
+        if not removed:
+            return
+        with self._locked(removed):
+            counts = {digest: self._count(digest) for digest in removed}
+            kept = [
+                self._references(digest, count - removed[digest])
+                for digest, count in counts.items()
+                if count > removed[digest]
+            ]
+            unreferenced = [
+                key
+                for digest, count in counts.items()
+                if 0 < count <= removed[digest]
+                for key in (self._chunk_key(digest), self._references_key(digest))
+            ]
+            if kept:
+                self.__wrapped__.put_many(kept)
+            if unreferenced:
+                self.__wrapped__.remove_many(unreferenced)
+
+    def _split(self, data: FileBuffer) -> Tuple[List[Chunk], Dict[str, FileBuffer]]:
+        chunks: List[Chunk] = []
+        unique: Dict[str, FileBuffer] = {}
+        for chunk in self.chunker.split(data):
+            digest = sha256(chunk).hexdigest()
+            unique.setdefault(digest, chunk)
+            chunks.append(Chunk(digest=digest, size=chunk.nbytes))
+        return chunks, unique
+
+    @staticmethod
+    def _content(obj: Object) -> ObjectInfo:
+        if not obj.is_file():
+            raise ValueError("Object is not a file")
+        return obj.item.content
+
+    def _manifest_file(self, obj: Object, chunks: List[Chunk]) -> Tuple[Object, FileData]:
+        manifest = Manifest(content=self._content(obj), chunks=chunks)
+        return Object.create_file(obj.key, manifest.to_json().encode(), fingerprint=False)
+
+    @staticmethod
+    def _digests(manifests: Iterable[Optional[Manifest]]) -> Counter:
+        return Counter(chunk.digest for manifest in manifests if manifest is not None for chunk in manifest.chunks)
+
+    def _ranges(self, manifest: Manifest, offset: int, length: Optional[int]) -> List[Tuple[StorageKey, int, int]]:
+        """
+        Chunks overlapping the requested range, with the start and end of the overlap within each.
+        """
+        stop = None if length is None else offset + length
+        ranges = []
+        position = 0
+        for chunk in manifest.chunks:
+            end = position + chunk.size
+            if end > offset and (stop is None or position < stop):
+                last = chunk.size if stop is None else min(stop, end) - position
+                ranges.append((self._chunk_key(chunk.digest), max(offset - position, 0), last))
+            position = end
+        return ranges
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        ranges = self._ranges(self._manifest(key), offset, length)
+        chunks = self.__wrapped__.get_many(list({chunk for chunk, _, _ in ranges}))
+        return b"".join(chunks[chunk][start:end] for chunk, start, end in ranges)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        for chunk, start, end in self._ranges(self._manifest(key), offset, length):
+            data = self.__wrapped__.get(chunk, start, end - start)
+            for position in range(0, len(data), chunk_size):
+                stop = position + chunk_size
+                yield data[position:stop]
+
+    def put(self, obj: Object, data: FileData) -> None:
+        self.put_many([(obj, data)])
+
+    # Chunks are stored as they are split, so only one chunk of the stream is held at a time
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        chunks: List[Chunk] = []
+        for data in self.chunker.split_stream(stream):
+            digest = sha256(data).hexdigest()
+            self._acquire({digest: data}, Counter([digest]))
+            chunks.append(Chunk(digest=digest, size=data.nbytes))
+        # Stream filled in the content information while being consumed
+        manifest = self._manifest_file(obj, chunks)
+        with self._replacing([obj.key]):
+            previous = self._previous(obj.key)
+            self.__wrapped__.put(*manifest)
+            self._release(self._digests([previous]))
+
+    def remove(self, key: StorageKey) -> None:
+        self.remove_many([key])
+
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        manifests = {key: Manifest.from_raw(raw) for key, raw in self.__wrapped__.get_many(keys).items()}
+        ranges = {key: self._ranges(manifest, 0, None) for key, manifest in manifests.items()}
+        chunks = self.__wrapped__.get_many(list({chunk for spans in ranges.values() for chunk, _, _ in spans}))
+        return {key: b"".join(chunks[chunk][start:end] for chunk, start, end in ranges[key]) for key in keys}
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        # Later writes of a key replace earlier ones in the batch
+        by_path = {str(obj.key.path): (obj, data) for obj, data in items}
+        manifests = []
+        unique: Dict[str, FileBuffer] = {}
+        added: Counter = Counter()
+        for obj, data in by_path.values():
+            chunks, buffers = self._split(data)
+            unique.update(buffers)
+            added.update(chunk.digest for chunk in chunks)
+            manifests.append(self._manifest_file(obj, chunks))
+        if added:
+            self._acquire(unique, added)
+        # New chunks are referenced first, so a concurrent release of the same digests never drops them
+        with self._replacing(obj.key for obj, _ in by_path.values()):
+            previous = [self._previous(obj.key) for obj, _ in by_path.values()]
+            self.__wrapped__.put_many(manifests)
+            self._release(self._digests(previous))
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        with self._replacing(keys):
+            manifests = [Manifest.from_raw(raw) for raw in self.__wrapped__.get_many(keys).values()]
+            self.__wrapped__.remove_many(keys)
+            self._release(self._digests(manifests))
+
+    def stat(self, key: StorageKey) -> Object:
+        return Object(key=key, metadata=Metadata(), item=File(content=self._manifest(key).content))
+
+    def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
+        return [key for key in self.__wrapped__.list(prefix, recursive) if not self._internal(key)]
+
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        for key in self.__wrapped__.walk(prefix, depth, start_after):
+            if not self._internal(key):
+                yield key
+
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        keys, token = self.__wrapped__.list_page(prefix, recursive, token, limit)
+        return [key for key in keys if not self._internal(key)], token
@@ -0,0 +1,419 @@
+"""
+This wrapper splits objects into data and parity fragments stored on separate clients.
+"""
+import struct
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from queue import Queue
+from tempfile import SpooledTemporaryFile
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from storage.interface.client import StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey
+from storage.superclass.chunking import frames
+from storage.superclass.erasure import ReedSolomon
+from storage.wrapper.interface import StorageWrapper
+
+# Bytes of every fragment per stripe, part of the stored layout so it must not change
+FRAGMENT_BYTES: int = 256 * 1024
+
+# Generation of the write and raw size of the object in front of every fragment, so reads are sized without asking
+# for metadata and fragments left behind by an overwrite are never decoded along with newer ones
+HEADER = struct.Struct("<QQ")
+
+# Streamed objects are spooled in memory up to this size before spilling to disk, their size heads every fragment
+SPOOL_BYTES: int = 16 * 1024 * 1024
+
+# Encoded stripes waiting per fragment while streaming
+STREAM_DEPTH: int = 4
+
+
+class Version(NamedTuple):
+    generation: int
+    size: int
+    # Indices of the clients holding fragments of this generation, in order
+    holders: List[int]
+
+
+class ErasureCodingWrapper(StorageWrapper):
+    """
+    Objects are cut into stripes, each encoded into data fragments and parity fragments computed from them.
+    Fragment i of every object lives on client i, the wrapped client first, so any data count of them decode it.
+    Fragments found missing when reading are reconstructed on their client in the background.
+    Writes succeed once one more fragment than needed to decode is stored, listings come from the wrapped client.
+    Every fragment starts with the generation of its write and the raw size of the object. Reads decode the newest
+    generation enough clients hold, fragments of older ones are stale and rewritten like missing ones.
+    """
+
+    def __init__(self, wrapped: StorageClientInterface, fragments: List[StorageClientInterface], parity: int = 2):
+        super().__init__(wrapped)
+        self.targets: List[StorageClientInterface] = [wrapped, *fragments]
+        self.code: ReedSolomon = ReedSolomon(len(self.targets) - parity, parity)
+        self.write_quorum: int = min(len(self.targets), self.code.data + 1)
+        self.fetcher = ThreadPoolExecutor(max_workers=len(self.targets), thread_name_prefix=self.__class__.__name__)
+        self.rebuilder = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.__class__.__name__}-rebuild")
+        self.rebuilding: Set[str] = set()
+        self.rebuilding_lock = Lock()
+        self.generation_last: int = 0
+        self.generation_lock = Lock()
+
+    @property
+    def stripe_bytes(self) -> int:
+        return self.code.data * FRAGMENT_BYTES
+
+    def _key(self, key: StorageKey, target: StorageClientInterface) -> StorageKey:
+        return StorageKey(storage=target.name, path=key.path)
+
+    def _copy(self, obj: Object, target: StorageClientInterface) -> Object:
+        return Object(key=self._key(obj.key, target), metadata=obj.metadata, item=obj.item)
+
+    def _fragment_size(self, size: int) -> int:
+        stripes, remainder = divmod(size, self.stripe_bytes)
+        return stripes * FRAGMENT_BYTES - (-remainder // self.code.data)
+
+    def _generation(self) -> int:
+        # Nanoseconds since the epoch, so writes through other wrappers order by time as well
+        with self.generation_lock:
+            self.generation_last = max(time.time_ns(), self.generation_last + 1)
+            return self.generation_last
+
+    def _encode(self, stripe: FileData) -> np.ndarray:
+        return self.code.encode(self.code.split(stripe))
+
+    def _check(self, written: int, errors: Dict[int, Exception], obj: Object) -> None:
+        if written < self.write_quorum:
+            raise RuntimeError(f"Only {written} of {len(self.targets)} fragments of {obj.key} written: {errors}")
+        if errors:
+            self._schedule_rebuild(obj.key)
+
+    def _headers(self, key: StorageKey) -> Dict[int, Tuple[int, int]]:
+        """
+        Generation and raw size in the header of every fragment readable, by client index.
+        """
+
+        def header(index: int) -> Optional[Tuple[int, int]]:
+            target = self.targets[index]
+            try:
+                data = target.get(self._key(key, target), 0, HEADER.size)
+            except Exception:  # pylint: disable=broad-except
+                return None
+            return HEADER.unpack(data) if len(data) == HEADER.size else None
+
+        headers = self.fetcher.map(header, range(len(self.targets)))
+        return {index: found for index, found in enumerate(headers) if found is not None}
+
+    def _version(self, key: StorageKey, headers: Dict[int, Tuple[int, int]]) -> Version:
+        """
+        Newest generation held by enough clients to decode it, a failed write newer than it is ignored.
+        """
+        if not headers:
+            raise KeyError(f"Key '{key}' does not exist")
+        held = Counter(headers.values())
+        for (generation, size), holders in sorted(held.items(), reverse=True):
+            if holders >= self.code.data:
+                return Version(
+                    generation, size, sorted(index for index, found in headers.items() if found[0] == generation)
+                )
+        raise KeyError(f"No generation of '{key}' has the {self.code.data} fragments to decode it")
+
+    def _fetch(
+        self, key: StorageKey, version: Version, offset: int, length: int, rebuild: bool = True
+    ) -> Dict[int, np.ndarray]:
+        """
+        Fragment ranges of the generation from the data count of clients holding it, data fragments first so no
+        decoding is needed when present. Fragments found overwritten since are rejected like missing ones.
+        """
+        fragments: Dict[int, np.ndarray] = {}
+        missing: List[int] = []
+
+        def fetch(index: int) -> np.ndarray:
+            target = self.targets[index]
+            fragment = self._key(key, target)
+            # The header is read along with the range where they are adjacent
+            if offset == 0:
+                data = target.get(fragment, 0, HEADER.size + length)
+                split = HEADER.size
+                header, data = data[:split], data[split:]
+            else:
+                header = target.get(fragment, 0, HEADER.size)
+                data = target.get(fragment, HEADER.size + offset, length)
+            if len(header) != HEADER.size or HEADER.unpack(header)[0] != version.generation:
+                raise KeyError(f"Fragment {index} of '{key}' is not of generation {version.generation}")
+            if len(data) != length:
+                raise KeyError(f"Fragment {index} of '{key}' is truncated")
+            return np.frombuffer(data, dtype=np.uint8)
+
+        candidates = iter(version.holders)
+        pending = {self.fetcher.submit(fetch, index): index for index in islice(candidates, self.code.data)}
+        while pending:
+            future = next(as_completed(pending))
+            index = pending.pop(future)
+            try:
+                fragments[index] = future.result()
+            except Exception:  # pylint: disable=broad-except
+                missing.append(index)
+                replacement = next(candidates, None)
+                if replacement is not None:
+                    pending[self.fetcher.submit(fetch, replacement)] = replacement
+        if rebuild and (missing or len(version.holders) < len(self.targets)):
+            self._schedule_rebuild(key)
+        if len(fragments) < self.code.data:
+            raise KeyError(f"Only {len(fragments)} of {self.code.data} fragments of '{key}' are readable")
+        return fragments
+
+    def _read(self, key: StorageKey, version: Version, offset: int, stop: int) -> FileData:
+        """
+        Raw bytes of the stripes covering the range, from the first of them.
+        """
+        first = offset // self.stripe_bytes
+        last = (stop - 1) // self.stripe_bytes
+        start = first * FRAGMENT_BYTES
+        end = self._fragment_size(min(version.size, (last + 1) * self.stripe_bytes))
+        # Every byte position decodes independently, so the whole range decodes at once
+        fragments = self._fetch(key, version, start, end - start)
+        return self._join(self.code.decode(fragments), version.size, first, last)
+
+    def _join(self, decoded: np.ndarray, size: int, first: int, last: int) -> FileData:
+        """
+        Raw bytes of the stripes from decoded data fragments starting at the first of them.
+        """
+        start = first * FRAGMENT_BYTES
+        parts = []
+        for stripe in range(first, last + 1):
+            begin = stripe * FRAGMENT_BYTES - start
+            finish = begin + FRAGMENT_BYTES
+            raw = min(self.stripe_bytes, size - stripe * self.stripe_bytes)
+            parts.append(decoded[:, begin:finish].tobytes()[:raw])
+        return b"".join(parts)
+
+    def _range(self, key: StorageKey, offset: int, length: Optional[int]) -> Tuple[Version, int]:
+        version = self._version(key, self._headers(key))
+        stop = version.size if length is None else min(version.size, offset + length)
+        return version, stop
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        version, stop = self._range(key, offset, length)
+        if stop <= offset:
+            return b""
+        data = self._read(key, version, offset, stop)
+        skip = offset % self.stripe_bytes
+        end = skip + stop - offset
+        return data[skip:end]
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        version, stop = self._range(key, offset, length)
+        position = offset
+        while position < stop:
+            # One stripe at a time, so memory stays bounded by the stripe size
+            boundary = min(stop, (position // self.stripe_bytes + 1) * self.stripe_bytes)
+            data = self._read(key, version, position, boundary)
+            skip = position % self.stripe_bytes
+            for start in range(skip, skip + boundary - position, chunk_size):
+                end = min(start + chunk_size, skip + boundary - position)
+                yield data[start:end]
+            position = boundary
+
+    def stat(self, key: StorageKey) -> Object:
+        for target in self.targets:
+            try:
+                return target.stat(self._key(key, target))
+            except KeyError:
+                continue
+        raise KeyError(f"Key '{key}' does not exist")
+
+    def exists(self, key: StorageKey) -> bool:
+        return key in self
+
+    def __contains__(self, key: StorageKey) -> bool:
+        return any(self._key(key, target) in target for target in self.targets)
+
+    def _encoded(self, data: FileData) -> List[FileData]:
+        header = HEADER.pack(self._generation(), len(data))
+        fragments: List[List[FileData]] = [[header] for _ in self.targets]
+        for stripe in frames([data], self.stripe_bytes):
+            for index, fragment in enumerate(self._encode(stripe)):
+                fragments[index].append(fragment.tobytes())
+        return [b"".join(pieces) for pieces in fragments]
+
+    def put(self, obj: Object, data: FileData) -> None:
+        fragments = self._encoded(data)
+        futures = {
+            self.fetcher.submit(target.put, self._copy(obj, target), fragment): index
+            for index, (target, fragment) in enumerate(zip(self.targets, fragments))
+        }
+        errors: Dict[int, Exception] = {}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                errors[futures[future]] = e
+        self._check(len(self.targets) - len(errors), errors, obj)
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        # Every client consumes its own fragment stream on a thread of its own, fed stripe by stripe
+        queues: List[Queue] = [Queue(maxsize=STREAM_DEPTH) for _ in self.targets]
+        errors: Dict[int, Exception] = {}
+
+        def fragments(index: int) -> Iterator[FileData]:
+            while True:
+                piece = queues[index].get()
+                if piece is None:
+                    return
+                yield piece
+
+        def consume(index: int) -> None:
+            target = self.targets[index]
+            try:
+                target.put_stream(self._copy(obj, target), fragments(index))
+            except Exception as e:  # pylint: disable=broad-except
+                errors[index] = e
+                # Keep draining so the producer never blocks on a failed client
+                for _ in fragments(index):
+                    pass
+
+        with SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+            for chunk in stream:
+                spool.write(chunk)
+            size = spool.tell()
+            spool.seek(0)
+            consumers = [Thread(target=consume, args=(index,), daemon=True) for index in range(len(self.targets))]
+            for consumer in consumers:
+                consumer.start()
+            try:
+                header = HEADER.pack(self._generation(), size)
+                for queue in queues:
+                    queue.put(header)
+                for stripe in frames(iter(lambda: spool.read(CHUNK_SIZE), b""), self.stripe_bytes):
+                    for index, fragment in enumerate(self._encode(stripe)):
+                        queues[index].put(fragment.tobytes())
+            finally:
+                for queue in queues:
+                    queue.put(None)
+                for consumer in consumers:
+                    consumer.join()
+        self._check(len(self.targets) - len(errors), errors, obj)
+
+    def remove(self, key: StorageKey) -> None:
+        held = [target for target in self.targets if self._key(key, target) in target]
+        if not held:
+            raise KeyError(f"Key '{key}' does not exist")
+        for future in [self.fetcher.submit(target.remove, self._key(key, target)) for target in held]:
+            future.result()
+
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        # One batch per client, parity included as every header is needed to tell the newest generation.
+        # Any client failing the batch leaves every key to a read of its own.
+        futures = [
+            self.fetcher.submit(target.get_many, [self._key(key, target) for key in keys]) for target in self.targets
+        ]
+        try:
+            batches = [future.result() for future in futures]
+        except Exception:  # pylint: disable=broad-except
+            return {key: self.get(key) for key in keys}
+        results: Dict[StorageKey, FileData] = {}
+        for key in keys:
+            fragments = [batch[self._key(key, target)] for batch, target in zip(batches, self.targets)]
+            headers = {
+                index: HEADER.unpack_from(fragment)
+                for index, fragment in enumerate(fragments)
+                if len(fragment) >= HEADER.size
+            }
+            try:
+                version = self._version(key, headers)
+            except KeyError:
+                results[key] = self.get(key)
+                continue
+            if len(version.holders) < len(self.targets):
+                self._schedule_rebuild(key)
+            if not version.size:
+                results[key] = b""
+                continue
+            used = version.holders[: self.code.data]
+            shards = {index: np.frombuffer(fragments[index], np.uint8, offset=HEADER.size) for index in used}
+            results[key] = self._join(
+                self.code.decode(shards), version.size, 0, (version.size - 1) // self.stripe_bytes
+            )
+        return results
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        encoded = [(obj, self._encoded(data)) for obj, data in items]
+        futures = {
+            self.fetcher.submit(
+                target.put_many, [(self._copy(obj, target), fragments[index]) for obj, fragments in encoded]
+            ): index
+            for index, target in enumerate(self.targets)
+        }
+        # A client failing its batch is missing the fragments of every object in it
+        errors: Dict[int, Exception] = {}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                errors[futures[future]] = e
+        for obj, _ in items:
+            self._check(len(self.targets) - len(errors), errors, obj)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        def held(target: StorageClientInterface) -> List[StorageKey]:
+            return [key for key in keys if self._key(key, target) in target]
+
+        holding = [future.result() for future in [self.fetcher.submit(held, target) for target in self.targets]]
+        found = {str(key.path) for keys_held in holding for key in keys_held}
+        for key in keys:
+            if str(key.path) not in found:
+                raise KeyError(f"Key '{key}' does not exist")
+        futures = [
+            self.fetcher.submit(target.remove_many, [self._key(key, target) for key in keys_held])
+            for target, keys_held in zip(self.targets, holding)
+            if keys_held
+        ]
+        for future in futures:
+            future.result()
+
+    def _schedule_rebuild(self, key: StorageKey) -> None:
+        with self.rebuilding_lock:
+            if str(key.path) in self.rebuilding:
+                return
+            self.rebuilding.add(str(key.path))
+        self.rebuilder.submit(self._rebuild, key)
+
+    def _rebuild(self, key: StorageKey) -> None:
+        try:
+            self.reconstruct(key)
+        except Exception:  # pylint: disable=broad-except
+            # Clients still unreachable, the next read that misses a fragment schedules it again
+            pass
+        finally:
+            with self.rebuilding_lock:
+                self.rebuilding.discard(str(key.path))
+
+    def reconstruct(self, key: StorageKey) -> List[int]:
+        """
+        Write fragments missing from their clients or left behind by an overwrite again, decoded from those of the
+        newest generation, returning their indices.
+        """
+        obj = self.stat(key)
+        version = self._version(key, self._headers(key))
+        stale = [index for index in range(len(self.targets)) if index not in version.holders]
+        if not stale:
+            return []
+        fragment_size = self._fragment_size(version.size)
+        # Decoding and encoding work per byte position, the whole fragment is rebuilt in one pass
+        if fragment_size:
+            fragments = self._fetch(key, version, 0, fragment_size, rebuild=False)
+            encoded = self.code.encode(self.code.decode(fragments))
+        header = HEADER.pack(version.generation, version.size)
+        for index in stale:
+            target = self.targets[index]
+            fragment = encoded[index].tobytes() if fragment_size else b""
+            target.put(self._copy(obj, target), header + fragment)
+        return stale
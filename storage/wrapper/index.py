@@ -1,54 +1,202 @@
 """
 This wrapper creates an index of the wrapped storage.
 """
-from typing import List
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Tuple
 
-from database.paradigms.nosql import NoSQL
-from datamodel.data.model import Data
 from storage.interface.client import StorageClientInterface
-from storage.models.object.file.data import FileData
+from storage.models.header.models import HeaderEntry, HeaderOperation
+from storage.models.object.file.data import FileData, FileStream
 from storage.models.object.models import Object
 from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.index import IndexChanges, IndexSnapshot
 from storage.wrapper.interface import StorageWrapper
 
+# Change records after which they are folded into a new snapshot in the background
+COMPACT_CHANGES: int = 1000
+
 
 class IndexWrapper(StorageWrapper):
+    """
+    The index is persisted in the index storage as a snapshot plus one change record per write, so restarts load
+    it rather than walking the wrapped storage. Changes made to the wrapped storage while not wrapped are only
+    picked up by rebuild, unless the wrapped client observes them. Paths are kept sorted, a prefix listing is a
+    binary search plus the keys it returns.
+    """
+
     def __init__(self, wrapped: StorageClientInterface, storage: StorageClientInterface):
         super().__init__(wrapped)
-        self.storage: StorageClientInterface = storage
-        root_path = StorageKey(storage=storage.name, path=StoragePath(path=""))
+        # Named apart from client attributes, the proxy sets attributes on the wrapped client
+        self.index_storage: StorageClientInterface = storage
+        self.index_root: StorageKey = StorageKey(
+            storage=storage.name, path=StoragePath(path=f"index/{self.__wrapped__.name.value}")
+        )
+        self.entries: Dict[str, Object] = {}
+        self.paths: List[str] = []
+        self.sequence: int = 0
+        self.changes: int = 0
+        self.compacting: bool = False
+        self.index_lock = Lock()
+        self.compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.__class__.__name__}-compact")
+        if self._snapshot_key in self.index_storage:
+            self._load()
+        else:
+            self.rebuild()
+        # Changes found by the wrapped client itself, such as files changed on disk, are indexed as they are found
+        self.__wrapped__.observe(self._record)
+
+    @property
+    def _snapshot_key(self) -> StorageKey:
+        return self.index_root.join("snapshot.json")
+
+    @property
+    def _changes_root(self) -> StorageKey:
+        return self.index_root.join("changes")
+
+    def _changes_key(self, sequence: int) -> StorageKey:
+        # Zero padded so listing order is sequence order
+        return self._changes_root.join(f"{sequence:016d}.json")
+
+    def _load(self) -> None:
+        snapshot = IndexSnapshot.from_raw(self.index_storage.get(self._snapshot_key))
+        self.entries = dict(snapshot.objects)
+        self.paths = sorted(self.entries)
+        self.sequence = snapshot.sequence
+        keys = list(self.index_storage.walk(self._changes_root, depth=0))
+        records = sorted(
+            (IndexChanges.from_raw(data) for data in self.index_storage.get_many(keys).values()),
+            key=lambda record: record.sequence,
+        )
+        for record in records:
+            # Records folded into the snapshot may outlive it when compaction was interrupted
+            if record.sequence <= snapshot.sequence:
+                continue
+            for entry in record.entries:
+                self._apply(entry)
+            self.sequence = record.sequence
+        self.changes = len(records)
+
+    def rebuild(self) -> None:
+        """
+        Index the wrapped storage from scratch and replace the persisted index with it.
+        """
+        root = StorageKey(storage=self.__wrapped__.name, path=StoragePath(path=""))
+        entries: Dict[str, Object] = {}
+        # Streamed so building the index does not hold the whole listing
+        for item in self.__wrapped__.walk(root):
+            try:
+                entries[str(item.path)] = self.__wrapped__.stat(item)
+            except KeyError:
+                # Folders are listed but have no entry of their own
+                continue
+        with self.index_lock:
+            self.entries = entries
+            self.paths = sorted(entries)
+            self.sequence += 1
+            snapshot = IndexSnapshot(sequence=self.sequence, objects=dict(entries))
+        self._store_snapshot(snapshot)
 
-        self.index = NoSQL(f"index/{self.__wrapped__.name}", self.storage)
-        for item in self.__wrapped__.list(root_path, recursive=True):
-            stat = self.__wrapped__.stat(item)
-            self.index.insert(str(item.path), Data.from_obj(stat.to_dict()))
+    def _apply(self, entry: HeaderEntry) -> None:
+        # Caller holds the index lock, or is loading
+        path = str(entry.key.path)
+        if entry.operation == HeaderOperation.PUT and entry.obj is not None:
+            if path not in self.entries:
+                insort(self.paths, path)
+            self.entries[path] = entry.obj
+        elif entry.operation == HeaderOperation.REMOVE and path in self.entries:
+            del self.entries[path]
+            index = bisect_left(self.paths, path)
+            del self.paths[index]
+
+    def _record(self, entries: List[HeaderEntry]) -> None:
+        with self.index_lock:
+            for entry in entries:
+                self._apply(entry)
+            self.sequence += 1
+            record = IndexChanges(sequence=self.sequence, entries=entries)
+            self.changes += 1
+            compact = self.changes > COMPACT_CHANGES and not self.compacting
+            if compact:
+                self.compacting = True
+        obj, data = Object.create_file(self._changes_key(record.sequence), record.to_json().encode(), fingerprint=False)
+        self.index_storage.put(obj, data)
+        if compact:
+            self.compactor.submit(self._compact)
+
+    def _compact(self) -> None:
+        try:
+            with self.index_lock:
+                snapshot = IndexSnapshot(sequence=self.sequence, objects=dict(self.entries))
+                self.changes = 0
+            self._store_snapshot(snapshot)
+        finally:
+            with self.index_lock:
+                self.compacting = False
+
+    def _store_snapshot(self, snapshot: IndexSnapshot) -> None:
+        obj, data = Object.create_file(self._snapshot_key, snapshot.to_json().encode(), fingerprint=False)
+        self.index_storage.put(obj, data)
+        # Only records folded into the snapshot are removed, later ones are still needed
+        folded = [
+            key
+            for key in self.index_storage.walk(self._changes_root, depth=0)
+            if int(key.path.name.split(".")[0]) <= snapshot.sequence
+        ]
+        if folded:
+            self.index_storage.remove_many(folded)
 
     def put(self, obj: Object, data: FileData) -> None:
         self.__wrapped__.put(obj, data)
-        self.index.insert(str(obj.key.path), Data.from_obj(obj.to_dict()))
+        self._record([HeaderEntry(operation=HeaderOperation.PUT, key=obj.key, obj=obj)])
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        self.__wrapped__.put_stream(obj, stream)
+        self._record([HeaderEntry(operation=HeaderOperation.PUT, key=obj.key, obj=obj)])
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        self.__wrapped__.put_many(items)
+        self._record([HeaderEntry(operation=HeaderOperation.PUT, key=obj.key, obj=obj) for obj, _ in items])
 
     def remove(self, key: StorageKey) -> None:
         self.__wrapped__.remove(key)
-        self.index.delete(str(key.path))
+        self._record([HeaderEntry(operation=HeaderOperation.REMOVE, key=key)])
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        self.__wrapped__.remove_many(keys)
+        self._record([HeaderEntry(operation=HeaderOperation.REMOVE, key=key) for key in keys])
 
     def stat(self, key: StorageKey) -> Object:
-        data = self.index.get(str(key.path))
-        if data is None:
-            data = self.__wrapped__.stat(key)
-            self.index.insert(str(key.path), Data.from_obj(data.to_dict()))
-        data = data.to_dict()
-        return Object(**data)
+        with self.index_lock:
+            obj = self.entries.get(str(key.path))
+        if obj is None:
+            obj = self.__wrapped__.stat(key)
+            self._record([HeaderEntry(operation=HeaderOperation.PUT, key=key, obj=obj)])
+        return obj
 
     def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
-        items = [item for item in self.index.items() if item.startswith(str(prefix.path))]
-        if not recursive:
-            items = [item for item in items if "/" not in item.replace(str(prefix.path), "")]
+        base = f"{prefix.path}/" if str(prefix.path) else ""
+        items: List[str] = []
+        with self.index_lock:
+            index = bisect_left(self.paths, base)
+            while index < len(self.paths) and self.paths[index].startswith(base):
+                path = self.paths[index]
+                folder = path.find("/", len(base))
+                if recursive or folder == -1:
+                    items.append(path)
+                    index += 1
+                    continue
+                # Direct subfolder listed once, its contents are skipped with a search past them
+                items.append(path[:folder])
+                index = bisect_left(self.paths, path[:folder] + "0", index)
         return [StorageKey(storage=self.__wrapped__.name, path=StoragePath(path=item)) for item in items]
 
     def __contains__(self, key: StorageKey) -> bool:
-        if str(key.path) in self.index:
-            return True
+        with self.index_lock:
+            if str(key.path) in self.entries:
+                return True
         if key in self.__wrapped__:
-            self.index.insert(str(key.path), Data.from_obj(self.__wrapped__.stat(key).to_dict()))
+            self._record([HeaderEntry(operation=HeaderOperation.PUT, key=key, obj=self.__wrapped__.stat(key))])
             return True
         return False
@@ -2,14 +2,15 @@
 Interface for storage wrapper.
 """
 from contextlib import contextmanager
-from typing import Any, Dict, Generator, List, Union
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple, Union
 
 from network.superclass.wrapping import DistributedObjectProxy
-from storage.interface.client import StorageClientInterface
+from storage.interface.client import PAGE_SIZE, StorageClientInterface
 from storage.models.client.info import StorageInfo
 from storage.models.client.key import StorageClientKey
 from storage.models.client.medium import Medium
-from storage.models.object.file.data import FileData
+from storage.models.header.models import HeaderEntry
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
 from storage.models.object.path import StorageKey, StoragePath
 
@@ -26,21 +27,48 @@ class StorageWrapper(DistributedObjectProxy, StorageClientInterface):
         # StorageWrapper:StorageClientInterface@xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx
         return f"{self.__class__.__name__}:{repr(self.__wrapped__)}"
 
-    def get(self, key: StorageKey) -> FileData:
-        return self.__wrapped__.get(key)
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        return self.__wrapped__.get(key, offset, length)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        return self.__wrapped__.get_stream(key, chunk_size, offset, length)
 
     def put(self, obj: Object, data: FileData) -> None:
         return self.__wrapped__.put(obj, data)
 
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        return self.__wrapped__.put_stream(obj, stream)
+
     def remove(self, key: StorageKey) -> None:
         return self.__wrapped__.remove(key)
 
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        return self.__wrapped__.get_many(keys)
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        return self.__wrapped__.put_many(items)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        return self.__wrapped__.remove_many(keys)
+
     def stat(self, key: StorageKey) -> Object:
         return self.__wrapped__.stat(key)
 
     def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
         return self.__wrapped__.list(prefix, recursive)
 
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        return self.__wrapped__.walk(prefix, depth, start_after)
+
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        return self.__wrapped__.list_page(prefix, recursive, token, limit)
+
     def header(self, key: StorageKey) -> Dict[StorageKey, Object]:
         return self.__wrapped__.header(key)
 
@@ -70,6 +98,13 @@ class StorageWrapper(DistributedObjectProxy, StorageClientInterface):
     def medium(self) -> Medium:
         return self.__wrapped__.medium
 
+    @property
+    def available(self) -> Optional[int]:
+        return self.__wrapped__.available
+
+    def observe(self, callback: Callable[[List[HeaderEntry]], None]) -> None:
+        return self.__wrapped__.observe(callback)
+
     @contextmanager
     def transact(self, key: Union[StorageKey, List[StorageKey]]) -> Generator[None, Any, Any]:
         self.__wrapped__.transact(key)
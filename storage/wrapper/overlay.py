@@ -1,16 +1,32 @@
 """
 This module contains the implementation of an overlay wrapper for the storage client.
 """
-from typing import List
+from collections import Counter
+from contextlib import contextmanager
+from itertools import islice
+from threading import Lock
+from typing import Dict, Generator, Iterator, List, Optional, Tuple
 
-from storage.interface.client import StorageClientInterface
-from storage.models.object.file.data import FileData
+from storage.interface.client import PAGE_SIZE, StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
-from storage.models.object.path import StorageKey
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.bloom import BloomFilter
+from storage.superclass.listing import Listed, merge, order
 from storage.wrapper.interface import StorageWrapper
 
+# Overlay keys the filter is first sized for, it is rebuilt twice as large once exceeded
+FILTER_CAPACITY: int = 100_000
+
 
 class OverlayWrapper(StorageWrapper):
+    """
+    Overlay membership is checked against a Bloom filter of overlay paths first, so most misses cost no request.
+    The filter is built from a listing on first use and kept up to date by writes, so the overlay must only be
+    written through this wrapper. Removed paths stay in it as false positives until it is rebuilt, which lists the
+    overlay outside the lock and swaps the new filter in.
+    """
+
     def __init__(
         self,
         wrapped: StorageClientInterface,
@@ -20,16 +36,94 @@ class OverlayWrapper(StorageWrapper):
         super().__init__(wrapped)
         self.overlay: StorageClientInterface = overlay
         self.symmetric: bool = symmetric
+        self.overlay_filter: Optional[BloomFilter] = None
+        self.filter_capacity: int = FILTER_CAPACITY
+        self.filter_removed: int = 0
+        # Paths being written, a rebuild listing the overlay may not see them yet
+        self.filter_writing: Counter = Counter()
+        # Paths written while a rebuild lists the overlay, added to the rebuilt filter before it is swapped in
+        self.filter_added: Optional[List[str]] = None
+        self.filter_lock = Lock()
+        self.filter_rebuild = Lock()
+
+    def _stale(self, bloom: Optional[BloomFilter]) -> bool:
+        # Rebuilt when grown past its size or when removed paths make up half of it
+        return bloom is None or bloom.full or self.filter_removed * 2 > bloom.count
+
+    def _filter(self) -> BloomFilter:
+        bloom = self.overlay_filter
+        if not self._stale(bloom):
+            return bloom
+        # A stale filter still has every written path, it is used as it is while another thread rebuilds it
+        if not self.filter_rebuild.acquire(blocking=bloom is None):
+            return bloom
+        try:
+            with self.filter_lock:
+                bloom = self.overlay_filter
+                if not self._stale(bloom):
+                    return bloom
+                self.filter_added = []
+                writing = list(self.filter_writing)
+                removed = self.filter_removed
+            # Listed without the lock, so reads and writes go on against the current filter meanwhile
+            root = StorageKey(storage=self.overlay.name, path=StoragePath(path=""))
+            paths = [str(key.path) for key in self.overlay.walk(root)] + writing
+            capacity = max(self.filter_capacity, 2 * len(paths))
+            rebuilt = BloomFilter.of(paths, capacity)
+            with self.filter_lock:
+                for path in self.filter_added:
+                    rebuilt.add(path)
+                self.filter_added = None
+                self.filter_capacity = capacity
+                self.filter_removed -= removed
+                self.overlay_filter = rebuilt
+            return rebuilt
+        finally:
+            self.filter_rebuild.release()
+
+    @contextmanager
+    def _writing(self, keys: List[StorageKey]) -> Generator[None, None, None]:
+        # Added before writing, a reader may see a false positive but never miss a written key
+        paths = [str(key.path) for key in keys]
+        self._filter()
+        with self.filter_lock:
+            self.filter_writing.update(paths)
+            if self.filter_added is not None:
+                self.filter_added.extend(paths)
+            for path in paths:
+                self.overlay_filter.add(path)
+        try:
+            yield
+        finally:
+            with self.filter_lock:
+                self.filter_writing.subtract(paths)
+                self.filter_writing += Counter()
+
+    def _forget(self, count: int) -> None:
+        with self.filter_lock:
+            self.filter_removed += count
+
+    def _in_overlay(self, key: StorageKey) -> bool:
+        return str(key.path) in self._filter() and key in self.overlay
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        if self._in_overlay(key):
+            return self.overlay.get(key, offset, length)
+        if key in self.__wrapped__:
+            return self.__wrapped__.get(key, offset, length)
+        raise KeyError(f"Key '{key}' does not exist")
 
-    def get(self, key: StorageKey) -> FileData:
-        if key in self.overlay:
-            return self.overlay.get(key)
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        if self._in_overlay(key):
+            return self.overlay.get_stream(key, chunk_size, offset, length)
         if key in self.__wrapped__:
-            return self.__wrapped__.get(key)
+            return self.__wrapped__.get_stream(key, chunk_size, offset, length)
         raise KeyError(f"Key '{key}' does not exist")
 
     def stat(self, key: StorageKey) -> Object:
-        if key in self.overlay:
+        if self._in_overlay(key):
             return self.overlay.stat(key)
         if key in self.__wrapped__:
             return self.__wrapped__.stat(key)
@@ -38,19 +132,82 @@ class OverlayWrapper(StorageWrapper):
     def put(self, obj: Object, data: FileData) -> None:
         if self.symmetric:
             self.__wrapped__.put(obj, data)
-        return self.overlay.put(obj, data)
+        with self._writing([obj.key]):
+            self.overlay.put(obj, data)
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        if self.symmetric:
+            # Stream is consumed once, overlay copy is streamed back from the wrapped client
+            self.__wrapped__.put_stream(obj, stream)
+            stream = self.__wrapped__.get_stream(obj.key)
+        with self._writing([obj.key]):
+            self.overlay.put_stream(obj, stream)
 
     def remove(self, key: StorageKey) -> None:
-        if key in self.overlay:
+        if self._in_overlay(key):
+            self._forget(1)
             return self.overlay.remove(key)
         if key in self.__wrapped__:
             return self.__wrapped__.remove(key)
         raise KeyError(f"Key '{key}' does not exist")
 
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        overlay, wrapped = self._partition(keys)
+        results = self.overlay.get_many(overlay)
+        results.update(self.__wrapped__.get_many(wrapped))
+        return {key: results[key] for key in keys}
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        if self.symmetric:
+            self.__wrapped__.put_many(items)
+        with self._writing([obj.key for obj, _ in items]):
+            self.overlay.put_many(items)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        overlay, wrapped = self._partition(keys)
+        self._forget(len(overlay))
+        self.overlay.remove_many(overlay)
+        self.__wrapped__.remove_many(wrapped)
+
+    def _partition(self, keys: List[StorageKey]) -> Tuple[List[StorageKey], List[StorageKey]]:
+        overlay: List[StorageKey] = []
+        wrapped: List[StorageKey] = []
+        for key in keys:
+            if self._in_overlay(key):
+                overlay.append(key)
+            elif key in self.__wrapped__:
+                wrapped.append(key)
+            else:
+                raise KeyError(f"Key '{key}' does not exist")
+        return overlay, wrapped
+
     def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
         overlay = self.overlay.list(prefix, recursive=recursive)
         wrapped = self.__wrapped__.list(prefix, recursive=recursive)
         return list(set(overlay + wrapped))
 
+    # Merged in walk order, wrapped keys shadowed by the overlay are listed once from the overlay
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        for _, key in self._merged(prefix, depth, start_after):
+            yield key
+
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        page = list(islice(self._merged(prefix, None if recursive else 0, token), limit + 1))
+        keys = [key for _, key in page[:limit]]
+        token = order(*page[limit - 1]) if len(page) > limit else None
+        return keys, token
+
+    def _merged(self, prefix: StorageKey, depth: Optional[int], start_after: Optional[str]) -> Iterator[Listed]:
+        return merge(
+            [
+                (self.overlay, self.overlay.walk(prefix, depth, start_after)),
+                (self.__wrapped__, self.__wrapped__.walk(prefix, depth, start_after)),
+            ]
+        )
+
     def __contains__(self, key: StorageKey) -> bool:
-        return key in self.overlay or key in self.__wrapped__
+        return self._in_overlay(key) or key in self.__wrapped__
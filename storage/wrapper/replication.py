@@ -1,29 +1,355 @@
 """
-This module contains the implementation of an overlay wrapper for the storage client.
+This module contains the implementation of a replication wrapper for the storage client.
 """
+import time
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, Generator, List, Optional, Set, Tuple, Union
 
 from storage.interface.client import StorageClientInterface
-from storage.models.object.file.data import FileData
+from storage.models.header.models import HeaderOperation
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
-from storage.models.object.path import StorageKey
+from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.compression import CompressionPolicy
+from storage.models.wrapper.replication import ChangeRecord, ReplicationCursor, ReplicationLag, ReplicationMode
+from storage.superclass.journal import Journal
+from storage.wrapper.compression import CompressionWrapper
 from storage.wrapper.interface import StorageWrapper
 
+# Changes shipped to a replica per batch
+BATCH_SIZE: int = 256
+
+# Seconds before a failed batch is shipped again
+RETRY_DELAY: float = 5.0
+
 
 class ReplicationWrapper(StorageWrapper):
+    """
+    Synchronously, writes go to the wrapped client and every replica concurrently, returning once a quorum of them
+    succeeded. Targets that failed a write are tracked per path until a later write or repair brings them up to date.
+
+    Asynchronously, writes go into an ordered change log in the log directory before they go to the wrapped client.
+    A worker per replica ships coalesced batches of changes once their writes are done and persists its cursor,
+    resuming from it on restart. The log is cut down to the changes the furthest behind replica has yet to receive.
+    Shipped data can be compressed, for asynchronous replicas only. They then store it in the format of the
+    compression wrapper, and are read through one, here as well as by anything else reading them.
+    """
+
     def __init__(
         self,
         wrapped: StorageClientInterface,
-        replica: StorageClientInterface,
+        replicas: Union[StorageClientInterface, List[StorageClientInterface]],
+        quorum: Optional[int] = None,
+        timeout: float = 30.0,
+        mode: ReplicationMode = ReplicationMode.SYNCHRONOUS,
+        log: Optional[Path] = None,
+        batch: int = BATCH_SIZE,
+        compression: Optional[CompressionPolicy] = None,
     ):
         super().__init__(wrapped)
-        self.replica: StorageClientInterface = replica
+        if not isinstance(replicas, list):
+            replicas = [replicas]
+        if compression is not None and mode != ReplicationMode.ASYNCHRONOUS:
+            raise ValueError("Compression is only shipped to asynchronous replicas")
+        if compression is not None:
+            replicas = [CompressionWrapper(replica, compression) for replica in replicas]
+        self.replicas: List[StorageClientInterface] = replicas
+        # Wrapped client is the first target and preferred for reads
+        self.targets: List[StorageClientInterface] = [self.__wrapped__, *replicas]
+        self.quorum: int = len(self.targets) if quorum is None else quorum
+        if not 1 <= self.quorum <= len(self.targets):
+            raise ValueError(f"Quorum must be between 1 and {len(self.targets)}")
+        self.write_timeout: float = timeout
+        # Paths each target missed, by index into targets
+        self.repairs: Dict[int, Set[str]] = {index: set() for index in range(len(self.targets))}
+        # Writes submitted to each target and not yet done there, per path
+        self.writing: Dict[int, Counter] = {index: Counter() for index in range(len(self.targets))}
+        self.repairs_lock = Lock()
+        # One worker per target keeps writes in order on each of them, while targets proceed independently
+        self.replicators: List[ThreadPoolExecutor] = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.__class__.__name__}-{index}")
+            for index in range(len(self.targets))
+        ]
+
+        self.mode: ReplicationMode = mode
+        if mode == ReplicationMode.ASYNCHRONOUS:
+            if log is None:
+                raise ValueError("Asynchronous replication requires a log directory")
+            self._start_shipping(log, batch)
+
+    def _start_shipping(self, log: Path, batch: int) -> None:
+        self.log: Path = log
+        self.batch: int = batch
+        self.changes: Journal[ChangeRecord] = Journal(log / "changes.log", ChangeRecord)
+        self.cursors: List[int] = [self._load_cursor(index) for index in range(len(self.replicas))]
+        # Changes not yet shipped to every replica, in sequence order
+        self.backlog: List[ChangeRecord] = [change for change in self.changes if change.sequence > min(self.cursors)]
+        # Sequences of the backlog alongside it, searched for where a cursor falls
+        self.backlog_sequences: List[int] = [change.sequence for change in self.backlog]
+        self.sequence: int = max(self.backlog_sequences + self.cursors)
+        # Logged changes whose writes to the wrapped client are still running, not shipped until they are done
+        self.applying: Set[int] = set()
+        self.shipped: int = min(self.cursors)
+        self.changed = Condition()
+        self.shippers: List[Thread] = [
+            Thread(target=self._ship, args=(index,), name=f"{self.__class__.__name__}-ship-{index}", daemon=True)
+            for index in range(len(self.replicas))
+        ]
+        for shipper in self.shippers:
+            shipper.start()
+
+    def _cursor_path(self, index: int) -> Path:
+        return self.log / f"cursor.{index}.json"
+
+    def _load_cursor(self, index: int) -> int:
+        path = self._cursor_path(index)
+        if not path.exists():
+            return 0
+        return ReplicationCursor.from_raw(path.read_bytes()).sequence
+
+    def _save_cursor(self, index: int, sequence: int) -> None:
+        path = self._cursor_path(index)
+        temporary = path.with_name(f"{path.name}.tmp")
+        temporary.write_text(ReplicationCursor(sequence=sequence).to_json(), encoding="utf-8")
+        temporary.replace(path)
+
+    @contextmanager
+    def _logged(self, operation: HeaderOperation, keys: List[StorageKey]) -> Generator[None, None, None]:
+        """
+        Log the changes ahead of the write in the block, shipping them once it is done.
+        """
+        with self.changed:
+            changes = []
+            for key in keys:
+                self.sequence += 1
+                changes.append(
+                    ChangeRecord(sequence=self.sequence, timestamp=time.time(), operation=operation, path=key.path)
+                )
+            self.changes.append(*changes)
+            self.backlog.extend(changes)
+            self.backlog_sequences.extend(change.sequence for change in changes)
+            self.applying.update(change.sequence for change in changes)
+        try:
+            yield
+        finally:
+            # Failed writes are shipped too, replicas are brought to whatever state the wrapped client is in
+            with self.changed:
+                self.applying.difference_update(change.sequence for change in changes)
+                self.changed.notify_all()
+
+    def _shippable(self) -> int:
+        # Caller holds the condition, changes up to this sequence have their writes done
+        return min(self.applying) - 1 if self.applying else self.sequence
+
+    def _ship(self, index: int) -> None:
+        replica = self.replicas[index]
+        while True:
+            with self.changed:
+                self.changed.wait_for(lambda: self._shippable() > self.cursors[index])
+                start = bisect_right(self.backlog_sequences, self.cursors[index])
+                done = bisect_right(self.backlog_sequences, self._shippable())
+                end = min(start + self.batch, done)
+                changes = self.backlog[start:end]
+            try:
+                self._ship_batch(replica, changes)
+            except Exception:  # pylint: disable=broad-except
+                time.sleep(RETRY_DELAY)
+                continue
+            self._save_cursor(index, changes[-1].sequence)
+            with self.changed:
+                self.cursors[index] = changes[-1].sequence
+                self._truncate()
+                self.changed.notify_all()
+
+    def _truncate(self) -> None:
+        # Caller holds the condition, changes every replica received are dropped from the backlog and the log
+        shipped = min(self.cursors)
+        if shipped <= self.shipped:
+            return
+        self.shipped = shipped
+        first = bisect_right(self.backlog_sequences, shipped)
+        self.backlog = self.backlog[first:]
+        self.backlog_sequences = self.backlog_sequences[first:]
+        self.changes.replace(*self.backlog)
+
+    def _ship_batch(self, replica: StorageClientInterface, changes: List[ChangeRecord]) -> None:
+        # Only the last change to a path matters, its data is the current state of the wrapped client
+        latest: Dict[str, ChangeRecord] = {str(change.path): change for change in changes}
+        items = []
+        removed = []
+        for change in latest.values():
+            key = StorageKey(storage=self.__wrapped__.name, path=change.path)
+            if change.operation == HeaderOperation.PUT and key in self.__wrapped__:
+                items.append((self._copy(self.__wrapped__.stat(key), replica), self.__wrapped__.get(key)))
+                continue
+            copy = self._key(key, replica)
+            if copy in replica:
+                removed.append(copy)
+        if items:
+            replica.put_many(items)
+        if removed:
+            replica.remove_many(removed)
+
+    def lag(self) -> List[ReplicationLag]:
+        """
+        Changes each replica has yet to receive and the age of the oldest of them.
+        """
+        if self.mode != ReplicationMode.ASYNCHRONOUS:
+            return [ReplicationLag() for _ in self.replicas]
+        now = time.time()
+        lags = []
+        with self.changed:
+            for cursor in self.cursors:
+                start = bisect_right(self.backlog_sequences, cursor)
+                seconds = now - self.backlog[start].timestamp if start < len(self.backlog) else 0.0
+                lags.append(ReplicationLag(operations=self.sequence - cursor, seconds=seconds))
+        return lags
+
+    def _key(self, key: StorageKey, target: StorageClientInterface) -> StorageKey:
+        return StorageKey(storage=target.name, path=key.path)
+
+    def _copy(self, obj: Object, target: StorageClientInterface) -> Object:
+        return Object(key=self._key(obj.key, target), metadata=obj.metadata, item=obj.item)
+
+    def _apply(self, index: int, paths: List[str], operation: Callable[[StorageClientInterface], None]) -> None:
+        # Tracked before the result is visible, so reads never see a target that failed as up to date
+        try:
+            operation(self.targets[index])
+        except Exception:
+            with self.repairs_lock:
+                self.repairs[index].update(paths)
+                self._written(index, paths)
+            raise
+        with self.repairs_lock:
+            self.repairs[index].difference_update(paths)
+            self._written(index, paths)
+
+    def _written(self, index: int, paths: List[str]) -> None:
+        # Caller holds the repairs lock
+        self.writing[index].subtract(paths)
+        self.writing[index] += Counter()
+
+    def _replicate(
+        self,
+        keys: List[StorageKey],
+        operation: Callable[[StorageClientInterface], None],
+        indices: Optional[List[int]] = None,
+        quorum: Optional[int] = None,
+    ) -> None:
+        """
+        Run the operation against the targets, waiting only until the quorum succeeded or cannot be reached.
+        """
+        paths = [str(key.path) for key in keys]
+        indices = list(range(len(self.targets))) if indices is None else indices
+        quorum = self.quorum if quorum is None else quorum
+        # Marked on every target first, so a read after the quorum returned skips targets the write has yet to reach
+        with self.repairs_lock:
+            for index in indices:
+                self.writing[index].update(paths)
+        # Targets still running when the caller returns keep updating the repair sets
+        pending = {self.replicators[index].submit(self._apply, index, paths, operation) for index in indices}
+
+        succeeded = 0
+        deadline = time.monotonic() + self.write_timeout
+        while pending and succeeded < quorum and succeeded + len(pending) >= quorum:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            succeeded += sum(1 for future in done if future.exception() is None)
+        if succeeded < quorum:
+            raise RuntimeError(f"Write of {paths} reached {succeeded} of {quorum} required targets")
+
+    def _source(self, key: StorageKey) -> Tuple[StorageClientInterface, StorageKey]:
+        # First target that has every write of the key so far, else the first one that missed none finished so far
+        path = str(key.path)
+        with self.repairs_lock:
+            current = [index for index in range(len(self.targets)) if path not in self.repairs[index]]
+            settled = [index for index in current if self.writing[index][path] == 0]
+        if not current:
+            raise KeyError(f"Key '{key}' has no up to date replica")
+        target = self.targets[(settled or current)[0]]
+        return target, self._key(key, target)
+
+    def repair(self) -> None:
+        """
+        Copy paths that targets missed from the first up to date target, or remove them where that has none.
+        """
+        with self.repairs_lock:
+            missed = {index: list(paths) for index, paths in self.repairs.items()}
+        for index, paths in missed.items():
+            target = self.targets[index]
+            for path in paths:
+                key = StorageKey(storage=target.name, path=StoragePath(path=path))
+                source, source_key = self._source(key)
+                if source_key in source:
+                    copy = self._copy(source.stat(source_key), target)
+                    target.put_stream(copy, source.get_stream(source_key))
+                elif key in target:
+                    target.remove(key)
+                with self.repairs_lock:
+                    self.repairs[index].discard(path)
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        source, key = self._source(key)
+        return source.get(key, offset, length)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        source, key = self._source(key)
+        return source.get_stream(key, chunk_size, offset, length)
+
+    def stat(self, key: StorageKey) -> Object:
+        source, key = self._source(key)
+        return source.stat(key)
 
     def put(self, obj: Object, data: FileData) -> None:
-        self.__wrapped__.put(obj, data)
-        copy_name = StorageKey(storage=self.replica.name, path=obj.key.path)
-        copy_obj = Object(key=copy_name, metadata=obj.metadata, item=obj.item)
-        self.replica.put(copy_obj, data)
+        if self.mode == ReplicationMode.ASYNCHRONOUS:
+            with self._logged(HeaderOperation.PUT, [obj.key]):
+                self.__wrapped__.put(obj, data)
+            return
+        self._replicate([obj.key], lambda target: target.put(self._copy(obj, target), data))
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        if self.mode == ReplicationMode.ASYNCHRONOUS:
+            with self._logged(HeaderOperation.PUT, [obj.key]):
+                self.__wrapped__.put_stream(obj, stream)
+            return
+        # Stream is consumed once by the wrapped client, replica copies are streamed back from it concurrently
+        self.__wrapped__.put_stream(obj, stream)
+        self._replicate(
+            [obj.key],
+            lambda target: target.put_stream(self._copy(obj, target), self.__wrapped__.get_stream(obj.key)),
+            list(range(1, len(self.targets))),
+            self.quorum - 1,
+        )
 
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        keys = [obj.key for obj, _ in items]
+        if self.mode == ReplicationMode.ASYNCHRONOUS:
+            with self._logged(HeaderOperation.PUT, keys):
+                self.__wrapped__.put_many(items)
+            return
+        self._replicate(keys, lambda target: target.put_many([(self._copy(obj, target), data) for obj, data in items]))
+
+    # Targets that already lack a key count as having removed it
     def remove(self, key: StorageKey) -> None:
-        self.__wrapped__.remove(key)
-        self.replica.remove(key)
+        self.remove_many([key])
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        if self.mode == ReplicationMode.ASYNCHRONOUS:
+            with self._logged(HeaderOperation.REMOVE, keys):
+                self.__wrapped__.remove_many(keys)
+            return
+
+        def operation(target: StorageClientInterface) -> None:
+            present = [self._key(key, target) for key in keys if self._key(key, target) in target]
+            if present:
+                target.remove_many(present)
+
+        self._replicate(keys, operation)
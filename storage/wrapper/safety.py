@@ -2,30 +2,61 @@
 This module contains the implementation of an overlay wrapper for the storage client.
 """
 from contextlib import contextmanager
-from typing import Any, Dict, Generator, List, Union
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple, Union
 
-from storage.models.object.file.data import FileData
+from storage.interface.client import PAGE_SIZE
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
 from storage.models.object.path import StorageKey
 from storage.wrapper.interface import StorageWrapper
 
 
 class SafetyWrapper(StorageWrapper):
-    def get(self, key: StorageKey) -> FileData:
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
         if key.path in self.__wrapped__.RESERVED:
             raise KeyError(f"Key '{key}' is reserved")
-        return self.__wrapped__.get(key)
+        return self.__wrapped__.get(key, offset, length)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        if key.path in self.__wrapped__.RESERVED:
+            raise KeyError(f"Key '{key}' is reserved")
+        return self.__wrapped__.get_stream(key, chunk_size, offset, length)
 
     def put(self, obj: Object, data: FileData) -> None:
         if obj.key.path in self.__wrapped__.RESERVED:
             raise KeyError(f"Key '{obj.key.path}' is reserved")
         return self.__wrapped__.put(obj, data)
 
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        if obj.key.path in self.__wrapped__.RESERVED:
+            raise KeyError(f"Key '{obj.key.path}' is reserved")
+        return self.__wrapped__.put_stream(obj, stream)
+
     def remove(self, key: StorageKey) -> None:
         if key.path in self.__wrapped__.RESERVED:
             raise KeyError(f"Key '{key}' is reserved")
         return self.__wrapped__.remove(key)
 
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        reserved = [key for key in keys if key.path in self.__wrapped__.RESERVED]
+        if reserved:
+            raise KeyError(f"Keys '{reserved}' are reserved")
+        return self.__wrapped__.get_many(keys)
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        reserved = [obj.key for obj, _ in items if obj.key.path in self.__wrapped__.RESERVED]
+        if reserved:
+            raise KeyError(f"Keys '{reserved}' are reserved")
+        return self.__wrapped__.put_many(items)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        reserved = [key for key in keys if key.path in self.__wrapped__.RESERVED]
+        if reserved:
+            raise KeyError(f"Keys '{reserved}' are reserved")
+        return self.__wrapped__.remove_many(keys)
+
     def stat(self, key: StorageKey) -> Object:
         if key.path in self.__wrapped__.RESERVED:
             raise KeyError(f"Key '{key}' is reserved")
@@ -36,6 +67,21 @@ class SafetyWrapper(StorageWrapper):
         filtered = [key for key in wrapped if key.path not in self.__wrapped__.RESERVED]
         return filtered
 
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        for key in self.__wrapped__.walk(prefix, depth, start_after):
+            if key.path not in self.__wrapped__.RESERVED:
+                yield key
+
+    # Pages may come back short of the limit once reserved keys are removed
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        keys, token = self.__wrapped__.list_page(prefix, recursive, token, limit)
+        filtered = [key for key in keys if key.path not in self.__wrapped__.RESERVED]
+        return filtered, token
+
     def header(self, key: StorageKey) -> Dict[StorageKey, Object]:
         if key.path in self.__wrapped__.RESERVED:
             raise KeyError(f"Key '{key}' is reserved")
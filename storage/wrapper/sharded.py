@@ -1,65 +1,344 @@
 """
-This module contains the implementation of an overlay wrapper for the storage client.
+This module contains the implementation of a sharding wrapper for the storage client.
 """
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
 from enum import Enum
-from typing import List
+from itertools import islice
+from threading import Lock, Thread
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Tuple, Union
 
-from storage.interface.client import StorageClientInterface
-from storage.models.object.file.data import FileData
+from storage.interface.client import PAGE_SIZE, StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
 from storage.models.object.models import Object
-from storage.models.object.path import StorageKey
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.listing import Listed, merge, order
+from storage.superclass.ring import VNODES, HashRing, ring_hash
 from storage.wrapper.interface import StorageWrapper
 
+# Keys moved per second by a background migration, None for no limit
+MIGRATION_RATE: Optional[float] = 100.0
+
+# Largest share of the ring a shard gets relative to the average, however lopsided free space is
+MAX_WEIGHT: float = 8.0
+
+STRIPES: int = 64
+
 
 class ShardStrategy(str, Enum):
+    UNIFORM = "uniform"
     MOST_FREE = "most_free"
     LEAST_FREE = "least_free"
-    ROUND_ROBIN = "round_robin"
 
 
 class ShardedWrapper(StorageWrapper):
+    """
+    Objects are placed on the wrapped client and the shards by their path on a consistent hashing ring.
+    Keys of any of them are accepted, listings are merged and use the name of the wrapped client.
+    Free space strategies weigh each shard's share of the ring by its free space, or the inverse of it.
+
+    Adding or removing a shard moves the affected keys in the background, at most rate keys per second.
+    While moving, reads fall back to the previous owner and writes remove the copy left there.
+    """
+
     def __init__(
         self,
         wrapped: StorageClientInterface,
-        shard: StorageClientInterface,
-        strategy: ShardStrategy = ShardStrategy.MOST_FREE,
+        shards: Union[StorageClientInterface, List[StorageClientInterface]],
+        strategy: ShardStrategy = ShardStrategy.UNIFORM,
+        vnodes: int = VNODES,
+        rate: Optional[float] = MIGRATION_RATE,
     ):
         super().__init__(wrapped)
-        self.shard: StorageClientInterface = shard
+        if not isinstance(shards, list):
+            shards = [shards]
         self.strategy: ShardStrategy = strategy
+        self.rate: Optional[float] = rate
+        self.shards: Dict[str, StorageClientInterface] = {str(client.name): client for client in [wrapped, *shards]}
+        # Placement now, and the one keys are being moved away from
+        self.ring: HashRing = HashRing(self._weights(self.shards), vnodes)
+        self.previous: Optional[HashRing] = None
+        self.migration: Optional[Thread] = None
+        self.migration_error: Optional[Exception] = None
+        self.ring_lock = Lock()
+        self.path_locks: List[Lock] = [Lock() for _ in range(STRIPES)]
 
-    def get(self, key: StorageKey) -> FileData:
-        if key.storage == self.shard.name:
-            return self.shard.get(key)
-        if key.storage == self.__wrapped__.name:
-            return self.__wrapped__.get(key)
-        raise ValueError(f"Key {key} does not belong to this shard")
+    def _weights(self, shards: Dict[str, StorageClientInterface]) -> Dict[str, float]:
+        if self.strategy == ShardStrategy.UNIFORM:
+            return {name: 1.0 for name in shards}
+        free = {name: client.available for name, client in shards.items()}
+        known = [available for available in free.values() if available is not None]
+        if not known:
+            return {name: 1.0 for name in shards}
+        # Shards that cannot tell count as average
+        average = max(sum(known) / len(known), 1.0)
+        weights = {}
+        for name, available in free.items():
+            share = 1.0 if available is None else max(available, 1) / average
+            if self.strategy == ShardStrategy.LEAST_FREE:
+                share = 1.0 / share
+            weights[name] = min(share, MAX_WEIGHT)
+        return weights
 
-    def put(self, obj: Object, data: FileData) -> None:
-        if obj.key.storage == self.shard.name:
-            self.shard.put(obj, data)
-        if obj.key.storage == self.__wrapped__.name:
-            self.__wrapped__.put(obj, data)
-        raise ValueError(f"Key {obj.key} does not belong to this shard")
+    def _key(self, key: StorageKey, client: StorageClientInterface) -> StorageKey:
+        if str(key.storage) not in self.shards:
+            raise ValueError(f"Key {key} does not belong to this shard")
+        return StorageKey(storage=client.name, path=key.path)
 
-    def remove(self, key: StorageKey) -> None:
-        if key.storage == self.shard.name:
-            self.shard.remove(key)
-        elif key.storage == self.__wrapped__.name:
-            self.__wrapped__.remove(key)
+    def _obj(self, obj: Object, client: StorageClientInterface) -> Object:
+        return Object(key=self._key(obj.key, client), metadata=obj.metadata, item=obj.item)
+
+    def _owners(self, key: StorageKey) -> List[StorageClientInterface]:
+        """
+        Clients that may hold the key, the current owner first.
+        """
+        with self.ring_lock:
+            ring, previous = self.ring, self.previous
+        path = str(key.path)
+        owner = self.shards[ring.owner(path)]
+        if previous is None or previous.owner(path) == ring.owner(path):
+            return [owner]
+        return [owner, self.shards[previous.owner(path)]]
+
+    @contextmanager
+    def _locked(self, keys: Optional[Iterable[StorageKey]] = None) -> Generator[None, None, None]:
+        """
+        Lock the paths of the keys, or every path when None.
+        """
+        if keys is None:
+            stripes = list(range(STRIPES))
         else:
-            raise ValueError(f"Key {key} does not belong to this shard")
+            stripes = sorted({ring_hash(str(key.path)) % STRIPES for key in keys})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self.path_locks[stripe])
+            yield
+
+    def _holder(self, key: StorageKey) -> StorageClientInterface:
+        owners = self._owners(key)
+        if len(owners) == 1:
+            return owners[0]
+        # Current owner is asked again last, the key may have moved to it in between
+        for client in owners + owners[:1]:
+            if self._key(key, client) in client:
+                return client
+        raise KeyError(f"Key '{key}' does not exist")
+
+    def _stale(self, keys: List[StorageKey]) -> None:
+        # Caller holds the path locks
+        for key in keys:
+            for client in self._owners(key)[1:]:
+                copy = self._key(key, client)
+                if copy in client:
+                    client.remove(copy)
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        client = self._holder(key)
+        return client.get(self._key(key, client), offset, length)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        client = self._holder(key)
+        return client.get_stream(self._key(key, client), chunk_size, offset, length)
 
     def stat(self, key: StorageKey) -> Object:
-        if key.storage == self.shard.name:
-            return self.shard.stat(key)
-        if key.storage == self.__wrapped__.name:
-            return self.__wrapped__.stat(key)
-        raise ValueError(f"Key {key} does not belong to this shard")
+        client = self._holder(key)
+        return client.stat(self._key(key, client))
+
+    def exists(self, key: StorageKey) -> bool:
+        return key in self
+
+    def __contains__(self, key: StorageKey) -> bool:
+        return any(self._key(key, client) in client for client in self._owners(key))
+
+    def put(self, obj: Object, data: FileData) -> None:
+        with self._locked([obj.key]):
+            client = self._owners(obj.key)[0]
+            client.put(self._obj(obj, client), data)
+            self._stale([obj.key])
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        with self._locked([obj.key]):
+            client = self._owners(obj.key)[0]
+            client.put_stream(self._obj(obj, client), stream)
+            self._stale([obj.key])
+
+    def remove(self, key: StorageKey) -> None:
+        self.remove_many([key])
+
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        if self.previous is not None:
+            return {key: self.get(key) for key in keys}
+        results: Dict[StorageKey, FileData] = {}
+        for client, group in self._group(keys):
+            fetched = client.get_many([self._key(key, client) for key in group])
+            results.update({key: fetched[self._key(key, client)] for key in group})
+        return {key: results[key] for key in keys}
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        by_path = {str(obj.key.path): (obj, data) for obj, data in items}
+        keys = [obj.key for obj, _ in by_path.values()]
+        with self._locked(keys):
+            for client, group in self._group(keys):
+                pairs = [by_path[str(key.path)] for key in group]
+                client.put_many([(self._obj(obj, client), data) for obj, data in pairs])
+            self._stale(keys)
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        with self._locked(keys):
+            groups: Dict[str, List[StorageKey]] = defaultdict(list)
+            for key in keys:
+                owners = self._owners(key)
+                held = [client for client in owners if self._key(key, client) in client] if len(owners) > 1 else owners
+                if not held:
+                    raise KeyError(f"Key '{key}' does not exist")
+                for client in held:
+                    groups[str(client.name)].append(self._key(key, client))
+            for name, group in groups.items():
+                self.shards[name].remove_many(group)
+
+    def _group(self, keys: List[StorageKey]) -> List[Tuple[StorageClientInterface, List[StorageKey]]]:
+        groups: Dict[str, List[StorageKey]] = defaultdict(list)
+        for key in keys:
+            groups[str(self._owners(key)[0].name)].append(key)
+        return [(self.shards[name], group) for name, group in groups.items()]
 
     def list(self, prefix: StorageKey, recursive: bool = False) -> List[StorageKey]:
-        if prefix.storage == self.shard.name:
-            return self.shard.list(prefix, recursive)
-        if prefix.storage == self.__wrapped__.name:
-            return self.__wrapped__.list(prefix, recursive)
-        raise ValueError(f"Key {prefix} does not belong to this shard")
+        return list(self.walk(prefix, None if recursive else 0))
+
+    def walk(
+        self, prefix: StorageKey, depth: Optional[int] = None, start_after: Optional[str] = None
+    ) -> Iterator[StorageKey]:
+        for _, key in self._merged(prefix, depth, start_after):
+            yield StorageKey(storage=self.__wrapped__.name, path=key.path)
+
+    def list_page(
+        self, prefix: StorageKey, recursive: bool = False, token: Optional[str] = None, limit: int = PAGE_SIZE
+    ) -> Tuple[List[StorageKey], Optional[str]]:
+        page = list(islice(self._merged(prefix, None if recursive else 0, token), limit + 1))
+        keys = [StorageKey(storage=self.__wrapped__.name, path=key.path) for _, key in page[:limit]]
+        token = order(*page[limit - 1]) if len(page) > limit else None
+        return keys, token
+
+    # Folders exist on several shards and keys on two while they move, each is listed once
+    def _merged(self, prefix: StorageKey, depth: Optional[int], start_after: Optional[str]) -> Iterator[Listed]:
+        return merge(
+            (client, client.walk(self._key(prefix, client), depth, start_after))
+            for client in list(self.shards.values())
+        )
+
+    def add_shard(self, shard: StorageClientInterface) -> None:
+        """
+        Add a shard to the ring and start moving the keys it now owns to it.
+        """
+        name = str(shard.name)
+        if name in self.shards:
+            raise ValueError(f"Shard {shard} is already on the ring")
+        weights = self._weights({**self.shards, name: shard})
+        # Writes in flight finish on the old placement first, so the migration sees them
+        with self._locked(), self.ring_lock:
+            self._check_migration()
+            self.shards[name] = shard
+            self._start_migration(HashRing(weights, self.ring.vnodes))
+
+    def remove_shard(self, shard: StorageClientInterface) -> None:
+        """
+        Take a shard off the ring and start moving its keys to their new owners, it is dropped once empty.
+        """
+        name = str(shard.name)
+        if name == str(self.__wrapped__.name):
+            raise ValueError("Wrapped client cannot be removed from the ring")
+        if name not in self.shards:
+            raise KeyError(f"Shard {shard} is not on the ring")
+        weights = self._weights({other: client for other, client in self.shards.items() if other != name})
+        with self._locked(), self.ring_lock:
+            self._check_migration()
+            self._start_migration(HashRing(weights, self.ring.vnodes))
+
+    def reweigh(self) -> bool:
+        """
+        Weigh the ring again by current free space, moving keys when the shares changed.
+        """
+        ring = HashRing(self._weights(self.shards), self.ring.vnodes)
+        with self._locked(), self.ring_lock:
+            self._check_migration()
+            # Small changes in free space round to the same points
+            if ring.points == self.ring.points and ring.owners == self.ring.owners:
+                return False
+            self._start_migration(ring)
+        return True
+
+    def _check_migration(self) -> None:
+        # Caller holds the ring lock
+        if self.previous is not None:
+            raise RuntimeError(f"Migration of {self} is still in progress")
+
+    def _start_migration(self, ring: HashRing) -> None:
+        # Caller holds the ring lock
+        self.previous, self.ring = self.ring, ring
+        self.migration_error = None
+        self.migration = Thread(target=self._migrate, name=f"{self.__class__.__name__}-migration", daemon=True)
+        self.migration.start()
+
+    def _migrate(self) -> None:
+        sources = [self.shards[name] for name in self.previous.nodes]
+        interval = 0.0 if self.rate is None else 1.0 / self.rate
+        try:
+            for source in sources:
+                root = StorageKey(storage=source.name, path=StoragePath(path=""))
+                for key in source.walk(root):
+                    # Storage info and lock of each shard stay with it
+                    if key.path in source.RESERVED:
+                        continue
+                    if self._move(source, key):
+                        time.sleep(interval)
+        except Exception as e:  # pylint: disable=broad-except
+            # Placement stays mixed, reads keep falling back until the migration is retried
+            self.migration_error = e
+            return
+        with self.ring_lock:
+            for name in self.previous.nodes:
+                if name not in self.ring.nodes:
+                    del self.shards[name]
+            self.previous = None
+
+    def _move(self, source: StorageClientInterface, key: StorageKey) -> bool:
+        with self._locked([key]):
+            target = self._owners(key)[0]
+            if str(target.name) == str(source.name):
+                return False
+            # Folders, and keys written or removed since they were listed, are not on the source as objects
+            if key not in source:
+                return False
+            copy = self._key(key, target)
+            # Written since the migration started, the copy left on the source is stale
+            if copy not in target:
+                obj = source.stat(key)
+                target.put_stream(self._obj(obj, target), source.get_stream(key))
+            source.remove(key)
+            return True
+
+    def wait_migration(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait for a running migration to finish, raising when it fails or times out.
+        """
+        migration = self.migration
+        if migration is not None:
+            migration.join(timeout)
+            if migration.is_alive():
+                raise RuntimeError(f"Migration of {self} timed out")
+        if self.migration_error is not None:
+            raise RuntimeError(f"Migration of {self} failed: {self.migration_error}")
+
+    def retry_migration(self) -> None:
+        """
+        Restart a failed migration, keys already moved are skipped.
+        """
+        with self.ring_lock:
+            if self.previous is None or (self.migration is not None and self.migration.is_alive()):
+                return
+            self.migration_error = None
+            self.migration = Thread(target=self._migrate, name=f"{self.__class__.__name__}-migration", daemon=True)
+            self.migration.start()
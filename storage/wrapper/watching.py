@@ -1,29 +1,203 @@
 """
-This module contains the implementation of an overlay wrapper for the storage client.
+This module contains the implementation of a watching wrapper for the storage client.
 """
-from typing import Callable, Dict
+import time
+from collections import OrderedDict, deque
+from enum import Enum
+from fnmatch import fnmatchcase
+from itertools import count, islice
+from threading import Condition, Thread, current_thread
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
 
-from storage.interface.client import StorageClientInterface
-from storage.models.object.file.data import FileData
+from storage.interface.client import PAGE_SIZE, StorageClientInterface
+from storage.models.header.models import HeaderOperation
+from storage.models.object.file.data import FileData, FileStream
 from storage.models.object.models import Object
 from storage.models.object.path import StorageKey
+from storage.models.wrapper.watching import ChangeEvent
 from storage.wrapper.interface import StorageWrapper
 
+Callback = Callable[[StorageKey], None]
+
+# Keys waiting for dispatch before writers are held back
+QUEUE_DEPTH: int = 1024
+
+# Changes kept for the change feed
+FEED_SIZE: int = 10_000
+
+
+class WatchKind(str, Enum):
+    KEY = "key"
+    PREFIX = "prefix"
+    GLOB = "glob"
+
 
 class WatchingWrapper(StorageWrapper):
-    def __init__(self, wrapped: StorageClientInterface):
+    """
+    Subscribers watch exact keys, path prefixes or glob patterns and are called from worker threads, not by writes.
+    Changes waiting for dispatch are coalesced per key, so a burst of writes calls each subscriber once.
+    Every change is also kept in a bounded change feed, read from a cursor for the lifetime of the wrapper.
+    Workers run until the wrapper is closed, which unlocking the wrapper does as well.
+    """
+
+    def __init__(
+        self, wrapped: StorageClientInterface, workers: int = 4, depth: int = QUEUE_DEPTH, retention: int = FEED_SIZE
+    ):
         super().__init__(wrapped)
-        self.callbacks: Dict[StorageKey, Callable[[StorageKey], None]] = {}
+        self.subscriptions: Dict[int, Tuple[WatchKind, str, Callback]] = {}
+        self.subscription_ids = count(1)
+        self.depth: int = depth
+        # Newest change per path waiting for dispatch, and paths whose subscribers are running
+        self.pending: OrderedDict[str, ChangeEvent] = OrderedDict()
+        self.dispatching: Set[str] = set()
+        self.feed: Deque[ChangeEvent] = deque(maxlen=retention)
+        self.feed_sequence: int = 0
+        self.watch_changed = Condition()
+        self.watch_closed: bool = False
+        self.dispatchers: List[Thread] = [
+            Thread(target=self._dispatch, name=f"{self.__class__.__name__}-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+
+    def watch(self, key: StorageKey, callback: Callback) -> int:
+        return self._subscribe(WatchKind.KEY, str(key.path), callback)
+
+    def watch_prefix(self, prefix: StorageKey, callback: Callback) -> int:
+        return self._subscribe(WatchKind.PREFIX, str(prefix.path), callback)
+
+    def watch_glob(self, pattern: str, callback: Callback) -> int:
+        """
+        Watch paths matching a shell style pattern, where '*' also matches across folders.
+        """
+        return self._subscribe(WatchKind.GLOB, pattern, callback)
+
+    def _subscribe(self, kind: WatchKind, pattern: str, callback: Callback) -> int:
+        with self.watch_changed:
+            subscription = next(self.subscription_ids)
+            self.subscriptions[subscription] = (kind, pattern, callback)
+        return subscription
+
+    def unwatch(self, subscription: int) -> None:
+        with self.watch_changed:
+            if self.subscriptions.pop(subscription, None) is None:
+                raise KeyError(f"Subscription {subscription} does not exist")
 
-    def watch(self, key: StorageKey, callback: Callable[[StorageKey], None]) -> None:
-        self.callbacks[key] = callback
+    def _matching(self, key: StorageKey) -> List[Callback]:
+        # Caller holds the condition
+        path = str(key.path)
+        callbacks = []
+        for kind, pattern, callback in self.subscriptions.values():
+            if kind == WatchKind.KEY:
+                matched = path == pattern
+            elif kind == WatchKind.PREFIX:
+                matched = not pattern or path == pattern or path.startswith(f"{pattern.rstrip('/')}/")
+            else:
+                matched = fnmatchcase(path, pattern)
+            if matched:
+                callbacks.append(callback)
+        return callbacks
+
+    def _notify(self, operation: HeaderOperation, keys: List[StorageKey]) -> None:
+        now = time.time()
+        # Subscribers writing through the wrapper are never held back, their worker is the one that would make room
+        dispatcher = current_thread() in self.dispatchers
+        with self.watch_changed:
+            for key in keys:
+                self.feed_sequence += 1
+                event = ChangeEvent(sequence=self.feed_sequence, key=key, operation=operation, timestamp=now)
+                self.feed.append(event)
+                if self.watch_closed or not self._matching(key):
+                    continue
+                path = str(key.path)
+                # Backpressure once too many keys are waiting, coalescing into a waiting key is always allowed
+                if not dispatcher:
+                    self.watch_changed.wait_for(lambda: len(self.pending) < self.depth or path in self.pending)
+                self.pending[path] = event
+            self.watch_changed.notify_all()
+
+    def _next(self) -> Optional[str]:
+        # Caller holds the condition, a path is never dispatched by two workers at once
+        return next((path for path in self.pending if path not in self.dispatching), None)
+
+    def _dispatch(self) -> None:
+        while True:
+            with self.watch_changed:
+                self.watch_changed.wait_for(lambda: self._next() is not None or self.watch_closed)
+                path = self._next()
+                if path is None:
+                    # Closed with nothing left this worker could dispatch
+                    return
+                event = self.pending.pop(path)
+                self.dispatching.add(path)
+                callbacks = self._matching(event.key)
+                self.watch_changed.notify_all()
+            for callback in callbacks:
+                try:
+                    callback(event.key)
+                except Exception:  # pylint: disable=broad-except
+                    # A failing subscriber must not stop the others or the worker
+                    continue
+            with self.watch_changed:
+                self.dispatching.discard(path)
+                self.watch_changed.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until every change so far has been dispatched to its subscribers.
+        """
+        with self.watch_changed:
+            done = self.watch_changed.wait_for(lambda: not self.pending and not self.dispatching, timeout)
+        if not done:
+            raise RuntimeError(f"Dispatch of {self} timed out")
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Dispatch the changes still waiting and stop the workers, later changes only reach the change feed.
+        """
+        with self.watch_changed:
+            self.watch_closed = True
+            self.watch_changed.notify_all()
+        for dispatcher in self.dispatchers:
+            dispatcher.join(timeout)
+
+    def unlock(self) -> None:
+        self.close()
+        self.__wrapped__.unlock()
+
+    def changes(
+        self, cursor: int = 0, limit: int = PAGE_SIZE, timeout: Optional[float] = None
+    ) -> Tuple[List[ChangeEvent], int]:
+        """
+        Changes after the cursor and the cursor to resume from, waiting up to the timeout for one when there is none.
+        """
+        with self.watch_changed:
+            if timeout is not None:
+                self.watch_changed.wait_for(lambda: self.feed_sequence > cursor, timeout)
+            oldest = self.feed[0].sequence if self.feed else self.feed_sequence + 1
+            if cursor < oldest - 1:
+                raise ValueError(f"Cursor {cursor} of {self} has expired, the feed starts at {oldest}")
+            start = cursor - oldest + 1
+            events = list(islice(self.feed, start, start + limit))
+        return events, events[-1].sequence if events else cursor
 
     def put(self, obj: Object, data: FileData) -> None:
-        super().put(obj, data)
-        if obj.key in self.callbacks:
-            self.callbacks[obj.key](obj.key)
+        self.__wrapped__.put(obj, data)
+        self._notify(HeaderOperation.PUT, [obj.key])
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        self.__wrapped__.put_stream(obj, stream)
+        self._notify(HeaderOperation.PUT, [obj.key])
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        self.__wrapped__.put_many(items)
+        self._notify(HeaderOperation.PUT, [obj.key for obj, _ in items])
 
     def remove(self, key: StorageKey) -> None:
-        super().remove(key)
-        if key in self.callbacks:
-            self.callbacks[key](key)
+        self.__wrapped__.remove(key)
+        self._notify(HeaderOperation.REMOVE, [key])
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        self.__wrapped__.remove_many(keys)
+        self._notify(HeaderOperation.REMOVE, keys)
@@ -0,0 +1,275 @@
+"""
+This wrapper acknowledges writes once staged locally and flushes them to the wrapped client in the background.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Timer
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from storage.interface.client import MISSING, StorageClientInterface
+from storage.models.object.file.data import CHUNK_SIZE, FileData, FileStream
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.writeback import StagedWrite
+from storage.wrapper.interface import StorageWrapper
+
+STAGING = "._writeback"
+
+# Seconds before a failed flush of a key is attempted again
+RETRY_DELAY: float = 5.0
+
+
+class WriteBackWrapper(StorageWrapper):
+    """
+    Repeated writes to a key are coalesced, only the newest staged state is flushed.
+    Reads, stat and membership see staged writes, listings only reflect what has been flushed.
+    """
+
+    def __init__(
+        self, wrapped: StorageClientInterface, staging: StorageClientInterface, workers: int = 8, depth: int = 1024
+    ):
+        super().__init__(wrapped)
+        self.staging: StorageClientInterface = staging
+        self.depth: int = depth
+        # Newest unflushed write per key, and the write each key is currently flushing
+        self.staged: Dict[StorageKey, StagedWrite] = {}
+        self.flushing: Dict[StorageKey, StagedWrite] = {}
+        self.queued: Set[StorageKey] = set()
+        self.failures: int = 0
+        # Last sequence handed out, continued from the writes recovered from staging
+        self.sequence: int = 0
+        self.error: Optional[Exception] = None
+        self.staged_changed = Condition()
+        self.flusher = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__)
+        self._recover()
+
+    def _staging_key(self, name: str) -> StorageKey:
+        return StorageKey(storage=self.staging.name, path=StoragePath(path=f"{STAGING}/{name}"))
+
+    def _data_key(self, write: StagedWrite) -> StorageKey:
+        return self._staging_key(write.name)
+
+    def _record_key(self, write: StagedWrite) -> StorageKey:
+        return self._staging_key(f"{write.name}.json")
+
+    def _recover(self) -> None:
+        prefix = StorageKey(storage=self.staging.name, path=StoragePath(path=STAGING))
+        data = []
+        superseded = []
+        for key in self.staging.walk(prefix, depth=0):
+            if key.path.suffix != ".json":
+                data.append(key)
+                continue
+            write = StagedWrite.from_raw(self.staging.get(key))
+            current = self.staged.get(write.key)
+            if current is None or current.sequence < write.sequence:
+                self.staged[write.key] = write
+                if current is not None:
+                    superseded.append(current)
+            else:
+                superseded.append(write)
+            self.sequence = max(self.sequence, write.sequence)
+        # Older writes to a key were left when stopped before discarding them, data without a record was never staged
+        self._discard(superseded)
+        recorded = {self._data_key(write) for write in [*self.staged.values(), *superseded]}
+        orphans = [key for key in data if key not in recorded]
+        if orphans:
+            self.staging.remove_many(orphans)
+        with self.staged_changed:
+            for key in list(self.staged):
+                self._schedule(key)
+
+    def _next(self) -> int:
+        with self.staged_changed:
+            self.sequence += 1
+            return self.sequence
+
+    def _stage(self, writes: List[StagedWrite]) -> None:
+        records = [
+            Object.create_file(self._record_key(write), write.to_json().encode(), fingerprint=False) for write in writes
+        ]
+        self.staging.put_many(records)
+        superseded = []
+        with self.staged_changed:
+            for write in writes:
+                # Backpressure once too many keys are waiting, coalescing into a waiting key is always allowed
+                self.staged_changed.wait_for(lambda: len(self.staged) < self.depth or write.key in self.staged)
+                previous = self.staged.get(write.key)
+                if previous is not None and previous.sequence > write.sequence:
+                    # Overtaken by a later write staged concurrently
+                    superseded.append(write)
+                    continue
+                self.staged[write.key] = write
+                if previous is not None and self.flushing.get(write.key) is not previous:
+                    superseded.append(previous)
+                self._schedule(write.key)
+        self._discard(superseded)
+
+    def _discard(self, writes: List[StagedWrite]) -> None:
+        keys = []
+        for write in writes:
+            keys.append(self._record_key(write))
+            if write.obj is not None:
+                keys.append(self._data_key(write))
+        if keys:
+            self.staging.remove_many(keys)
+
+    def _schedule(self, key: StorageKey) -> None:
+        # Caller holds the condition
+        if key in self.queued or key in self.flushing:
+            return
+        self.queued.add(key)
+        self.flusher.submit(self._flush, key)
+
+    def _retry(self, key: StorageKey) -> None:
+        with self.staged_changed:
+            if key in self.staged:
+                self._schedule(key)
+
+    def _flush(self, key: StorageKey) -> None:
+        with self.staged_changed:
+            self.queued.discard(key)
+            write = self.staged.get(key)
+            if write is None:
+                return
+            self.flushing[key] = write
+        try:
+            if write.obj is None:
+                if key in self.__wrapped__:
+                    self.__wrapped__.remove(key)
+            else:
+                self.__wrapped__.put_stream(write.obj, self.staging.get_stream(self._data_key(write)))
+        except Exception as e:  # pylint: disable=broad-except
+            with self.staged_changed:
+                self.failures += 1
+                self.error = e
+                del self.flushing[key]
+                superseded = self.staged.get(key) is not write
+            if superseded:
+                self._discard([write])
+            # Retried later without holding a worker, a newer write to the key schedules it at once
+            retry = Timer(RETRY_DELAY, self._retry, (key,))
+            retry.daemon = True
+            retry.start()
+            return
+
+        with self.staged_changed:
+            del self.flushing[key]
+            if self.staged.get(key) is write:
+                del self.staged[key]
+            else:
+                # Newer write arrived while flushing
+                self._schedule(key)
+            self.staged_changed.notify_all()
+        self._discard([write])
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until every write staged before the call has reached the wrapped client.
+        """
+        with self.staged_changed:
+            barrier = self.sequence
+            done = self.staged_changed.wait_for(
+                lambda: all(write.sequence > barrier for write in self.staged.values()), timeout
+            )
+        if not done:
+            raise RuntimeError(f"Flush of {self} timed out, last error: {self.error}")
+
+    def _pending(self, key: StorageKey) -> Optional[StagedWrite]:
+        with self.staged_changed:
+            return self.staged.get(key)
+
+    def get(self, key: StorageKey, offset: int = 0, length: Optional[int] = None) -> FileData:
+        write = self._pending(key)
+        if write is None:
+            return self.__wrapped__.get(key, offset, length)
+        if write.obj is None:
+            raise KeyError(f"Key '{key}' does not exist")
+        try:
+            return self.staging.get(self._data_key(write), offset, length)
+        except MISSING:
+            # Flushed and discarded since it was looked up
+            return self.__wrapped__.get(key, offset, length)
+
+    def get_stream(
+        self, key: StorageKey, chunk_size: int = CHUNK_SIZE, offset: int = 0, length: Optional[int] = None
+    ) -> FileStream:
+        write = self._pending(key)
+        if write is None:
+            yield from self.__wrapped__.get_stream(key, chunk_size, offset, length)
+            return
+        if write.obj is None:
+            raise KeyError(f"Key '{key}' does not exist")
+        started = False
+        try:
+            for data in self.staging.get_stream(self._data_key(write), chunk_size, offset, length):
+                started = True
+                yield data
+        except MISSING:
+            # Flushed and discarded since it was looked up, unless it went missing part way through
+            if started:
+                raise
+            yield from self.__wrapped__.get_stream(key, chunk_size, offset, length)
+
+    def get_many(self, keys: List[StorageKey]) -> Dict[StorageKey, FileData]:
+        pending = {key: self._pending(key) for key in keys}
+        for key, write in pending.items():
+            if write is not None and write.obj is None:
+                raise KeyError(f"Key '{key}' does not exist")
+        staged = {self._data_key(write): key for key, write in pending.items() if write is not None}
+        try:
+            results = {staged[key]: data for key, data in self.staging.get_many(list(staged)).items()}
+        except MISSING:
+            # Some were flushed and discarded since they were looked up, each is read from where it is now
+            results = {key: self.get(key) for key in staged.values()}
+        results.update(self.__wrapped__.get_many([key for key, write in pending.items() if write is None]))
+        return {key: results[key] for key in keys}
+
+    def _staged_object(self, obj: Object) -> Tuple[Object, str]:
+        name = uuid4().hex
+        return Object(key=self._staging_key(name), metadata=obj.metadata, item=obj.item), name
+
+    def put(self, obj: Object, data: FileData) -> None:
+        self.put_many([(obj, data)])
+
+    def put_stream(self, obj: Object, stream: FileStream) -> None:
+        staged, name = self._staged_object(obj)
+        self.staging.put_stream(staged, stream)
+        # Sequenced once staged, the content information of streamed objects is final only now
+        self._stage([StagedWrite(key=obj.key, name=name, sequence=self._next(), obj=obj)])
+
+    def put_many(self, items: List[Tuple[Object, FileData]]) -> None:
+        staged = [self._staged_object(obj) for obj, _ in items]
+        self.staging.put_many([(copy, data) for (copy, _), (_, data) in zip(staged, items)])
+        self._stage(
+            [
+                StagedWrite(key=obj.key, name=name, sequence=self._next(), obj=obj)
+                for (_, name), (obj, _) in zip(staged, items)
+            ]
+        )
+
+    def remove(self, key: StorageKey) -> None:
+        self.remove_many([key])
+
+    def remove_many(self, keys: List[StorageKey]) -> None:
+        for key in keys:
+            if key not in self:
+                raise KeyError(f"Key '{key}' does not exist")
+        self._stage([StagedWrite(key=key, name=uuid4().hex, sequence=self._next()) for key in keys])
+
+    def stat(self, key: StorageKey) -> Object:
+        write = self._pending(key)
+        if write is None:
+            return self.__wrapped__.stat(key)
+        if write.obj is None:
+            raise KeyError(f"Key '{key}' does not exist")
+        return write.obj
+
+    def exists(self, key: StorageKey) -> bool:
+        return key in self
+
+    def __contains__(self, key: StorageKey) -> bool:
+        write = self._pending(key)
+        if write is None:
+            return key in self.__wrapped__
+        return write.obj is not None
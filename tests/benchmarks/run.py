@@ -0,0 +1,267 @@
+"""
+Storage microbenchmarks across clients and wrapper stacks, with JSON baselines compared between runs.
+
+    python -m tests.benchmarks.run --clients memory local --save
+    python -m tests.benchmarks.run --clients memory local --compare
+
+S3 runs against a local MinIO, given with --s3-endpoint, one bucket per client instance.
+Baselines are named after the host by default, the committed one is compared against with --name reference.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Settings and name server the clients need, in place before any client module reads them
+from tests import environment  # isort: skip
+from storage.client.local import LocalClient
+from storage.client.memory import MemoryClient
+from storage.client.s3 import S3Client
+from storage.interface.client import StorageClientInterface
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.index import IndexWrapper
+from storage.wrapper.overlay import OverlayWrapper
+from storage.wrapper.replication import ReplicationWrapper
+from storage.wrapper.safety import SafetyWrapper
+
+BASELINES = Path(__file__).parent / "baselines"
+
+OPERATIONS = ["put", "stat", "get", "list", "remove"]
+
+# Object sizes in bytes and number of directories the objects are spread over
+SIZES = [1024, 64 * 1024, 1024 * 1024]
+FANOUTS = [1, 16]
+
+# Objects written per size and fan-out
+COUNT: int = 200
+
+# Slowdown of the median latency against the baseline reported as a regression
+THRESHOLD: float = 0.2
+
+Factory = Callable[[], StorageClientInterface]
+
+
+class Clients:
+    """
+    Makes fresh clients of one kind, and removes what they stored once closed.
+    """
+
+    def __init__(self, kind: str, arguments: argparse.Namespace):
+        self.kind: str = kind
+        self.arguments = arguments
+        self.made: List[StorageClientInterface] = []
+        self.directories: List[str] = []
+
+    def __call__(self) -> StorageClientInterface:
+        if self.kind == "memory":
+            client = MemoryClient()
+        elif self.kind == "local":
+            directory = tempfile.mkdtemp(prefix="benchmark-")
+            self.directories.append(directory)
+            client = LocalClient(StoragePath(path=directory))
+        elif self.kind == "s3":
+            client = self._s3()
+        else:
+            raise ValueError(f"Unknown client '{self.kind}'")
+        self.made.append(client)
+        return client
+
+    def _s3(self) -> S3Client:
+        bucket = f"{self.arguments.s3_bucket}-{len(self.made)}"
+        return S3Client(
+            bucket,
+            self.arguments.s3_endpoint,
+            self.arguments.s3_access_key,
+            self.arguments.s3_secret_key,
+            secure=False,
+        )
+
+    def close(self) -> None:
+        for client in self.made:
+            client.unlock()
+        for directory in self.directories:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.made.clear()
+        self.directories.clear()
+
+
+def prepare_s3(arguments: argparse.Namespace, buckets: int) -> None:
+    """
+    Create the buckets S3 clients use, clients expect them to exist.
+    """
+    # pylint: disable=import-outside-toplevel
+    from minio import Minio
+
+    minio = Minio(arguments.s3_endpoint, arguments.s3_access_key, arguments.s3_secret_key, secure=False)
+    for index in range(buckets):
+        bucket = f"{arguments.s3_bucket}-{index}"
+        if not minio.bucket_exists(bucket):
+            minio.make_bucket(bucket)
+
+
+STACKS: Dict[str, Callable[[Factory], StorageClientInterface]] = {
+    "plain": lambda make: make(),
+    "safety": lambda make: SafetyWrapper(make()),
+    "index": lambda make: IndexWrapper(make(), make()),
+    "overlay": lambda make: OverlayWrapper(make(), make()),
+    "replication": lambda make: ReplicationWrapper(make(), [make()]),
+}
+
+
+def summarise(latencies: List[float], size: int) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "ops": len(ordered) / total if total else 0.0,
+        "mbps": len(ordered) * size / total / 1e6 if total and size else 0.0,
+        "mean": statistics.fmean(ordered),
+        "p50": percentile(0.50),
+        "p90": percentile(0.90),
+        "p99": percentile(0.99),
+    }
+
+
+def timed(operation: Callable[..., object], *args) -> float:
+    start = time.perf_counter()
+    operation(*args)
+    return time.perf_counter() - start
+
+
+def measure(client: StorageClientInterface, size: int, fanout: int, count: int) -> Dict[str, Dict[str, float]]:
+    """
+    Latencies of every operation over objects of one size spread across the fan-out of directories.
+    """
+    root = StorageKey(storage=client.name, path=StoragePath(path="benchmark"))
+    folders = [root.join(f"d{index:04d}") for index in range(fanout)]
+    keys = [folders[index % fanout].join(f"o{index:06d}") for index in range(count)]
+    payload = os.urandom(size)
+    objects = [Object.create_file(key, payload, fingerprint=False) for key in keys]
+    latencies: Dict[str, List[float]] = {operation: [] for operation in OPERATIONS}
+    for obj, data in objects:
+        latencies["put"].append(timed(client.put, obj, data))
+    for key in keys:
+        latencies["stat"].append(timed(client.stat, key))
+    for key in keys:
+        latencies["get"].append(timed(client.get, key))
+    for folder in folders:
+        latencies["list"].append(timed(client.list, folder))
+    for key in keys:
+        latencies["remove"].append(timed(client.remove, key))
+    moved = {"put": size, "get": size}
+    return {operation: summarise(values, moved.get(operation, 0)) for operation, values in latencies.items()}
+
+
+def run(arguments: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for kind in arguments.clients:
+        for stack in arguments.stacks:
+            clients = Clients(kind, arguments)
+            try:
+                if kind == "s3":
+                    prepare_s3(arguments, buckets=2)
+                target = STACKS[stack](clients)
+                for size in arguments.sizes:
+                    for fanout in arguments.fanouts:
+                        measured = measure(target, size, fanout, arguments.count)
+                        for operation, summary in measured.items():
+                            name = f"{kind}/{stack}/{operation}/{size}/{fanout}"
+                            results[name] = summary
+                            print(f"{name:<48} p50 {summary['p50'] * 1e3:9.3f} ms  p99 {summary['p99'] * 1e3:9.3f} ms")
+            finally:
+                clients.close()
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float
+) -> Tuple[List[str], List[str]]:
+    """
+    Names of results whose median latency grew by more than the threshold over the baseline, and of results the
+    baseline has no median for.
+    """
+    regressions = []
+    unmatched = []
+    for name, summary in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or not previous["p50"]:
+            unmatched.append(name)
+            continue
+        change = summary["p50"] / previous["p50"] - 1
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"{name:<48} p50 {previous['p50'] * 1e3:9.3f} -> {summary['p50'] * 1e3:9.3f} ms {change:+8.1%} {marker}")
+        if change > threshold:
+            regressions.append(name)
+    for name in unmatched:
+        print(f"{name:<48} not in the baseline")
+    return regressions, unmatched
+
+
+def parse(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", nargs="+", default=["memory", "local"], choices=["memory", "local", "s3"])
+    parser.add_argument("--stacks", nargs="+", default=list(STACKS), choices=list(STACKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--fanouts", nargs="+", type=int, default=FANOUTS)
+    parser.add_argument("--count", type=int, default=COUNT)
+    parser.add_argument("--name", default=platform.node(), help="Baseline name, by default the host name")
+    parser.add_argument("--output", type=Path, help="Write results to this file")
+    parser.add_argument("--save", action="store_true", help="Store results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare results with the baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--s3-endpoint", default="localhost:9000")
+    parser.add_argument("--s3-access-key", default="minioadmin")
+    parser.add_argument("--s3-secret-key", default="minioadmin")
+    parser.add_argument("--s3-bucket", default="benchmark")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = parse(argv)
+    try:
+        results = run(arguments)
+    finally:
+        environment.shutdown()
+    document: Dict[str, object] = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "count": arguments.count,
+        },
+        "results": results,
+    }
+    baseline_path = BASELINES / f"{arguments.name}.json"
+    if arguments.output is not None:
+        arguments.output.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    regressions: List[str] = []
+    if arguments.compare:
+        if not baseline_path.exists():
+            print(f"No baseline at {baseline_path}, run with --save first")
+            return 2
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+        regressions, unmatched = compare(results, baseline, arguments.threshold)
+        if len(unmatched) == len(results):
+            # Nothing was compared, as with a baseline of other clients, stacks, sizes or fanouts
+            print(f"No results match the baseline at {baseline_path}")
+            return 2
+    if arguments.save:
+        BASELINES.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
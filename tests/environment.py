@@ -0,0 +1,40 @@
+"""
+Settings and a name server for storage clients made outside a deployment, by tests and benchmarks.
+Storage clients are distributed objects, registered with a name server on the distribution port as they are made.
+The name server runs in this process on the IPv6 loopback, as the daemon of the clients takes the port on IPv4.
+Settings are read once on import, so this module is imported before any client module.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+from threading import Thread
+
+import Pyro5.nameserver
+from Pyro5 import config as PyroConfig
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("", 0))
+        return probe.getsockname()[1]
+
+
+PORT = _free_port()
+CONFIG = os.path.join(tempfile.mkdtemp(prefix="tests-"), "config.json")
+with open(CONFIG, "w", encoding="utf-8") as handle:
+    json.dump({"distribution": {"port": PORT}}, handle)
+os.environ["VINT_CONFIG_FILE"] = CONFIG
+
+PyroConfig.NS_HOST = "::1"
+_, NAMESERVER, _ = Pyro5.nameserver.start_ns(host="::1", port=PORT, enableBroadcast=False)
+Thread(target=NAMESERVER.requestLoop, name="nameserver", daemon=True).start()
+
+
+def shutdown() -> None:
+    # The daemon of the clients runs in a foreground thread, started by the first client made
+    distributed = sys.modules.get("distribution.superclass.distributed")
+    if distributed is not None:
+        distributed.Distributed.daemon.shutdown()
+    NAMESERVER.shutdown()
@@ -0,0 +1,10 @@
+"""
+Storage clients are made against the settings and name server of the test environment, set up before collection.
+"""
+import pytest
+
+from tests import environment
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    environment.shutdown()
@@ -20,3 +20,16 @@ from datamodel.data.model import Data
 def test_json_merge(obj1, obj2, result):
     _, merged = Data.merge(obj1, obj2)
     assert merged == result
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        '{"a": "1", "b": "2"}',
+        b'{"a": "1", "b": "2"}',
+        bytearray(b'{"a": "1", "b": "2"}'),
+        memoryview(b'{"a": "1", "b": "2"}'),
+    ],
+)
+def test_from_raw_buffers(raw):
+    assert Data.from_raw(raw) == Data(a="1", b="2")
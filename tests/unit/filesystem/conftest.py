@@ -0,0 +1,24 @@
+"""
+Stand-in for fusepy where libfuse is missing, the operations are called directly rather than mounted.
+"""
+import os
+import sys
+from types import ModuleType
+
+try:
+    import fuse  # noqa: F401 pylint: disable=unused-import
+except OSError:
+
+    class FuseOSError(OSError):
+        def __init__(self, code):
+            super().__init__(code, os.strerror(code))
+
+    class Operations:
+        pass
+
+    class LoggingMixIn:
+        pass
+
+    stand_in = ModuleType("fuse")
+    stand_in.FuseOSError, stand_in.Operations, stand_in.LoggingMixIn = FuseOSError, Operations, LoggingMixIn
+    sys.modules["fuse"] = stand_in
@@ -0,0 +1,38 @@
+"""
+Test the page cache keeps blocks per file version within its capacity, and the TTL cache expires entries
+"""
+import time
+
+from filesystem.cache import PageCache, TTLCache
+
+
+def test_page_versions():
+    cache = PageCache(block_size=4, blocks=8)
+    cache.put("a", 1, 0, b"abcd")
+    assert cache.get("a", 1, 0) == b"abcd"
+    assert cache.get("a", 2, 0) is None
+    cache.put("a", 2, 1, b"efgh")
+    assert cache.get("a", 2, 0) is None
+    assert cache.get("a", 2, 1) == b"efgh"
+
+
+def test_page_eviction():
+    cache = PageCache(block_size=4, blocks=2)
+    cache.put("a", 1, 0, b"0")
+    cache.put("b", 1, 0, b"1")
+    cache.get("a", 1, 0)
+    cache.put("c", 1, 0, b"2")
+    assert cache.get("a", 1, 0) == b"0"
+    assert cache.get("b", 1, 0) is None
+    assert set(cache.paths) == {"a", "c"}
+
+
+def test_ttl():
+    cache = TTLCache(ttl=0.05, size=2)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None
+    time.sleep(0.06)
+    assert cache.get("b") is None
@@ -0,0 +1,56 @@
+"""
+Test filesystem operations on a local client called directly, without mounting
+"""
+import errno
+import os
+
+import pytest
+from fuse import FuseOSError
+
+from filesystem.mount import StorageOperations
+from storage.client.local import LocalClient
+from storage.models.object.path import StoragePath
+
+
+@pytest.fixture
+def operations(tmp_path):
+    client = LocalClient(StoragePath(path=str(tmp_path)))
+    yield StorageOperations(client)
+    client.unlock()
+
+
+def test_file_lifecycle(operations):
+    fh = operations.create("/x.txt", 0o644)
+    assert operations.write("/x.txt", b"hello", 0, fh) == 5
+    operations.release("/x.txt", fh)
+
+    assert operations.getattr("/x.txt")["st_size"] == 5
+    fh = operations.open("/x.txt", os.O_RDONLY)
+    assert operations.read("/x.txt", 5, 0, fh) == b"hello"
+    assert operations.read("/x.txt", 10, 3, fh) == b"lo"
+    operations.release("/x.txt", fh)
+    assert "x.txt" in operations.readdir("/", 0)
+
+    operations.unlink("/x.txt")
+    assert "x.txt" not in operations.readdir("/", 0)
+    with pytest.raises(FuseOSError) as error:
+        operations.getattr("/x.txt")
+    assert error.value.errno == errno.ENOENT
+
+
+def test_folders(operations):
+    operations.mkdir("/folder", 0o755)
+    fh = operations.create("/folder/y.txt", 0o644)
+    operations.write("/folder/y.txt", b"data", 0, fh)
+    operations.release("/folder/y.txt", fh)
+    assert operations.readdir("/folder", 0) == [".", "..", "y.txt"]
+    with pytest.raises(FuseOSError) as error:
+        operations.rmdir("/folder")
+    assert error.value.errno == errno.ENOTEMPTY
+
+
+def test_missing(operations):
+    for path in ["/missing.txt", "/missing/x.txt"]:
+        with pytest.raises(FuseOSError) as error:
+            operations.getattr(path)
+        assert error.value.errno == errno.ENOENT
@@ -0,0 +1,34 @@
+"""
+Storage clients for tests, unlocked again once the test is done.
+"""
+import pytest
+
+from storage.client.local import LocalClient
+from storage.client.memory import MemoryClient
+from storage.models.object.path import StoragePath
+
+
+@pytest.fixture
+def memory():
+    made = []
+
+    def make() -> MemoryClient:
+        made.append(MemoryClient())
+        return made[-1]
+
+    yield make
+    for client in made:
+        client.unlock()
+
+
+@pytest.fixture
+def local(tmp_path):
+    made = []
+
+    def make(name: str = "local", **kwargs) -> LocalClient:
+        made.append(LocalClient(StoragePath(path=str(tmp_path / name)), **kwargs))
+        return made[-1]
+
+    yield make
+    for client in made:
+        client.unlock()
@@ -0,0 +1,42 @@
+"""
+Test the asynchronous sharding wrapper places keys on the same ring as the blocking one
+"""
+import asyncio
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.asynchronous import AsyncBaseStorageClient
+from storage.superclass.ring import HashRing
+from storage.wrapper.asynchronous import AsyncShardedWrapper
+
+PATHS = [f"folder{index % 3}/file{index}" for index in range(30)]
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def test_sharded(memory):
+    clients = [memory() for _ in range(3)]
+    shards = [AsyncBaseStorageClient(client) for client in clients]
+    client = AsyncShardedWrapper(shards[0], shards[1:])
+    ring = HashRing({str(shard.name): 1.0 for shard in clients})
+
+    async def run():
+        for path in PATHS:
+            await client.put(*Object.create_file(key(client, path), path.encode()))
+        # Keys named after any shard reach the owner
+        assert await client.get(key(shards[2], PATHS[0])) == PATHS[0].encode()
+        assert await client.exists(key(client, PATHS[1]))
+        listed = await client.list(key(client, "folder0"))
+        await client.remove(key(client, PATHS[0]))
+        return listed, await client.exists(key(client, PATHS[0]))
+
+    listed, exists = asyncio.run(run())
+    for path in PATHS[1:]:
+        owner = next(shard for shard in clients if str(shard.name) == ring.owner(path))
+        assert owner.get(key(owner, path)) == path.encode()
+    assert listed == [key(client, path) for path in sorted(PATHS[::3])]
+    assert not exists
+    # Spread over every shard
+    assert all(shard.list(key(shard, "folder1")) for shard in clients)
@@ -0,0 +1,21 @@
+"""
+Test the Bloom filter has no false negatives and roughly its configured false positive rate
+"""
+from storage.superclass.bloom import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter.of((f"present/{index}" for index in range(1000)), capacity=1000)
+    assert all(f"present/{index}" in bloom for index in range(1000))
+    assert not bloom.full
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter.of((f"present/{index}" for index in range(1000)), capacity=1000, error=0.01)
+    false = sum(f"absent/{index}" in bloom for index in range(10000))
+    assert false < 300
+
+
+def test_full():
+    bloom = BloomFilter.of((str(index) for index in range(11)), capacity=10)
+    assert bloom.full
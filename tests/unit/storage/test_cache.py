@@ -0,0 +1,118 @@
+"""
+Test cached reads hit the memory and disk tiers, and are dropped on writes or once found stale
+"""
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.cache import CacheWrapper
+from storage.wrapper.interface import StorageWrapper
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+@pytest.fixture
+def cached(memory):
+    wrapped, disk = memory(), memory()
+    return wrapped, CacheWrapper(wrapped, disk, memory_bytes=1024 * 1024, ttl=60)
+
+
+def put(client, path, data):
+    obj, data = Object.create_file(key(client, path), data)
+    client.put(obj, data)
+    return obj.key
+
+
+def test_tiers(cached):
+    wrapped, client = cached
+    file = put(wrapped, "file", b"data")
+    assert client.get(file) == b"data"
+    assert client.statistics.misses == 1
+    assert client.get(file, 1, 2) == b"at"
+    assert b"".join(client.get_stream(file, 1)) == b"data"
+    assert client.statistics.memory_hits == 2
+
+    # Dropped from memory, the disk copy is used and brought back into memory
+    client.memory.clear()
+    client.memory_used = 0
+    assert client.get(file) == b"data"
+    assert client.statistics.disk_hits == 1
+    assert client.get(file) == b"data"
+    assert client.statistics.memory_hits == 3
+
+
+def test_validity(cached):
+    wrapped, client = cached
+    file = put(wrapped, "file", b"data")
+    client.get(file)
+    # Changed elsewhere, served as cached until its validity runs out
+    put(wrapped, "file", b"changed")
+    assert client.get(file) == b"data"
+    client.ttl = 0
+    assert client.get(file) == b"changed"
+    assert client.statistics.revalidations == 1
+    assert client.statistics.invalidations == 1
+    # Unchanged entries are kept when revalidated
+    assert client.get(file) == b"changed"
+    assert client.statistics.revalidations == 2
+    assert client.statistics.memory_hits == 2
+
+
+def test_invalidation(cached):
+    wrapped, client = cached
+    file = put(wrapped, "file", b"data")
+    client.get(file)
+    put(client, "file", b"written")
+    assert client.get(file) == b"written"
+    assert client.statistics.invalidations == 1
+    assert client.statistics.misses == 2
+
+    client.remove(file)
+    assert not client.memory
+    assert not client.disk_entries
+
+
+def test_batches(cached):
+    wrapped, client = cached
+    files = [put(wrapped, f"file{index}", f"data{index}".encode()) for index in range(3)]
+    client.get(files[0])
+    assert client.get_many(files) == {file: f"data{index}".encode() for index, file in enumerate(files)}
+    assert client.statistics.memory_hits == 1
+    assert client.statistics.misses == 3
+    assert client.get_many(files[1:]) == {files[1]: b"data1", files[2]: b"data2"}
+    assert client.statistics.memory_hits == 3
+
+    client.remove_many(files)
+    assert not client.memory
+
+
+class Unsigned(StorageWrapper):
+    """
+    Stats without a content hash, as S3 gives them.
+    """
+
+    def stat(self, key):
+        obj = self.__wrapped__.stat(key).model_copy(deep=True)
+        obj.item.content.signature = None
+        return obj
+
+
+def test_unsigned(memory):
+    wrapped = memory()
+    client = CacheWrapper(Unsigned(wrapped), memory_bytes=1024 * 1024, ttl=60)
+    file = put(wrapped, "file", b"data")
+    assert client.get(file) == b"data"
+    assert b"".join(client.get_stream(file)) == b"data"
+    assert client.statistics.misses == 1
+    assert client.statistics.memory_hits == 1
+
+    # Revalidated by size and modification time
+    client.ttl = 0
+    assert client.get(file) == b"data"
+    assert client.statistics.revalidations == 1
+    assert client.statistics.memory_hits == 2
+    put(wrapped, "file", b"changed")
+    assert client.get(file) == b"changed"
+    assert client.statistics.invalidations == 1
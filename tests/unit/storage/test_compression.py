@@ -0,0 +1,70 @@
+"""
+Test compressed objects decode from their stored data alone, whole, in ranges, streamed and in batches
+"""
+import random
+
+import pytest
+
+from storage.models.object.file.info import CompressionAlgorithm
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.compression import CompressionPolicy
+from storage.wrapper.compression import CompressionWrapper, decode_header
+
+FRAME = 4096
+
+# Compressible but not trivially so, frames differ from each other
+TEXT = b"".join(f"line {index} of {random.Random(index).random()}\n".encode() for index in range(2000))
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+@pytest.fixture(params=[CompressionAlgorithm.LZ4, CompressionAlgorithm.GZIP, None])
+def compressed(request, local):
+    wrapped = local()
+    policy = CompressionPolicy(default=request.param, skipped=[])
+    return wrapped, CompressionWrapper(wrapped, policy, frame_size=FRAME)
+
+
+def test_round_trip(compressed):
+    wrapped, client = compressed
+    obj, data = Object.create_file(key(client, "file.txt"), TEXT)
+    client.put(obj, data)
+    layout, _ = decode_header(wrapped.get(obj.key))
+    assert layout.algorithm == client.policy.default
+    assert layout.raw_bytes == len(TEXT)
+    if layout.algorithm is not None:
+        assert len(wrapped.get(obj.key)) < len(TEXT)
+
+    assert client.get(obj.key) == TEXT
+    for offset, length in [(0, 10), (FRAME - 5, 10), (3 * FRAME + 7, 2 * FRAME), (len(TEXT) - 3, 100)]:
+        assert client.get(obj.key, offset, length) == TEXT[offset:][:length]
+        assert b"".join(client.get_stream(obj.key, 1000, offset, length)) == TEXT[offset:][:length]
+    assert client.get(obj.key, len(TEXT) + 10) == b""
+
+
+def test_stream(compressed):
+    _, client = compressed
+    obj = Object.create_file(key(client, "stream.txt"), b"")[0]
+    client.put_stream(obj, iter([TEXT[:10_000], TEXT[10_000:]]))
+    assert client.get(obj.key) == TEXT
+    assert b"".join(client.get_stream(obj.key, 777)) == TEXT
+
+
+def test_batches(compressed):
+    _, client = compressed
+    items = [Object.create_file(key(client, f"file{index}.txt"), TEXT[index:]) for index in range(3)]
+    client.put_many(items)
+    assert client.get_many([obj.key for obj, _ in items]) == {obj.key: data for obj, data in items}
+
+
+def test_incompressible(local):
+    wrapped = local()
+    client = CompressionWrapper(wrapped, CompressionPolicy(skipped=[]), frame_size=FRAME)
+    data = random.Random(0).getrandbits(8 * 3 * FRAME).to_bytes(3 * FRAME, "little")
+    obj, _ = Object.create_file(key(client, "random.bin"), data)
+    client.put(obj, data)
+    assert decode_header(wrapped.get(obj.key))[0].algorithm is None
+    assert client.get(obj.key, FRAME, FRAME) == data[FRAME:][:FRAME]
@@ -0,0 +1,124 @@
+"""
+Test content-defined chunking and the deduplicating wrapper sharing chunks between objects
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.chunking import Chunker
+from storage.wrapper.dedup import CHUNKS, DedupWrapper
+
+CHUNKER = Chunker(average=1024, minimum=256, maximum=4096)
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def content(size, seed=0):
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, "little")
+
+
+def pieces(data, size):
+    return [data[start : start + size] for start in range(0, len(data), size)]  # noqa: E203
+
+
+def chunks(wrapped):
+    # Chunks are named by their digest, next to their reference counts and below folders of the digest prefix
+    return {item.path.name for item in wrapped.walk(key(wrapped, CHUNKS)) if len(item.path.name) == 64}
+
+
+def test_chunker_split():
+    data = content(64 * 1024)
+    split = [bytes(chunk) for chunk in CHUNKER.split(data)]
+    assert b"".join(split) == data
+    assert all(len(chunk) <= CHUNKER.maximum for chunk in split)
+    assert split == [bytes(chunk) for chunk in CHUNKER.split(data)]
+    assert split == [bytes(chunk) for chunk in CHUNKER.split_stream(pieces(data, 1000))]
+
+
+def test_chunker_insertion():
+    data = content(64 * 1024)
+    edited = data[:30_000] + b"inserted" + data[30_000:]
+    before = {bytes(chunk) for chunk in CHUNKER.split(data)}
+    after = {bytes(chunk) for chunk in CHUNKER.split(edited)}
+    # Only the chunks around the insertion change
+    assert len(before - after) <= 2
+
+
+@pytest.fixture
+def dedup(memory):
+    wrapped = memory()
+    return wrapped, DedupWrapper(wrapped, CHUNKER)
+
+
+def test_put_get_shared(dedup):
+    wrapped, client = dedup
+    data = content(32 * 1024)
+    first = Object.create_file(key(client, "first"), data)
+    second = Object.create_file(key(client, "second"), data + b"tail")
+    client.put(*first)
+    stored = chunks(wrapped)
+    assert len(stored) > 1
+    client.put(*second)
+    assert stored <= chunks(wrapped)
+
+    assert client.get(first[0].key) == data
+    assert client.get(second[0].key, 100, 5000) == (data + b"tail")[100:5100]
+    assert b"".join(client.get_stream(second[0].key, chunk_size=1000)) == data + b"tail"
+    assert client.stat(first[0].key).item.content == first[0].item.content
+
+    # Shared chunks stay while the second object refers to them
+    client.remove(first[0].key)
+    assert client.get(second[0].key) == data + b"tail"
+    client.remove(second[0].key)
+    assert chunks(wrapped) == set()
+
+
+def test_overwrite(dedup):
+    wrapped, client = dedup
+    obj = Object.create_file(key(client, "file"), content(16 * 1024, 1))
+    client.put(*obj)
+    client.put(*Object.create_file(key(client, "file"), content(16 * 1024, 2)))
+    assert client.get(obj[0].key) == content(16 * 1024, 2)
+    client.remove(obj[0].key)
+    assert chunks(wrapped) == set()
+
+
+def test_batches(dedup):
+    wrapped, client = dedup
+    data = content(16 * 1024)
+    items = [Object.create_file(key(client, f"file{index}"), data) for index in range(3)]
+    client.put_many(items)
+    keys = [obj.key for obj, _ in items]
+    assert client.get_many(keys) == {item: data for item in keys}
+    listed = [str(item.path) for item in client.list(key(client, "")) if not item.path.name.startswith(".")]
+    assert listed == ["file0", "file1", "file2"]
+
+    client.remove_many(keys[:2])
+    assert client.get(keys[2]) == data
+    client.remove_many(keys[2:])
+    assert chunks(wrapped) == set()
+
+
+def test_concurrent_overwrite(dedup):
+    wrapped, client = dedup
+    target = key(client, "file")
+    client.put(*Object.create_file(target, content(16 * 1024, 0)))
+
+    def write(seed):
+        for step in range(5):
+            client.put(*Object.create_file(target, content(16 * 1024, seed * 10 + step)))
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(write, range(1, 5)))
+
+    # Only the chunks of the last manifest remain, each referenced once
+    manifest = client._manifest(target)
+    assert chunks(wrapped) == {chunk.digest for chunk in manifest.chunks}
+    assert all(client._count(chunk.digest) == 1 for chunk in manifest.chunks)
+    client.remove(target)
+    assert chunks(wrapped) == set()
@@ -0,0 +1,141 @@
+"""
+Test Reed-Solomon encoding and decoding from any subset of fragments, and objects read back after losing some
+"""
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.erasure import MUL, ReedSolomon
+from storage.wrapper import erasure
+from storage.wrapper.erasure import ErasureCodingWrapper
+from storage.wrapper.interface import StorageWrapper
+
+
+class Failing(StorageWrapper):
+    def __init__(self, wrapped):
+        super().__init__(wrapped)
+        self.outage = False
+
+    def put(self, obj, data):
+        if self.outage:
+            raise OSError("Unavailable")
+        return self.__wrapped__.put(obj, data)
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def wrapper(memory):
+    return ErasureCodingWrapper(memory(), [memory() for _ in range(4)], parity=2)
+
+
+def test_field():
+    assert all(MUL[value][1] == value for value in range(256))
+    assert MUL[0x53][0xCA] == MUL[0xCA][0x53]
+
+
+@pytest.mark.parametrize("size", [0, 1, 1000, 4097])
+def test_decode_any_subset(size):
+    code = ReedSolomon(4, 2)
+    buffer = np.random.default_rng(size).integers(0, 256, size, dtype=np.uint8).tobytes()
+    shards = code.encode(code.split(buffer))
+    assert shards.shape[0] == 6
+    for indices in combinations(range(6), 4):
+        decoded = code.decode({index: shards[index] for index in indices})
+        assert decoded.tobytes()[:size] == buffer
+
+
+def test_too_few_fragments():
+    code = ReedSolomon(3, 2)
+    shards = code.encode(code.split(b"data"))
+    with pytest.raises(ValueError):
+        code.decode({0: shards[0], 4: shards[4]})
+
+
+@pytest.mark.parametrize("size", [0, 1, 1000, 3 * 4 * 1024 + 5])
+def test_put_get(memory, monkeypatch, size):
+    monkeypatch.setattr(erasure, "FRAGMENT_BYTES", 1024)
+    client = wrapper(memory)
+    data = np.random.default_rng(size).integers(0, 256, size, dtype=np.uint8).tobytes()
+    obj, _ = Object.create_file(key(client, "file"), data)
+    client.put(obj, data)
+    assert client.get(obj.key) == data
+    assert client.get(obj.key, 4000, 5000) == data[4000:9000]
+    assert b"".join(client.get_stream(obj.key, chunk_size=700, offset=10)) == data[10:]
+
+    streamed, _ = Object.create_file(key(client, "streamed"), data)
+    client.put_stream(streamed, iter([data[:100], data[100:]]))
+    assert client.get(streamed.key) == data
+
+
+def test_lost_fragment(memory, monkeypatch):
+    monkeypatch.setattr(erasure, "FRAGMENT_BYTES", 1024)
+    client = wrapper(memory)
+    data = bytes(range(256)) * 40
+    obj, _ = Object.create_file(key(client, "file"), data)
+    client.put(obj, data)
+
+    # Both the wrapped client's fragment and a data fragment are gone, the parity makes up for them
+    for target in client.targets[:2]:
+        target.remove(key(target, "file"))
+    assert client.get(obj.key) == data
+    assert client.get(obj.key, 3000, 10) == data[3000:3010]
+    # Reading scheduled a rebuild of the lost fragments
+    client.rebuilder.submit(lambda: None).result()
+    assert all(key(target, "file") in target for target in client.targets)
+
+    for target in client.targets[3:]:
+        target.remove(key(target, "file"))
+    assert sorted(client.reconstruct(obj.key)) == [3, 4]
+    assert client.reconstruct(obj.key) == []
+    for target in client.targets[:2]:
+        target.remove(key(target, "file"))
+    assert client.get(obj.key) == data
+
+
+def test_overwrite_failed_target(memory, monkeypatch):
+    monkeypatch.setattr(erasure, "FRAGMENT_BYTES", 1024)
+    failing = Failing(memory())
+    client = ErasureCodingWrapper(memory(), [failing, *[memory() for _ in range(3)]], parity=2)
+    obj, _ = Object.create_file(key(client, "file"), b"A" * 5000)
+    client.put(obj, b"A" * 5000)
+
+    # The write reaches the quorum, the failed client keeps the fragment of the old generation
+    failing.outage = True
+    client.put(*Object.create_file(obj.key, b"B" * 5000))
+    client.rebuilder.submit(lambda: None).result()
+    assert client.get(obj.key) == b"B" * 5000
+    assert client.get(obj.key, 1000, 100) == b"B" * 100
+    assert client.get_many([obj.key]) == {obj.key: b"B" * 5000}
+
+    # Rewritten as stale once the client is back, along with any missing fragment
+    client.rebuilder.submit(lambda: None).result()
+    failing.outage = False
+    client.targets[3].remove(key(client.targets[3], "file"))
+    assert client.reconstruct(obj.key) == [1, 3]
+    assert client.reconstruct(obj.key) == []
+    for target in client.targets[3:]:
+        target.remove(key(target, "file"))
+    assert client.get(obj.key) == b"B" * 5000
+
+
+def test_batches(memory):
+    client = wrapper(memory)
+    items = [Object.create_file(key(client, f"file-{index}"), bytes([index]) * index) for index in range(5)]
+    client.put_many(items)
+    keys = [obj.key for obj, _ in items]
+    assert client.get_many(keys) == {obj.key: data for obj, data in items}
+
+    # A batch missing a fragment falls back to reading the objects one by one
+    target = client.targets[1]
+    target.remove(key(target, "file-3"))
+    assert client.get_many(keys)[keys[3]] == bytes([3]) * 3
+
+    client.remove_many(keys[:2])
+    assert not any(key in client for key in keys[:2])
+    with pytest.raises(KeyError):
+        client.remove_many(keys[:1])
@@ -0,0 +1,87 @@
+"""
+Test directory headers are served from the cache until written, changed on disk or evicted
+"""
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.client import HEADER
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def put(client, path):
+    obj, data = Object.create_file(key(client, path), path.encode())
+    client.put(obj, data)
+    return obj.key
+
+
+def counted(client, monkeypatch, during=None):
+    loads = []
+    load = client._load_header
+
+    def counting(head_key):
+        loads.append(str(head_key.path))
+        header = load(head_key)
+        if during is not None:
+            during()
+        return header
+
+    monkeypatch.setattr(client, "_load_header", counting)
+    return loads
+
+
+def test_hit(local, monkeypatch):
+    client = local()
+    file = put(client, "folder/file")
+    loads = counted(client, monkeypatch)
+    assert file in client.header(file).objects
+    assert client.header(file) is client.header(file)
+    assert loads == [f"folder/{HEADER}"]
+
+
+def test_invalidation(local, monkeypatch):
+    client = local()
+    file = put(client, "folder/file")
+    # Relying on invalidation alone, as clients without versions do
+    monkeypatch.setattr(client, "_header_version", lambda _: None)
+    loads = counted(client, monkeypatch)
+    client.header(file)
+    other = put(client, "folder/other")
+    assert other in client.header(file).objects
+    assert len(loads) == 2
+
+
+def test_race(local, monkeypatch):
+    client = local()
+    file = put(client, "folder/file")
+    # Invalidated by a write while it loads, the header may predate the write and is not kept
+    counted(client, monkeypatch, during=lambda: client._invalidate_header(file))
+    assert file in client.header(file).objects
+    assert key(client, f"folder/{HEADER}") not in client._headers
+
+
+def test_eviction(local):
+    client = local(header_cache=2)
+    files = [put(client, f"folder{index}/file") for index in range(3)]
+    for file in files:
+        client.header(file)
+    assert list(client._headers) == [key(client, f"folder{index}/{HEADER}") for index in (1, 2)]
+
+
+def test_revalidation(local, tmp_path):
+    client = local()
+    file = put(client, "folder/file")
+    folder = tmp_path / "local/folder"
+    before = {path.name: path.read_bytes() for path in folder.glob("._head*")}
+    other = put(client, "folder/other")
+    assert other in client.header(file).objects
+
+    # Header files put back as they were behind the client's back
+    for path in folder.glob("._head*"):
+        if path.name in before:
+            path.write_bytes(before[path.name])
+        else:
+            path.unlink()
+    assert other not in client.header(file).objects
+    assert file in client.header(file).objects
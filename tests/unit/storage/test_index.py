@@ -0,0 +1,30 @@
+"""
+Test the persisted index is loaded by a new wrapper rather than rebuilt, and lists what was written
+"""
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.index import IndexWrapper
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def rebuilt(self):
+    raise AssertionError("Index rebuilt rather than loaded")
+
+
+def test_reload(local, memory, monkeypatch):
+    wrapped, storage = local(), memory()
+    client = IndexWrapper(wrapped, storage)
+    assert str(client.index_root.path) == f"index/{wrapped.name.value}"
+    client.put(*Object.create_file(key(client, "a/x"), b"x"))
+    client.put(*Object.create_file(key(client, "a/y"), b"y"))
+    client.remove(key(client, "a/y"))
+    client.put(*Object.create_file(key(client, "b"), b"b"))
+
+    monkeypatch.setattr(IndexWrapper, "rebuild", rebuilt)
+    reloaded = IndexWrapper(wrapped, storage)
+    assert sorted(str(item.path) for item in reloaded.list(key(reloaded, "a"))) == ["a/x"]
+    assert "b" in {str(item.path) for item in reloaded.list(key(reloaded, ""))}
+    assert reloaded.stat(key(reloaded, "a/x")).key.path == StoragePath(path="a/x")
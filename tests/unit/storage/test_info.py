@@ -0,0 +1,33 @@
+"""
+Test incremental fingerprinting against whole-buffer content information
+"""
+from storage.models.object.file.info import Fingerprint, ObjectInfo
+from storage.models.object.models import File
+
+
+def test_fingerprint_matches_buffer():
+    chunks = [b"%PDF-1.4\n", b"x" * 4096, b"y" * 100]
+    fingerprint = Fingerprint()
+    for chunk in chunks:
+        fingerprint.update(chunk)
+    assert fingerprint.info() == ObjectInfo.from_buffer(b"".join(chunks))
+
+
+def test_create_stream():
+    chunks = [b"%PDF-1.4\n", b"x" * 4096, b"y" * 100]
+    file, stream = File.create_stream(iter(chunks))
+    assert file.content.mime_type.mime == "application/pdf"
+    assert b"".join(stream) == b"".join(chunks)
+    assert file.content == ObjectInfo.from_buffer(b"".join(chunks))
+
+
+def test_skip_fingerprint():
+    info = ObjectInfo.from_buffer(b"{}", fingerprint=False)
+    assert info.size.raw_bytes == 2
+    assert info.signature is None
+
+
+def test_create_stream_serializes():
+    file, stream = File.create_stream(iter([b"{}"]))
+    b"".join(stream)
+    assert File.from_raw(file.to_json()).content.size.raw_bytes == 2
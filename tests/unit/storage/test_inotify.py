@@ -0,0 +1,41 @@
+"""
+Test inotify reports file changes in a watched directory
+"""
+import pytest
+
+from storage.superclass.inotify import IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_ISDIR, Inotify
+
+
+@pytest.fixture
+def inotify():
+    try:
+        watcher = Inotify()
+    except OSError:
+        pytest.skip("inotify is not available")
+    yield watcher
+    watcher.close()
+
+
+def test_events(inotify, tmp_path):
+    watch = inotify.add(str(tmp_path), IN_CREATE | IN_CLOSE_WRITE | IN_DELETE)
+    (tmp_path / "file").write_bytes(b"data")
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "file").unlink()
+    events = []
+    while len(events) < 4:
+        read = inotify.read(timeout=1)
+        assert read
+        events.extend(read)
+    assert all(event.watch == watch for event in events)
+    masks = [(event.name, event.mask & ~IN_ISDIR, bool(event.mask & IN_ISDIR)) for event in events]
+    assert masks == [
+        ("file", IN_CREATE, False),
+        ("file", IN_CLOSE_WRITE, False),
+        ("folder", IN_CREATE, True),
+        ("file", IN_DELETE, False),
+    ]
+
+
+def test_timeout(inotify, tmp_path):
+    inotify.add(str(tmp_path), IN_CREATE)
+    assert inotify.read(timeout=0.01) == []
@@ -0,0 +1,48 @@
+"""
+Test the append-only journal, including recovery from a torn tail
+"""
+from datamodel.data.model import Data
+from storage.superclass.journal import Journal
+
+
+class Entry(Data):
+    value: int
+
+
+def test_append_and_replay(tmp_path):
+    journal = Journal(tmp_path / "journal.log", Entry)
+    journal.append(Entry(value=1), Entry(value=2))
+    journal.append(Entry(value=3))
+    assert [entry.value for entry in journal] == [1, 2, 3]
+
+
+def test_torn_tail(tmp_path):
+    journal = Journal(tmp_path / "journal.log", Entry)
+    journal.append(Entry(value=1))
+    with open(journal.path, "ab") as handle:
+        handle.write(b'{"value": 2')
+    assert [entry.value for entry in journal] == [1]
+
+    journal.append(Entry(value=3))
+    assert [entry.value for entry in journal] == [1, 3]
+
+
+def test_rotate(tmp_path):
+    journal = Journal(tmp_path / "journal.log", Entry)
+    journal.append(Entry(value=1))
+    rotated = journal.rotate()
+    journal.append(Entry(value=2))
+    assert [entry.value for entry in rotated] == [1]
+    assert [entry.value for entry in journal] == [2]
+    rotated.clear()
+    assert not rotated.path.exists()
+
+
+def test_replace(tmp_path):
+    journal = Journal(tmp_path / "journal.log", Entry)
+    journal.append(Entry(value=1), Entry(value=2), Entry(value=3))
+    journal.replace(Entry(value=3))
+    journal.append(Entry(value=4))
+    assert [entry.value for entry in journal] == [3, 4]
+    journal.replace()
+    assert not journal.path.exists()
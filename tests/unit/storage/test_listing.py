@@ -0,0 +1,53 @@
+"""
+Test merged listings of several clients page in walk order and resume after the last key
+"""
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.overlay import OverlayWrapper
+
+OVERLAY = ["a/x", "a.txt", "c"]
+WRAPPED = ["a/y", "a-b", "a.txt", "b/z"]
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+@pytest.fixture
+def overlay(memory):
+    wrapped, top = memory(), memory()
+    for client, paths in ((top, OVERLAY), (wrapped, WRAPPED)):
+        for path in paths:
+            client.put(*Object.create_file(key(client, path), path.encode(), fingerprint=False))
+    return OverlayWrapper(wrapped, top)
+
+
+def test_walk_order(overlay):
+    root = key(overlay, "")
+    # Storage info and lock files of the clients come first
+    assert [str(item.path) for item in overlay.walk(root) if not item.path.name.startswith(".")] == [
+        "a-b",
+        "a.txt",
+        "a",
+        "a/x",
+        "a/y",
+        "b",
+        "b/z",
+        "c",
+    ]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+@pytest.mark.parametrize("recursive", [False, True])
+def test_pages(overlay, limit, recursive):
+    root = key(overlay, "")
+    listed, token = [], None
+    while True:
+        keys, token = overlay.list_page(root, recursive=recursive, token=token, limit=limit)
+        assert len(keys) <= limit
+        listed.extend(keys)
+        if token is None:
+            break
+    assert listed == list(overlay.walk(root, depth=None if recursive else 0))
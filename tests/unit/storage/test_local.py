@@ -0,0 +1,70 @@
+"""
+Test the local client keeps its directory headers, across clients of the same root and compaction, and its views
+"""
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def test_put_stat_list(local):
+    client = local()
+    obj, data = Object.create_file(key(client, "folder/file.txt"), b"data")
+    client.put(obj, data)
+    assert client.stat(obj.key) == obj
+    assert obj.key in client
+    assert key(client, "folder/other.txt") not in client
+    assert client.list(key(client, "folder")) == [obj.key]
+    assert client.get(obj.key) == b"data"
+
+    client.remove(obj.key)
+    assert obj.key not in client
+    assert client.list(key(client, "folder")) == []
+
+
+def test_reopen(local):
+    client = local()
+    obj, data = Object.create_file(key(client, "file.txt"), b"data")
+    client.put(obj, data)
+    client.unlock()
+
+    reopened = local()
+    assert reopened.name == client.name
+    assert reopened.stat(key(reopened, "file.txt")) == obj
+
+
+def test_compact(local):
+    client = local()
+    objects = [Object.create_file(key(client, f"folder/{index:03d}"), b"data")[0] for index in range(20)]
+    for obj in objects:
+        client.put(obj, b"data")
+    client._compact(StoragePath(path="folder"))
+    client.remove(objects[0].key)
+
+    # Read back from the compacted snapshot by a client of the same root
+    client.unlock()
+    reopened = local()
+    assert reopened.stat(objects[1].key) == objects[1]
+    assert objects[0].key not in reopened
+    assert len(reopened.list(key(reopened, "folder"))) == 19
+
+
+def test_view(local):
+    client = local()
+    file = key(client, "folder/file")
+    client.put(*Object.create_file(file, b"0123456789"))
+    view = client.view(file)
+    assert isinstance(view, memoryview)
+    assert view == b"0123456789"
+    assert client.view(file, 2, 3) == b"234"
+    assert client.view(file, 8, 10) == b"89"
+    # Views past the end are empty, as reads are
+    assert client.view(file, 20) == b"" == client.get(file, 20)
+
+    empty = key(client, "folder/empty")
+    client.put(*Object.create_file(empty, b""))
+    assert client.view(empty) == b""
+    assert client.view(empty, 5, 5) == b""
+    view.release()
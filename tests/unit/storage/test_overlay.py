@@ -0,0 +1,86 @@
+"""
+Test overlay membership is answered by its filter, which is rebuilt without blocking writes
+"""
+from threading import Event, Thread
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.interface import StorageWrapper
+from storage.wrapper.overlay import OverlayWrapper
+
+
+class Counted(StorageWrapper):
+    def __init__(self, wrapped):
+        super().__init__(wrapped)
+        self.lookups = 0
+
+    def __contains__(self, key):
+        self.lookups += 1
+        return key in self.__wrapped__
+
+
+class Listing(StorageWrapper):
+    def __init__(self, wrapped, listing, release):
+        super().__init__(wrapped)
+        self.listing = listing
+        self.release = release
+
+    def walk(self, prefix, depth=None, start_after=None):
+        self.listing.set()
+        self.release.wait(10)
+        return self.__wrapped__.walk(prefix, depth, start_after)
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def test_miss(memory):
+    wrapped, top = memory(), Counted(memory())
+    client = OverlayWrapper(wrapped, top)
+    wrapped.put(*Object.create_file(key(wrapped, "below"), b"below"))
+    client.put(*Object.create_file(key(client, "above"), b"above"))
+    top.lookups = 0
+    # Keys never written to the overlay are looked up below without asking it
+    assert client.get(key(client, "below")) == b"below"
+    assert key(client, "missing") not in client
+    assert top.lookups == 0
+    assert client.get(key(client, "above")) == b"above"
+    assert top.lookups == 1
+
+
+def test_put_during_rebuild(memory):
+    listing, release = Event(), Event()
+    release.set()
+    client = OverlayWrapper(memory(), Listing(memory(), listing, release))
+    client.put(*Object.create_file(key(client, "first"), b"first"))
+    client.remove(key(client, "first"))
+    client.put(*Object.create_file(key(client, "second"), b"second"))
+    client.remove(key(client, "second"))
+
+    # Removed paths make the filter stale, the next lookup rebuilds it while a put goes ahead
+    listing.clear()
+    release.clear()
+    rebuild = Thread(target=client._filter)
+    rebuild.start()
+    assert listing.wait(5)
+    put = Thread(target=client.put, args=Object.create_file(key(client, "during"), b"during"))
+    put.start()
+    put.join(2)
+    assert not put.is_alive()
+    release.set()
+    rebuild.join()
+    assert client.filter_removed == 0
+    assert client.get(key(client, "during")) == b"during"
+
+
+def test_remove(memory):
+    wrapped, top = memory(), memory()
+    client = OverlayWrapper(wrapped, top)
+    wrapped.put(*Object.create_file(key(wrapped, "file"), b"below"))
+    client.put(*Object.create_file(key(client, "file"), b"above"))
+    client.remove(key(client, "file"))
+    # The overlay copy goes first, the wrapped one shows through until removed as well
+    assert client.get(key(client, "file")) == b"below"
+    client.remove(key(client, "file"))
+    assert key(client, "file") not in client
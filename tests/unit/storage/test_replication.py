@@ -0,0 +1,147 @@
+"""
+Test writes return once a quorum of targets has them, and reads only go to targets the writes reached
+"""
+import time
+from threading import Event, Semaphore, Thread
+
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.compression import CompressionPolicy
+from storage.models.wrapper.replication import ReplicationMode
+from storage.wrapper.compression import CompressionWrapper
+from storage.wrapper.interface import StorageWrapper
+from storage.wrapper.replication import ReplicationWrapper
+
+
+class Unavailable(StorageWrapper):
+    def put(self, obj, data):
+        raise OSError("Unavailable")
+
+
+class Slow(StorageWrapper):
+    def __init__(self, wrapped, release):
+        super().__init__(wrapped)
+        self.release = release
+
+    def put(self, obj, data):
+        self.release.wait(5)
+        return self.__wrapped__.put(obj, data)
+
+
+class Gated(StorageWrapper):
+    def __init__(self, wrapped, gate):
+        super().__init__(wrapped)
+        self.gate = gate
+
+    def put_many(self, items):
+        self.gate.acquire(timeout=5)
+        return self.__wrapped__.put_many(items)
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def test_quorum(memory):
+    primary, replica, down = memory(), memory(), memory()
+    client = ReplicationWrapper(primary, [replica, Unavailable(down)], quorum=2)
+    obj, data = Object.create_file(key(client, "file"), b"data")
+    client.put(obj, data)
+    assert client.get(obj.key) == b"data"
+    # Join the workers, the failed target is tracked for repair once its write returned
+    client.replicators[2].submit(lambda: None).result()
+    assert client.repairs[2] == {"file"}
+
+    strict = ReplicationWrapper(memory(), [memory(), Unavailable(memory())])
+    with pytest.raises(RuntimeError):
+        strict.put(*Object.create_file(key(strict, "file"), b"data"))
+
+
+def test_read_after_write(memory):
+    release = Event()
+    primary, first, second = memory(), memory(), memory()
+    client = ReplicationWrapper(Slow(primary, release), [first, second], quorum=2)
+    obj, data = Object.create_file(key(client, "file"), b"old")
+    release.set()
+    client.put(obj, data)
+    client.replicators[0].submit(lambda: None).result()
+
+    # Primary is behind, reads go to a replica that has the write until it catches up
+    release.clear()
+    client.put(*Object.create_file(obj.key, b"new"))
+    assert client.get(obj.key) == b"new"
+    assert primary.get(key(primary, "file")) == b"old"
+    release.set()
+    client.replicators[0].submit(lambda: None).result()
+    assert client._source(obj.key)[0] is client.targets[0]
+    assert client.get(obj.key) == b"new"
+
+
+def settle(client, condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_shipping(memory, tmp_path):
+    primary, replica = memory(), memory()
+    client = ReplicationWrapper(primary, replica, mode=ReplicationMode.ASYNCHRONOUS, log=tmp_path)
+    items = [Object.create_file(key(client, f"file{index}"), f"data{index}".encode()) for index in range(3)]
+    client.put_many(items)
+    client.remove(items[0][0].key)
+    settle(client, lambda: not any(lag.operations for lag in client.lag()))
+    assert key(replica, "file0") not in replica
+    assert replica.get(key(replica, "file1")) == b"data1"
+    assert list(client.changes) == []
+
+
+def test_compression(memory, tmp_path):
+    primary, replica = memory(), memory()
+    with pytest.raises(ValueError):
+        ReplicationWrapper(primary, replica, compression=CompressionPolicy())
+    client = ReplicationWrapper(
+        primary, replica, mode=ReplicationMode.ASYNCHRONOUS, log=tmp_path, compression=CompressionPolicy()
+    )
+    data = b"data" * 1024
+    client.put(*Object.create_file(key(client, "file"), data))
+    settle(client, lambda: not any(lag.operations for lag in client.lag()))
+    # Stored compressed on the replica, read back through a compression wrapper
+    assert len(replica.get(key(replica, "file"))) < len(data)
+    assert CompressionWrapper(replica).get(key(replica, "file")) == data
+    assert primary.get(key(primary, "file")) == data
+
+
+def test_write_ahead(memory, tmp_path):
+    release = Event()
+    primary, replica = memory(), memory()
+    client = ReplicationWrapper(Slow(primary, release), replica, mode=ReplicationMode.ASYNCHRONOUS, log=tmp_path)
+    obj, data = Object.create_file(key(client, "file"), b"data")
+    writer = Thread(target=client.put, args=(obj, data))
+    writer.start()
+    # Logged before the write, but only shipped once the write is done
+    settle(client, lambda: [str(change.path) for change in client.changes] == ["file"])
+    assert client.cursors == [0]
+    release.set()
+    writer.join()
+    settle(client, lambda: client.cursors == [1])
+    assert replica.get(key(replica, "file")) == b"data"
+
+
+def test_truncation(memory, tmp_path):
+    gate = Semaphore(1)
+    primary, fast, slow = memory(), memory(), memory()
+    client = ReplicationWrapper(
+        primary, [fast, Gated(slow, gate)], mode=ReplicationMode.ASYNCHRONOUS, log=tmp_path, batch=1
+    )
+    for index in range(3):
+        client.put(*Object.create_file(key(client, f"file{index}"), b"data"))
+    # Log keeps what the replica furthest behind has yet to receive
+    settle(client, lambda: client.cursors == [3, 1])
+    assert [change.sequence for change in client.changes] == [2, 3]
+    gate.release()
+    gate.release()
+    settle(client, lambda: client.cursors == [3, 3])
+    assert list(client.changes) == []
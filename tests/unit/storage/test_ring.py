@@ -0,0 +1,37 @@
+"""
+Test placement on the consistent hashing ring
+"""
+from collections import Counter
+
+from storage.superclass.ring import HashRing
+
+PATHS = [f"folder/{index}.bin" for index in range(2000)]
+
+
+def test_balanced():
+    ring = HashRing({"a": 1.0, "b": 1.0, "c": 1.0})
+    counts = Counter(ring.owner(path) for path in PATHS)
+    assert set(counts) == {"a", "b", "c"}
+    assert min(counts.values()) > len(PATHS) / 3 * 0.7
+
+
+def test_adding_moves_only_to_new_node():
+    ring = HashRing({"a": 1.0, "b": 1.0})
+    grown = ring.with_node("c")
+    moved = [path for path in PATHS if ring.owner(path) != grown.owner(path)]
+    assert moved
+    assert all(grown.owner(path) == "c" for path in moved)
+
+
+def test_removing_moves_only_from_removed_node():
+    ring = HashRing({"a": 1.0, "b": 1.0, "c": 1.0})
+    shrunk = ring.without_node("b")
+    for path in PATHS:
+        if ring.owner(path) != "b":
+            assert shrunk.owner(path) == ring.owner(path)
+
+
+def test_weights():
+    ring = HashRing({"a": 3.0, "b": 1.0})
+    counts = Counter(ring.owner(path) for path in PATHS)
+    assert counts["a"] > 2 * counts["b"]
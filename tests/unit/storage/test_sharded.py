@@ -0,0 +1,73 @@
+"""
+Test keys stay readable while shards are added and removed, and end up only on their owners
+"""
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.interface import StorageWrapper
+from storage.wrapper.sharded import ShardedWrapper
+
+PATHS = [f"folder{index % 3}/file{index}" for index in range(60)]
+
+
+class Unreadable(StorageWrapper):
+    def stat(self, key):
+        raise OSError("Unreadable")
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def stored(client):
+    return {
+        str(item.path) for item in client.walk(key(client, "")) if item in client and item.path not in client.RESERVED
+    }
+
+
+@pytest.fixture
+def sharded(memory):
+    client = ShardedWrapper(memory(), [memory()], rate=None)
+    client.put_many([Object.create_file(key(client, path), path.encode()) for path in PATHS])
+    return client
+
+
+def check(client):
+    assert client.get_many([key(client, path) for path in PATHS]) == {
+        key(client, path): path.encode() for path in PATHS
+    }
+    placed = [stored(shard) for shard in client.shards.values()]
+    assert sorted(path for paths in placed for path in paths) == sorted(PATHS)
+    for name, paths in zip(client.shards, placed):
+        assert all(client.ring.owner(path) == name for path in paths)
+
+
+def test_add_shard(sharded, memory):
+    shard = memory()
+    sharded.add_shard(shard)
+    sharded.wait_migration(timeout=5)
+    assert sharded.previous is None
+    assert stored(shard)
+    check(sharded)
+    # Storage info of every shard stays with it
+    assert all(shard.info.uuid == shard.uuid for shard in sharded.shards.values())
+
+
+def test_remove_shard(sharded):
+    shard = list(sharded.shards.values())[1]
+    sharded.remove_shard(shard)
+    sharded.wait_migration(timeout=5)
+    assert str(shard.name) not in sharded.shards
+    assert stored(shard) == set()
+    check(sharded)
+
+
+def test_failed_migration(sharded, memory):
+    shard = list(sharded.shards.values())[1]
+    sharded.shards[str(shard.name)] = Unreadable(shard)
+    sharded.add_shard(memory())
+    with pytest.raises(RuntimeError):
+        sharded.wait_migration(timeout=5)
+    # Reads fall back to the previous owner of keys not moved
+    assert sharded.get(key(sharded, PATHS[0])) == PATHS[0].encode()
@@ -0,0 +1,25 @@
+"""
+Test usage is counted per write and removal, and written into the storage info when flushed or unlocked
+"""
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def test_usage(local):
+    client = local()
+    client.put(*Object.create_file(key(client, "file"), b"data"))
+    client.put(*Object.create_file(key(client, "file"), b"longer data"))
+    client.put(*Object.create_file(key(client, "other"), b"other"))
+    client.remove(key(client, "other"))
+    assert client.used_bytes == 11
+    assert (client.info.objects, client.info.used_bytes) == (1, 11)
+
+    # Usage not flushed yet is written when unlocking
+    client.unlock()
+    reopened = local()
+    assert (reopened.info.objects, reopened.info.used_bytes) == (1, 11)
+    assert reopened.recount() == reopened.info
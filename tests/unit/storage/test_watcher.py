@@ -0,0 +1,96 @@
+"""
+Test files changed under the root of a local client other than through it are reconciled into its headers
+"""
+import shutil
+import time
+
+import pytest
+
+from storage.models.header.models import HeaderOperation
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.superclass.inotify import IN_Q_OVERFLOW, InotifyEvent
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def settle(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_reconcile(local, tmp_path):
+    client = local(watch=True, polling=True, interval=0.05)
+    observed = []
+    client.observe(observed.extend)
+    client.put(*Object.create_file(key(client, "own"), b"own"))
+    root = tmp_path / "local"
+
+    (root / "folder").mkdir()
+    (root / "folder/outside").write_bytes(b"data")
+    settle(lambda: key(client, "folder/outside") in client)
+    assert client.stat(key(client, "folder/outside")).item.content.size.raw_bytes == 4
+    assert client._usage_objects == 2
+
+    time.sleep(0.01)
+    (root / "folder/outside").write_bytes(b"more data")
+    settle(lambda: client.stat(key(client, "folder/outside")).item.content.size.raw_bytes == 9)
+    assert (client._usage_objects, client._usage_bytes) == (2, 12)
+
+    (root / "folder/outside").unlink()
+    settle(lambda: key(client, "folder/outside") not in client)
+    assert (client._usage_objects, client._usage_bytes) == (1, 3)
+    # Writes through the client itself are not reported as found
+    assert [str(entry.key.path) for entry in observed] == ["folder/outside"] * 3
+
+
+def test_unlock(local):
+    client = local(watch=True, polling=True, interval=0.05)
+    watcher = client.watcher
+    client.unlock()
+    assert not watcher.thread.is_alive()
+    assert client.watcher is None
+
+
+def test_directory_moved_out(local, tmp_path):
+    client = local(watch=True, debounce=0.05)
+    if client.watcher.inotify is None:
+        pytest.skip("inotify is not available")
+    observed = []
+    client.observe(observed.extend)
+    root = tmp_path / "local"
+    (root / "folder/inner").mkdir(parents=True)
+    (root / "folder/inner/file").write_bytes(b"data")
+    settle(lambda: key(client, "folder/inner/file") in client)
+
+    # Its header leaves along with it, the file is still reported removed
+    (root / "folder").rename(tmp_path / "moved")
+    settle(lambda: len(observed) == 2)
+    assert observed[1].operation == HeaderOperation.REMOVE
+    assert str(observed[1].key.path) == "folder/inner/file"
+    assert (client._usage_objects, client._usage_bytes) == (0, 0)
+
+
+def test_overflow(local, tmp_path):
+    client = local(watch=True, debounce=0.05)
+    watcher = client.watcher
+    if watcher.inotify is None:
+        pytest.skip("inotify is not available")
+    root = tmp_path / "local"
+    (root / "folder").mkdir()
+    (root / "folder/file").write_bytes(b"data")
+    (root / "kept").write_bytes(b"kept")
+    settle(lambda: key(client, "folder/file") in client and key(client, "kept") in client)
+    # Events are left unread, as when the queue overflowed
+    watcher.stopped.set()
+    watcher.thread.join()
+
+    shutil.rmtree(root / "folder")
+    changed = watcher._changed(InotifyEvent(watch=-1, mask=IN_Q_OVERFLOW, name=""))
+    assert changed == ["folder/file", "kept"]
+    watcher._reconcile(changed)
+    assert (client._usage_objects, client._usage_bytes) == (1, 4)
@@ -0,0 +1,140 @@
+"""
+Test subscribers are called for matching changes, coalesced and held back by a full queue, and the change feed
+"""
+from threading import Event, Thread
+
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.wrapper.watching import WatchingWrapper
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def put(client, path):
+    client.put(*Object.create_file(key(client, path), path.encode()))
+
+
+@pytest.fixture
+def watching(memory):
+    made = []
+
+    def make(**kwargs) -> WatchingWrapper:
+        made.append(WatchingWrapper(memory(), **kwargs))
+        return made[-1]
+
+    yield make
+    for client in made:
+        client.close(timeout=5)
+
+
+def blocking(called, entered, release):
+    def callback(item):
+        called.append(str(item.path))
+        entered.set()
+        release.wait(5)
+
+    return callback
+
+
+def test_matching(watching):
+    client = watching()
+    prefix, glob, exact = [], [], []
+    client.watch_prefix(key(client, "a"), lambda item: prefix.append(str(item.path)))
+    client.watch_glob("*.txt", lambda item: glob.append(str(item.path)))
+    subscription = client.watch(key(client, "b"), lambda item: exact.append(str(item.path)))
+    for path in ["a", "a/x", "ab", "c/d.txt", "b"]:
+        put(client, path)
+    client.drain(5)
+    assert sorted(prefix) == ["a", "a/x"]
+    assert glob == ["c/d.txt"]
+    assert exact == ["b"]
+
+    client.unwatch(subscription)
+    put(client, "b")
+    client.drain(5)
+    assert exact == ["b"]
+    with pytest.raises(KeyError):
+        client.unwatch(subscription)
+
+
+def test_coalescing(watching):
+    client = watching(workers=1)
+    called, entered, release = [], Event(), Event()
+    client.watch_prefix(key(client, ""), blocking(called, entered, release))
+    put(client, "busy")
+    assert entered.wait(5)
+    # The only worker is busy, repeated writes wait as one change
+    for _ in range(3):
+        put(client, "file")
+    release.set()
+    client.drain(5)
+    assert called == ["busy", "file"]
+
+
+def test_backpressure(watching):
+    client = watching(workers=1, depth=1)
+    called, entered, release = [], Event(), Event()
+    client.watch_prefix(key(client, ""), blocking(called, entered, release))
+    put(client, "busy")
+    assert entered.wait(5)
+    put(client, "waiting")
+    writer = Thread(target=put, args=(client, "held"))
+    writer.start()
+    writer.join(0.2)
+    assert writer.is_alive()
+    # Coalescing into the waiting change goes ahead
+    put(client, "waiting")
+    release.set()
+    writer.join(5)
+    assert not writer.is_alive()
+    client.drain(5)
+    assert called == ["busy", "waiting", "held"]
+
+
+def test_subscriber_writes(watching):
+    client = watching(workers=1, depth=1)
+    called = []
+
+    def copy(item):
+        called.append(str(item.path))
+        put(client, f"copies/{item.path}")
+        put(client, f"copies/{item.path}.again")
+
+    client.watch_prefix(key(client, "files"), copy)
+    client.watch_prefix(key(client, "copies"), lambda item: called.append(str(item.path)))
+    put(client, "files/file")
+    # The worker is not held back by the changes it queues itself
+    client.drain(5)
+    assert sorted(called) == ["copies/files/file", "copies/files/file.again", "files/file"]
+
+
+def test_feed(watching):
+    client = watching(retention=3)
+    assert client.changes(0, timeout=0.01) == ([], 0)
+    for index in range(5):
+        put(client, f"file-{index}")
+    with pytest.raises(ValueError):
+        client.changes(0)
+    events, cursor = client.changes(2, limit=2)
+    assert [str(event.key.path) for event in events] == ["file-2", "file-3"]
+    events, cursor = client.changes(cursor)
+    assert [str(event.key.path) for event in events] == ["file-4"]
+    assert client.changes(cursor) == ([], 5)
+
+
+def test_close(watching):
+    client = watching()
+    called = []
+    client.watch(key(client, "file"), lambda item: called.append(str(item.path)))
+    put(client, "file")
+    client.close(timeout=5)
+    assert called == ["file"]
+    assert not any(dispatcher.is_alive() for dispatcher in client.dispatchers)
+    # Changes after closing are still in the feed
+    put(client, "file")
+    assert client.changes(1)[1] == 2
+    assert called == ["file"]
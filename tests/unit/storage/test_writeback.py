@@ -0,0 +1,134 @@
+"""
+Test staged writes are read back at once, coalesced, retried and flushed, also after restarting from staging
+"""
+import pytest
+
+from storage.models.object.models import Object
+from storage.models.object.path import StorageKey, StoragePath
+from storage.models.wrapper.writeback import StagedWrite
+from storage.wrapper import writeback
+from storage.wrapper.interface import StorageWrapper
+from storage.wrapper.writeback import STAGING, WriteBackWrapper
+
+
+class Failing(StorageWrapper):
+    def __init__(self, wrapped, outages):
+        super().__init__(wrapped)
+        self.outages = outages
+
+    def put_stream(self, obj, stream):
+        if self.outages:
+            self.outages -= 1
+            raise OSError("Unavailable")
+        return self.__wrapped__.put_stream(obj, stream)
+
+
+def key(client, path):
+    return StorageKey(storage=client.name, path=StoragePath(path=path))
+
+
+def staged(staging):
+    return list(staging.walk(key(staging, STAGING)))
+
+
+@pytest.fixture
+def clients(memory, monkeypatch):
+    monkeypatch.setattr(writeback, "RETRY_DELAY", 0.01)
+    return memory(), memory()
+
+
+def test_put_flush(clients):
+    wrapped, staging = clients
+    client = WriteBackWrapper(wrapped, staging)
+    obj, data = Object.create_file(key(client, "file"), b"first")
+    client.put(obj, data)
+    client.put(*Object.create_file(obj.key, b"second"))
+    assert client.get(obj.key) == b"second"
+    assert obj.key in client
+    client.flush(timeout=5)
+    assert wrapped.get(obj.key) == b"second"
+    assert staged(staging) == []
+
+    client.remove(obj.key)
+    assert obj.key not in client
+    with pytest.raises(KeyError):
+        client.get(obj.key)
+    client.flush(timeout=5)
+    assert obj.key not in wrapped
+
+
+def test_batches(clients):
+    wrapped, staging = clients
+    client = WriteBackWrapper(wrapped, staging)
+    items = [Object.create_file(key(client, f"file{index}"), f"data{index}".encode()) for index in range(3)]
+    wrapped.put(*items[0])
+    client.put_many(items[1:])
+    keys = [obj.key for obj, _ in items]
+    assert client.get_many(keys) == {obj.key: data for obj, data in items}
+    client.remove_many(keys[:2])
+    client.flush(timeout=5)
+    assert [item for item in keys if item in wrapped] == keys[2:]
+    assert staged(staging) == []
+
+
+def test_retry(clients):
+    wrapped, staging = clients
+    client = WriteBackWrapper(Failing(wrapped, 2), staging)
+    obj, data = Object.create_file(key(client, "file"), b"data")
+    client.put(obj, data)
+    client.flush(timeout=5)
+    assert client.failures == 2
+    assert wrapped.get(obj.key) == b"data"
+
+
+def test_recover(clients, monkeypatch):
+    wrapped, staging = clients
+    monkeypatch.setattr(writeback, "RETRY_DELAY", 60)
+    client = WriteBackWrapper(Failing(wrapped, 1000), staging)
+    for data in (b"old", b"new"):
+        client.put(*Object.create_file(key(client, "file"), data))
+    client.put(*Object.create_file(key(client, "other"), b"other"))
+    # Stopped once its flushes failed, its retries are far off
+    client.flusher.shutdown()
+    sequence = client.sequence
+
+    # Staged records are read back from the staging client, sequences continue after theirs
+    recovered = WriteBackWrapper(wrapped, staging)
+    assert recovered.sequence == sequence
+    assert recovered.get(key(wrapped, "file")) == b"new"
+    recovered.flush(timeout=5)
+    assert wrapped.get(key(wrapped, "file")) == b"new"
+    assert wrapped.get(key(wrapped, "other")) == b"other"
+    assert staged(staging) == []
+
+
+def test_flushed_while_read(clients):
+    wrapped, staging = clients
+    client = WriteBackWrapper(wrapped, staging)
+    obj, data = Object.create_file(key(client, "file"), b"data")
+    client.put(obj, data)
+    write = client._pending(obj.key)
+    client.flush(timeout=5)
+    # Looked up before the flush discarded the staged copy, read after it
+    client._pending = lambda _: write
+    assert client.get(obj.key) == b"data"
+    assert b"".join(client.get_stream(obj.key)) == b"data"
+    assert client.get_many([obj.key]) == {obj.key: b"data"}
+
+
+def test_recover_superseded(clients):
+    wrapped, staging = clients
+    # Stopped after staging a newer write to the key and before discarding the older one
+    file = key(wrapped, "file")
+    for sequence, data in enumerate((b"old", b"new"), 1):
+        write = StagedWrite(key=file, name=f"write{sequence}", sequence=sequence, obj=Object.create_file(file, data)[0])
+        copy = Object(key=key(staging, f"{STAGING}/{write.name}"), metadata=write.obj.metadata, item=write.obj.item)
+        record = Object.create_file(key(staging, f"{STAGING}/{write.name}.json"), write.to_json().encode())
+        staging.put_many([(copy, data), record])
+    staging.put(*Object.create_file(key(staging, f"{STAGING}/unrecorded"), b"unrecorded"))
+
+    recovered = WriteBackWrapper(wrapped, staging)
+    assert recovered.sequence == 2
+    recovered.flush(timeout=5)
+    assert wrapped.get(file) == b"new"
+    assert staged(staging) == []